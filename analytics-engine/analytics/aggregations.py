@@ -6,7 +6,13 @@ Made by Hammad Naeem
 """
 
 import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
 from database.connection import db
+from analytics.sketches import HyperLogLog, QuantileSketch
 
 logger = logging.getLogger(__name__)
 
@@ -15,14 +21,25 @@ class DataAggregations:
     """Handles data aggregation for analytics"""
     
     @staticmethod
-    def aggregate_hourly_stats():
-        """Aggregate hourly statistics"""
+    def _upsert_per_shard(rows_by_shard, query, columns):
+        """Write rows read from each shard back to that shard's primary"""
+        for shard, rows in rows_by_shard.items():
+            if not rows:
+                continue
+            with db.get_cursor(shard=shard) as cursor:
+                execute_values(cursor, query, [tuple(row[column] for column in columns) for row in rows])
+    
+    @staticmethod
+    def aggregate_hourly_stats(day=None):
+        """
+        Aggregate hourly statistics for a day, today by default (each shard
+        aggregates its own sales).
+        
+        The aggregating SELECT is read-only and may run on a replica; the
+        upsert goes to the primary.
+        """
         try:
-            db.execute_query("""
-                INSERT INTO sales_hourly_stats (
-                    website_id, shop_id, stat_date, stat_hour,
-                    total_sales, total_revenue, total_items_sold, average_order_value
-                )
+            rows_by_shard = db.scatter_query("""
                 SELECT 
                     s.website_id,
                     s.shop_id,
@@ -30,12 +47,25 @@ class DataAggregations:
                     EXTRACT(HOUR FROM s.sale_date)::INTEGER as stat_hour,
                     COUNT(*)::INTEGER as total_sales,
                     SUM(s.total_amount) as total_revenue,
-                    COALESCE(SUM(si.quantity), 0)::INTEGER as total_items_sold,
+                    COALESCE(SUM(si.items), 0)::INTEGER as total_items_sold,
                     AVG(s.total_amount) as average_order_value
                 FROM sales s
-                LEFT JOIN sale_items si ON s.id = si.sale_id
-                WHERE s.sale_date::DATE = CURRENT_DATE
+                LEFT JOIN LATERAL (
+                    SELECT SUM(quantity) as items
+                    FROM sale_items
+                    WHERE sale_id = s.id
+                ) si ON true
+                WHERE s.sale_date >= COALESCE(%s::DATE, CURRENT_DATE)
+                AND s.sale_date < COALESCE(%s::DATE, CURRENT_DATE) + 1
                 GROUP BY s.website_id, s.shop_id, s.sale_date::DATE, EXTRACT(HOUR FROM s.sale_date)
+            """, (day, day), readonly=True)
+            
+            DataAggregations._upsert_per_shard(rows_by_shard, """
+                INSERT INTO sales_hourly_stats (
+                    website_id, shop_id, stat_date, stat_hour,
+                    total_sales, total_revenue, total_items_sold, average_order_value
+                )
+                VALUES %s
                 ON CONFLICT (website_id, shop_id, stat_date, stat_hour)
                 DO UPDATE SET
                     total_sales = EXCLUDED.total_sales,
@@ -43,35 +73,47 @@ class DataAggregations:
                     total_items_sold = EXCLUDED.total_items_sold,
                     average_order_value = EXCLUDED.average_order_value,
                     updated_at = CURRENT_TIMESTAMP
-            """, fetch=False)
+            """, ('website_id', 'shop_id', 'stat_date', 'stat_hour',
+                  'total_sales', 'total_revenue', 'total_items_sold', 'average_order_value'))
             
             logger.info("Hourly stats aggregated successfully")
+            return True
             
         except Exception as e:
             logger.error(f"Failed to aggregate hourly stats: {e}")
+            return False
     
     @staticmethod
-    def aggregate_daily_stats():
-        """Aggregate daily statistics"""
+    def aggregate_daily_stats(day=None):
+        """Aggregate daily statistics for a day, today by default (read like the hourly stats)"""
         try:
-            db.execute_query("""
-                INSERT INTO sales_daily_stats (
-                    website_id, stat_date,
-                    total_sales, total_revenue, total_items_sold,
-                    unique_customers, average_order_value
-                )
+            rows_by_shard = db.scatter_query("""
                 SELECT 
                     s.website_id,
                     s.sale_date::DATE as stat_date,
                     COUNT(*)::INTEGER as total_sales,
                     SUM(s.total_amount) as total_revenue,
-                    COALESCE(SUM(si.quantity), 0)::INTEGER as total_items_sold,
+                    COALESCE(SUM(si.items), 0)::INTEGER as total_items_sold,
                     COUNT(DISTINCT s.customer_id)::INTEGER as unique_customers,
                     AVG(s.total_amount) as average_order_value
                 FROM sales s
-                LEFT JOIN sale_items si ON s.id = si.sale_id
-                WHERE s.sale_date::DATE = CURRENT_DATE
+                LEFT JOIN LATERAL (
+                    SELECT SUM(quantity) as items
+                    FROM sale_items
+                    WHERE sale_id = s.id
+                ) si ON true
+                WHERE s.sale_date >= COALESCE(%s::DATE, CURRENT_DATE)
+                AND s.sale_date < COALESCE(%s::DATE, CURRENT_DATE) + 1
                 GROUP BY s.website_id, s.sale_date::DATE
+            """, (day, day), readonly=True)
+            
+            DataAggregations._upsert_per_shard(rows_by_shard, """
+                INSERT INTO sales_daily_stats (
+                    website_id, stat_date,
+                    total_sales, total_revenue, total_items_sold,
+                    unique_customers, average_order_value
+                )
+                VALUES %s
                 ON CONFLICT (website_id, stat_date)
                 DO UPDATE SET
                     total_sales = EXCLUDED.total_sales,
@@ -80,18 +122,242 @@ class DataAggregations:
                     unique_customers = EXCLUDED.unique_customers,
                     average_order_value = EXCLUDED.average_order_value,
                     updated_at = CURRENT_TIMESTAMP
-            """, fetch=False)
+            """, ('website_id', 'stat_date', 'total_sales', 'total_revenue',
+                  'total_items_sold', 'unique_customers', 'average_order_value'))
             
             logger.info("Daily stats aggregated successfully")
+            return True
             
         except Exception as e:
             logger.error(f"Failed to aggregate daily stats: {e}")
+            return False
+    
+    @staticmethod
+    def rebuild_stats(since=None):
+        """
+        Recompute hourly and daily stats and the hourly sketches from sales
+        for every day from `since` (default: the oldest sale in the
+        database) through today.
+        
+        Stats aggregated before items were summed per sale counted every
+        sale once per line item, and sketches were only built from their
+        deploy onward; run this once after upgrading
+        (python main.py --rebuild-stats). Days whose sales were archived
+        keep their rows, and hourly rows recreated for days retention has
+        already downsampled are removed again by its next run.
+        Returns (days rebuilt, days that failed).
+        """
+        oldest = [
+            rows[0]['oldest']
+            for rows in db.scatter_query("SELECT MIN(sale_date)::DATE as oldest FROM sales").values()
+            if rows[0]['oldest'] is not None
+        ]
+        if not oldest:
+            return 0, 0
+        
+        today = db.execute_query("SELECT CURRENT_DATE as today")[0]['today']
+        day = since or min(oldest)
+        rebuilt = failed = 0
+        while day <= today:
+            if (DataAggregations.aggregate_hourly_stats(day)
+                    and DataAggregations.aggregate_daily_stats(day)
+                    and DataAggregations.aggregate_hourly_sketches(day)):
+                rebuilt += 1
+            else:
+                failed += 1
+            day += timedelta(days=1)
+        
+        logger.info(f"Stats rebuilt from sales for {rebuilt} days ({failed} failed)")
+        return rebuilt, failed
+    
+    @staticmethod
+    def aggregate_hourly_sketches(day=None):
+        """Build customer HyperLogLog and order value sketches for a day's hourly buckets, today by default"""
+        try:
+            rows_by_shard = db.scatter_query("""
+                SELECT 
+                    website_id,
+                    shop_id,
+                    sale_date::DATE as stat_date,
+                    EXTRACT(HOUR FROM sale_date)::INTEGER as stat_hour,
+                    customer_id,
+                    total_amount
+                FROM sales
+                WHERE sale_date >= COALESCE(%s::DATE, CURRENT_DATE)
+                AND sale_date < COALESCE(%s::DATE, CURRENT_DATE) + 1
+            """, (day, day), readonly=True)
+            
+            total = 0
+            for shard, rows in rows_by_shard.items():
+                total += DataAggregations._store_hourly_sketches(rows, shard)
+            
+            logger.info(f"Hourly sketches aggregated successfully ({total} buckets)")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to aggregate hourly sketches: {e}")
+            return False
+    
+    @staticmethod
+    def _store_hourly_sketches(rows, shard):
+        """Build and upsert the sketches for one shard's sales, returning the bucket count"""
+        buckets = defaultdict(lambda: ([], []))
+        for row in rows:
+            key = (row['website_id'], row['shop_id'], row['stat_date'], row['stat_hour'])
+            customers, order_values = buckets[key]
+            customers.append(row['customer_id'])
+            order_values.append(row['total_amount'])
+        
+        if not buckets:
+            return 0
+        
+        values = [
+            key + (
+                HyperLogLog().add_many(customers).to_bytes(),
+                QuantileSketch().add_many(order_values).to_bytes()
+            )
+            for key, (customers, order_values) in buckets.items()
+        ]
+        
+        with db.get_cursor(shard=shard) as cursor:
+            execute_values(cursor, """
+                INSERT INTO sales_hourly_sketches (
+                    website_id, shop_id, stat_date, stat_hour,
+                    customers_hll, order_values_sketch
+                )
+                VALUES %s
+                ON CONFLICT (website_id, shop_id, stat_date, stat_hour)
+                DO UPDATE SET
+                    customers_hll = EXCLUDED.customers_hll,
+                    order_values_sketch = EXCLUDED.order_values_sketch,
+                    updated_at = CURRENT_TIMESTAMP
+            """, values)
+        return len(values)
+    
+    @staticmethod
+    def _merged_sketches(start_date, end_date, website_id=None):
+        """
+        Merge the hourly sketches for stat_date in [start_date, end_date].
+        
+        One website is read from its own shard; otherwise every shard's
+        sketches are merged, which is exact for both sketch types.
+        """
+        query = """
+            SELECT customers_hll, order_values_sketch
+            FROM sales_hourly_sketches
+            WHERE stat_date BETWEEN %s AND %s
+            AND (%s IS NULL OR website_id = %s)
+        """
+        params = (start_date, end_date, website_id, website_id)
+        if website_id is not None:
+            rows = db.execute_query(query, params, shard=db.shard_for(website_id), readonly=True)
+        else:
+            rows = [row for shard_rows in db.scatter_query(query, params, readonly=True).values() for row in shard_rows]
+        
+        customers = HyperLogLog()
+        order_values = QuantileSketch()
+        for row in rows:
+            customers.merge(HyperLogLog.from_bytes(row['customers_hll']))
+            order_values.merge(QuantileSketch.from_bytes(row['order_values_sketch']))
+        return customers, order_values
+    
+    @staticmethod
+    def get_unique_customers(start_date, end_date, website_id=None):
+        """Estimate distinct customers for a date range from the hourly sketches"""
+        try:
+            customers, _ = DataAggregations._merged_sketches(start_date, end_date, website_id)
+            return customers.count()
+        except Exception as e:
+            logger.error(f"Failed to get unique customers: {e}")
+            return None
+    
+    @staticmethod
+    def get_order_value_percentiles(start_date, end_date, percentiles=(0.5, 0.95), website_id=None):
+        """Estimate order value percentiles for a date range from the hourly sketches"""
+        try:
+            _, order_values = DataAggregations._merged_sketches(start_date, end_date, website_id)
+            return {q: order_values.quantile(q) for q in percentiles}
+        except Exception as e:
+            logger.error(f"Failed to get order value percentiles: {e}")
+            return {}
+    
+    @staticmethod
+    def reconcile_customer_stats(chunk_size=500):
+        """
+        Rebuild customers.total_orders/total_spent from sales (plus the
+        totals of sales archived by retention) where they drifted.
+        
+        Works through customers in id chunks. Each chunk locks its customer
+        rows first, so sales whose customer stats are still being applied
+        (by the trigger or a batch UPDATE) are neither missed nor counted twice.
+        The lock is NO KEY UPDATE, like those UPDATEs take: FOR UPDATE would
+        also block the key-share locks of concurrent sale inserts.
+        With sharding, each shard's customer copy is rebuilt from its own sales.
+        """
+        try:
+            fixed = 0
+            for shard in db.shard_names:
+                fixed += DataAggregations._reconcile_shard_customer_stats(shard, chunk_size)
+            
+            if fixed:
+                logger.warning(f"Customer stats reconciled: {fixed} customers had drifted")
+            else:
+                logger.info("Customer stats reconciled: no drift")
+            return fixed
+            
+        except Exception as e:
+            logger.error(f"Failed to reconcile customer stats: {e}")
+            return None
+    
+    @staticmethod
+    def _reconcile_shard_customer_stats(shard, chunk_size):
+        """Reconcile one shard's customers, returning how many had drifted"""
+        bounds = db.execute_query(
+            "SELECT MIN(id) as min_id, MAX(id) as max_id FROM customers", shard=shard
+        )[0]
+        if bounds['min_id'] is None:
+            return 0
+        
+        fixed = 0
+        for start in range(bounds['min_id'], bounds['max_id'] + 1, chunk_size):
+            end = start + chunk_size - 1
+            with db.get_cursor(shard=shard) as cursor:
+                cursor.execute("""
+                    SELECT id FROM customers
+                    WHERE id BETWEEN %s AND %s
+                    ORDER BY id
+                    FOR NO KEY UPDATE
+                """, (start, end))
+                cursor.execute("""
+                    UPDATE customers c
+                    SET 
+                        total_orders = a.total_orders,
+                        total_spent = a.total_spent,
+                        updated_at = CURRENT_TIMESTAMP
+                    FROM (
+                        SELECT 
+                            c2.id,
+                            (COUNT(s.id) + COALESCE(MAX(t.total_orders), 0))::INTEGER as total_orders,
+                            COALESCE(SUM(s.total_amount), 0) + COALESCE(MAX(t.total_spent), 0) as total_spent
+                        FROM customers c2
+                        LEFT JOIN customer_archived_totals t ON t.customer_id = c2.id
+                        LEFT JOIN sales s ON s.customer_id = c2.id
+                        WHERE c2.id BETWEEN %s AND %s
+                        GROUP BY c2.id
+                    ) a
+                    WHERE c.id = a.id
+                    AND (c.total_orders IS DISTINCT FROM a.total_orders
+                         OR c.total_spent IS DISTINCT FROM a.total_spent)
+                """, (start, end))
+                fixed += cursor.rowcount
+        return fixed
     
     @staticmethod
     def get_top_products(limit=10, days=30):
-        """Get top selling products"""
+        """Get top selling products (merged across shards)"""
         try:
-            return db.execute_query("""
+            # Shards return every product they sold so the merged ranking is exact
+            rows_by_shard = db.scatter_query("""
                 SELECT 
                     p.id,
                     p.sku,
@@ -105,7 +371,19 @@ class DataAggregations:
                 GROUP BY p.id, p.sku, p.name
                 ORDER BY total_sold DESC
                 LIMIT %s
-            """, (days, limit))
+            """, (days, None if db.is_sharded else limit), readonly=True)
+            
+            merged = {}
+            for rows in rows_by_shard.values():
+                for row in rows:
+                    product = merged.get(row['id'])
+                    if product is None:
+                        merged[row['id']] = dict(row)
+                    else:
+                        product['total_sold'] += row['total_sold']
+                        product['total_revenue'] += row['total_revenue']
+            
+            return sorted(merged.values(), key=lambda p: p['total_sold'], reverse=True)[:limit]
         except Exception as e:
             logger.error(f"Failed to get top products: {e}")
             return []
@@ -0,0 +1,462 @@
+"""
+============================================
+Columnar Snapshot Store
+Made by Hammad Naeem
+============================================
+
+Append-only copy of closed days of sales and sale_items on local disk, laid
+out for vectorized analysis without touching the database:
+
+    <COLUMNAR_STORE_DIR>/manifest.json
+    <COLUMNAR_STORE_DIR>/<table>/<YYYY-MM-DD>/<column>.npy
+
+Every column of a day partition is a plain NumPy .npy file, memory-mapped
+at query time so scans and group-bys run on the page cache with no copies
+and no per-row Python objects.
+
+- sale_time is the local wall-clock time of the sale (datetime64[s]), the
+  same clock stat_date/stat_hour use; virtual keys date, month, year, hour
+  and weekday (Monday = 0) are derived from it
+- ids are int32 with -1 for NULL; amounts are float64
+- payment_method and order_status are uint8 codes into the manifest's
+  append-only category lists
+- sale_items rows carry their sale's time, website and shop so they can be
+  grouped without a join
+
+Days are exported once, after they close; sales written later for a day
+that was already exported are not picked up.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import time
+import logging
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from psycopg2.extensions import cursor as TupleCursor
+
+from config.settings import settings
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+# table -> (column, dtype) in export order; the SELECTs below return them in this order
+TABLES = {
+    'sales': [
+        ('sale_time', 'datetime64[s]'),
+        ('website_id', 'int32'),
+        ('shop_id', 'int32'),
+        ('customer_id', 'int32'),
+        ('subtotal', 'float64'),
+        ('tax_amount', 'float64'),
+        ('discount_amount', 'float64'),
+        ('total_amount', 'float64'),
+        ('payment_method', 'uint8'),
+        ('order_status', 'uint8'),
+    ],
+    'sale_items': [
+        ('sale_time', 'datetime64[s]'),
+        ('website_id', 'int32'),
+        ('shop_id', 'int32'),
+        ('product_id', 'int32'),
+        ('quantity', 'int32'),
+        ('unit_price', 'float64'),
+        ('line_total', 'float64'),
+    ],
+}
+
+CATEGORICAL = ('payment_method', 'order_status')
+
+# Rows gathered from partitions before they are grouped together
+CHUNK_ROWS = 2_000_000
+
+EXPORT_QUERIES = {
+    'sales': """
+        SELECT
+            FLOOR(EXTRACT(EPOCH FROM sale_date::TIMESTAMP))::BIGINT,
+            COALESCE(website_id, -1),
+            COALESCE(shop_id, -1),
+            COALESCE(customer_id, -1),
+            subtotal::FLOAT8,
+            COALESCE(tax_amount, 0)::FLOAT8,
+            COALESCE(discount_amount, 0)::FLOAT8,
+            total_amount::FLOAT8,
+            COALESCE(payment_method, ''),
+            COALESCE(order_status, '')
+        FROM sales
+        WHERE sale_date >= %(day)s::DATE AND sale_date < %(day)s::DATE + 1
+    """,
+    'sale_items': """
+        SELECT
+            FLOOR(EXTRACT(EPOCH FROM s.sale_date::TIMESTAMP))::BIGINT,
+            COALESCE(s.website_id, -1),
+            COALESCE(s.shop_id, -1),
+            COALESCE(si.product_id, -1),
+            si.quantity,
+            si.unit_price::FLOAT8,
+            si.line_total::FLOAT8
+        FROM sale_items si
+        JOIN sales s ON s.id = si.sale_id
+        WHERE s.sale_date >= %(day)s::DATE AND s.sale_date < %(day)s::DATE + 1
+    """,
+}
+
+# Keys derived from sale_time: name -> function(sale_time array) -> int64 array
+VIRTUAL_KEYS = {
+    'date': lambda t: t.astype('datetime64[D]').astype(np.int64),
+    'month': lambda t: t.astype('datetime64[M]').astype(np.int64),
+    'year': lambda t: t.astype('datetime64[Y]').astype(np.int64) + 1970,
+    'hour': lambda t: (t.astype(np.int64) // 3600) % 24,
+    # 1970-01-01 was a Thursday
+    'weekday': lambda t: (t.astype('datetime64[D]').astype(np.int64) + 3) % 7,
+}
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ColumnarStore:
+    """Exports closed days to .npy column partitions and queries them"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        # Exported partitions never change, so their .npy headers are parsed once
+        self._headers = {}  # (table, day, column) -> (dtype, count, data offset)
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+
+    @property
+    def manifest_path(self):
+        return self.root / 'manifest.json'
+
+    def manifest(self):
+        """The current manifest (an empty one before the first export)"""
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {
+                'version': MANIFEST_VERSION,
+                'tables': {table: dict(columns) for table, columns in TABLES.items()},
+                'categories': {name: [] for name in CATEGORICAL},
+                'partitions': {}
+            }
+
+    def _write_manifest(self, manifest):
+        """Replace the manifest atomically"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        _fsync_path(self.root)
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _fetch_day(table, day):
+        """One day of a table from every shard, as a list of tuples"""
+        rows = []
+        for shard in db.shard_names:
+            with db.get_cursor(shard=shard, readonly=True, cursor_factory=TupleCursor) as cursor:
+                cursor.execute(EXPORT_QUERIES[table], {'day': day})
+                rows.extend(cursor.fetchall())
+        return rows
+
+    @staticmethod
+    def _encode(values, categories):
+        """Codes for categorical values, appending unseen ones to the category list"""
+        codes = {value: code for code, value in enumerate(categories)}
+        for value in values:
+            if value not in codes:
+                if len(categories) >= 255:
+                    raise ValueError(f"Too many categories (max 255): {value!r}")
+                codes[value] = len(categories)
+                categories.append(value)
+        return np.array([codes[value] for value in values], dtype=np.uint8)
+
+    def _write_partition(self, table, day, rows, categories):
+        """Write a day's columns to a temporary directory, then move it into place"""
+        table_dir = self.root / table
+        table_dir.mkdir(parents=True, exist_ok=True)
+        final_dir = table_dir / day
+        tmp_dir = table_dir / f'.{day}.tmp'
+        for stale in (tmp_dir, final_dir):
+            # Left behind by an export that stopped before updating the manifest
+            if stale.exists():
+                shutil.rmtree(stale)
+        tmp_dir.mkdir()
+
+        columns = list(zip(*rows)) if rows else [()] * len(TABLES[table])
+        for (name, dtype), values in zip(TABLES[table], columns):
+            if name in CATEGORICAL:
+                array = self._encode(values, categories[name])
+            elif dtype.startswith('datetime64'):
+                array = np.array(values, dtype=np.int64).astype(dtype)
+            else:
+                array = np.array(values, dtype=dtype)
+            path = tmp_dir / f'{name}.npy'
+            np.save(path, array)
+            _fsync_path(path)
+
+        os.replace(tmp_dir, final_dir)
+        _fsync_path(table_dir)
+
+    def _first_day_to_export(self, manifest):
+        """Day after the last exported one, or the oldest sale's day"""
+        if manifest['partitions']:
+            return date.fromisoformat(max(manifest['partitions'])) + timedelta(days=1)
+        oldest = [
+            rows[0]['oldest']
+            for rows in db.scatter_query("SELECT MIN(sale_date)::DATE as oldest FROM sales", readonly=True).values()
+            if rows[0]['oldest'] is not None
+        ]
+        return min(oldest) if oldest else None
+
+    def export(self, until=None):
+        """
+        Export every closed day not in the store yet, oldest first.
+
+        until: last day to export (default yesterday). Returns the days exported.
+        """
+        until = until or date.today() - timedelta(days=1)
+        manifest = self.manifest()
+        day = self._first_day_to_export(manifest)
+        exported = []
+
+        while day is not None and day <= until:
+            try:
+                start = time.perf_counter()
+                day_key = day.isoformat()
+                counts = {}
+                for table in TABLES:
+                    rows = self._fetch_day(table, day)
+                    self._write_partition(table, day_key, rows, manifest['categories'])
+                    counts[table] = len(rows)
+
+                manifest['partitions'][day_key] = {
+                    'rows': counts,
+                    'exported_at': datetime.now().astimezone().isoformat()
+                }
+                self._write_manifest(manifest)
+                exported.append(day_key)
+                logger.info(f"Exported {day_key} to the columnar store ({counts['sales']} sales, "
+                            f"{counts['sale_items']} items in {time.perf_counter() - start:.2f}s)")
+            except Exception as e:
+                logger.error(f"Failed to export {day} to the columnar store: {e}")
+                break
+            day += timedelta(days=1)
+
+        return exported
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def partitions(self, start=None, end=None):
+        """Exported days in [start, end), oldest first"""
+        days = sorted(self.manifest()['partitions'])
+        if start is not None:
+            days = [d for d in days if d >= str(start)]
+        if end is not None:
+            days = [d for d in days if d < str(end)]
+        return days
+
+    def scan(self, table, columns=None, start=None, end=None):
+        """
+        Yield (day, {column: memory-mapped array}) for each partition in [start, end).
+
+        Arrays are read-only views of the files; nothing is copied until used.
+        """
+        if table not in TABLES:
+            raise ValueError(f"Unknown table '{table}', expected one of {tuple(TABLES)}")
+        columns = columns or [name for name, _ in TABLES[table]]
+        for day in self.partitions(start, end):
+            yield day, {name: self._column(table, day, name) for name in columns}
+
+    def _column(self, table, day, name):
+        """Memory-map one column file (the map is released with the array)"""
+        path = self.root / table / day / f'{name}.npy'
+        with open(path, 'rb') as f:
+            header = self._headers.get((table, day, name))
+            if header is None:
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+                header = self._headers[(table, day, name)] = (dtype, shape[0], f.tell())
+            dtype, count, offset = header
+            if count == 0:
+                return np.empty(0, dtype=dtype)
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+
+    def load(self, table, columns=None, start=None, end=None):
+        """Columns concatenated across partitions in [start, end) (copies the data)"""
+        parts = [arrays for _, arrays in self.scan(table, columns, start, end)]
+        columns = columns or [name for name, _ in TABLES[table]]
+        dtypes = dict(TABLES[table])
+        return {
+            name: np.concatenate([p[name] for p in parts]) if parts else np.empty(0, dtype=dtypes[name])
+            for name in columns
+        }
+
+    @staticmethod
+    def _key(arrays, name):
+        if name in VIRTUAL_KEYS:
+            return VIRTUAL_KEYS[name](arrays['sale_time'])
+        return arrays[name].astype(np.int64)
+
+    @staticmethod
+    def _encode_key(name, value):
+        """Key value for a filter, accepting what _decode_key returns (e.g. '2024-03-01', '2024-03')"""
+        if name == 'date':
+            return np.datetime64(value, 'D').astype(np.int64).item()
+        if name == 'month':
+            return np.datetime64(value, 'M').astype(np.int64).item()
+        return value
+
+    @staticmethod
+    def _decode_key(name, value, categories):
+        if name == 'date':
+            return str(np.datetime64(int(value), 'D'))
+        if name == 'month':
+            return str(np.datetime64(int(value), 'M'))
+        if name in CATEGORICAL:
+            return categories[name][int(value)]
+        return int(value)
+
+    def _mask(self, arrays, where, categories):
+        """Boolean mask for {column: value or collection of values}"""
+        mask = None
+        for name, wanted in where.items():
+            if not isinstance(wanted, (list, tuple, set, frozenset)):
+                wanted = [wanted]
+            if name in CATEGORICAL:
+                wanted = [categories[name].index(v) for v in wanted if v in categories[name]]
+            else:
+                wanted = [self._encode_key(name, v) for v in wanted]
+            condition = np.isin(self._key(arrays, name), list(wanted))
+            mask = condition if mask is None else mask & condition
+        return mask
+
+    def aggregate(self, table, by=(), values=(), start=None, end=None, where=None):
+        """
+        Vectorized group-by over the partitions in [start, end).
+
+        by:     grouping columns, including the virtual keys date, month,
+                year, hour and weekday
+        values: numeric columns to sum per group
+        where:  {column: value or collection of values} filters; dates and
+                months as returned ('2024-03-01', '2024-03') or as dates
+
+        Returns one dict per group, sorted by key, with the keys, 'rows' and
+        the sum of each value column.
+        """
+        by, values, where = list(by), list(values), where or {}
+        categories = self.manifest()['categories']
+        needed = set(values) | {n for n in list(by) + list(where) if n not in VIRTUAL_KEYS}
+        if any(n in VIRTUAL_KEYS for n in list(by) + list(where)):
+            needed.add('sale_time')
+
+        # Partitions are concatenated up to CHUNK_ROWS rows and reduced
+        # together; the per-chunk groups are reduced again at the end
+        partials, pending, pending_rows = [], [], 0
+        for _, arrays in self.scan(table, sorted(needed), start, end):
+            mask = self._mask(arrays, where, categories) if where else None
+            columns = [self._key(arrays, name) for name in by]
+            columns += [np.asarray(arrays[name], dtype=np.float64) for name in values]
+            if mask is not None:
+                columns = [column[mask] for column in columns]
+            if columns:
+                rows = len(columns[0])
+            elif mask is not None:
+                rows = int(mask.sum())
+            else:
+                rows = len(next(iter(arrays.values())))
+            if rows == 0:
+                continue
+            pending.append((columns, rows))
+            pending_rows += rows
+            if pending_rows >= CHUNK_ROWS:
+                partials.append(self._reduce_pending(pending, len(by)))
+                pending, pending_rows = [], 0
+        if pending:
+            partials.append(self._reduce_pending(pending, len(by)))
+        if not partials:
+            return []
+
+        keys = [np.concatenate([p[0][i] for p in partials]) for i in range(len(by))]
+        counts = np.concatenate([p[1] for p in partials])
+        sums = [np.concatenate([p[2][i] for p in partials]) for i in range(len(values))]
+        keys, counts, sums = self._reduce(keys, counts, sums)
+
+        order = np.lexsort(keys[::-1]) if keys else np.arange(len(counts))
+        results = []
+        for index in order.tolist():
+            row = {name: self._decode_key(name, key[index], categories) for name, key in zip(by, keys)}
+            row['rows'] = int(counts[index])
+            row.update({name: round(float(total[index]), 2) for name, total in zip(values, sums)})
+            results.append(row)
+        return results
+
+    def _reduce_pending(self, pending, key_count):
+        """Reduce a chunk of (columns, rows) partition slices"""
+        columns = [np.concatenate([c[i] for c, _ in pending]) for i in range(len(pending[0][0]))]
+        counts = np.ones(sum(rows for _, rows in pending), dtype=np.float64)
+        return self._reduce(columns[:key_count], counts, columns[key_count:])
+
+    @staticmethod
+    def _reduce(keys, counts, sums):
+        """Sum counts and value columns per distinct key combination"""
+        if not keys:
+            return [], np.array([counts.sum()]), [np.array([s.sum()]) for s in sums]
+
+        # Number the distinct values of each key and combine them mixed-radix
+        uniques, inverses, radix = [], [], 1
+        for key in keys:
+            unique, inverse = np.unique(key, return_inverse=True)
+            uniques.append(unique)
+            inverses.append(inverse.reshape(-1))
+            radix *= len(unique)
+        if radix < 2 ** 62:
+            code = np.zeros(len(counts), dtype=np.int64)
+            for unique, inverse in zip(uniques, inverses):
+                code = code * len(unique) + inverse
+            groups, inverse = np.unique(code, return_inverse=True)
+            group_keys, rest = [], groups
+            for unique in reversed(uniques):
+                group_keys.append(unique[rest % len(unique)])
+                rest = rest // len(unique)
+            group_keys.reverse()
+        else:
+            groups, inverse = np.unique(np.stack(keys, axis=1), axis=0, return_inverse=True)
+            group_keys = [groups[:, i] for i in range(len(keys))]
+        inverse = inverse.reshape(-1)
+
+        size = len(group_keys[0])
+        counts = np.bincount(inverse, weights=counts, minlength=size)
+        sums = [np.bincount(inverse, weights=s, minlength=size) for s in sums]
+        return group_keys, counts, sums
+
+
+# Global store instance
+columnar_store = ColumnarStore(settings.COLUMNAR_STORE_DIR)
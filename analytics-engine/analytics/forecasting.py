@@ -0,0 +1,422 @@
+"""
+============================================
+Sales Forecasting Module
+Made by Hammad Naeem
+============================================
+
+Projects sales, revenue and items sold per website and stores them in
+sales_forecasts on the default database, one row per website and horizon,
+so the backend serves a forecast with a primary-key lookup:
+
+- 'next_day':  the next 24 hours, by hour
+- 'next_week': the next 7 days after today, by day
+
+Every website x metric series is modelled at once with NumPy arrays:
+
+- Daily totals (sales_daily_stats) follow an additive Holt-Winters model
+  with a weekly season, in error-correction form. Smoothing parameters are
+  picked per series from a small grid, every grid point fitted in the same
+  pass.
+- Hours are that day's forecast times the hour's share of its weekday,
+  from the last FORECAST_PROFILE_DAYS of sales_hourly_stats (hour of day x
+  weekday profile).
+
+Refreshes are incremental: each run reads only the hours closed since the
+previous one and advances the daily models by the days closed since, with
+the fitted parameters. Parameters are searched again every
+FORECAST_REFIT_HOURS or when the set of websites changes.
+
+Bands are 95% prediction intervals from the one-step errors of the daily
+model and the spread of each hour around its profile share.
+"""
+
+import json
+import math
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from itertools import product
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from config.settings import settings
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('total_sales', 'total_revenue', 'total_items_sold')
+HORIZONS = ('next_day', 'next_week')
+
+SEASON = 7
+HOURS_PER_WEEK = SEASON * 24
+CONFIDENCE = 0.95
+Z = 1.96
+
+# (alpha, beta, gamma) candidates; beta <= alpha and gamma <= 1 - alpha keep the models stable
+PARAMETER_GRID = np.array([
+    (alpha, beta, gamma)
+    for alpha, beta, gamma in product((0.05, 0.1, 0.2, 0.35, 0.5, 0.75), (0.0, 0.01, 0.05), (0.0, 0.05, 0.15, 0.3))
+    if beta <= alpha and gamma <= 1 - alpha
+])
+
+
+def holt_winters(y, weekdays, alpha, beta, gamma, state=None):
+    """
+    Run additive Holt-Winters (ETS(A,A,A)) over daily series.
+
+    y: (n, T) observations; weekdays: (T,) weekday of each column;
+    alpha/beta/gamma: arrays broadcasting against (..., n), e.g. (P, 1)
+    to fit P grid points at once. state: (level, trend, season) to continue
+    from, otherwise initialized from the first weeks of y.
+
+    Returns (level, trend, season, sse, count); season is indexed by weekday.
+    """
+    n, days = y.shape
+    shape = np.broadcast_shapes(np.shape(alpha), (n,))
+    if state is None:
+        first = y[:, :SEASON].mean(axis=1) if days else np.zeros(n)
+        level = np.broadcast_to(first, shape).copy()
+        if days >= 2 * SEASON:
+            trend = np.broadcast_to((y[:, SEASON:2 * SEASON].mean(axis=1) - first) / SEASON, shape).copy()
+            season = np.zeros(shape + (SEASON,))
+            season[..., weekdays[:SEASON]] = np.broadcast_to((y[:, :SEASON] - first[:, None]), shape + (SEASON,))
+        else:
+            trend = np.zeros(shape)
+            season = np.zeros(shape + (SEASON,))
+        # The first week only initializes the model; errors count after it
+        warmup = SEASON if days >= 2 * SEASON else 1
+    else:
+        level, trend, season = (np.broadcast_to(part, shape + part.shape[len(shape):]).copy() for part in state)
+        warmup = 0
+
+    sse = np.zeros(shape)
+    for t in range(days):
+        weekday = weekdays[t]
+        error = y[:, t] - (level + trend + season[..., weekday])
+        if t >= warmup:
+            sse += error * error
+        level = level + trend + alpha * error
+        trend = trend + beta * error
+        season[..., weekday] += gamma * error
+    return level, trend, season, sse, max(days - warmup, 0)
+
+
+def _interval_factors(alpha, beta, gamma, horizon):
+    """sqrt of the h-step forecast variance over the one-step variance, for h = 1..horizon"""
+    steps = np.arange(1, horizon)
+    c = alpha[..., None] + steps * beta[..., None] + gamma[..., None] * (steps % SEASON == 0)
+    cumulative = np.concatenate([np.zeros(alpha.shape + (1,)), np.cumsum(c * c, axis=-1)], axis=-1)
+    return np.sqrt(1 + cumulative)
+
+
+class SalesForecaster:
+    """Incrementally refit seasonal forecasts for every website"""
+
+    def __init__(self, history_days=56, profile_days=28, refit_hours=24):
+        self.history_days = history_days
+        # The hourly profile covers whole weeks so every slot has the same number of observations
+        self.profile_weeks = max(1, math.ceil(profile_days / SEASON))
+        self.refit_interval = timedelta(hours=refit_hours)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.websites = None  # website ids, one row block per website
+        self.fitted_at = None
+        self._params = None  # (alpha, beta, gamma), each (n,)
+        self._state = None  # (level, trend, season)
+        self._sse = None
+        self._errors = 0
+        self._last_day = None  # last closed day the daily models have seen
+        self._hours = None  # (n, profile hours) ending before _hours_end
+        self._hours_end = None
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _series(self, rows, columns, column_of):
+        """(n, columns) array of METRICS per website, series ordered website-major"""
+        position = {website_id: i for i, website_id in enumerate(self.websites)}
+        values = np.zeros((len(self.websites), len(METRICS), columns))
+        for row in rows:
+            i = position.get(row['website_id'])
+            column = column_of(row)
+            if i is None or not 0 <= column < columns:
+                continue
+            for m, metric in enumerate(METRICS):
+                values[i, m, column] = float(row[metric] or 0)
+        return values.reshape(len(self.websites) * len(METRICS), columns)
+
+    def _load_days(self, first, last):
+        """Daily totals for first..last inclusive, as (n, days)"""
+        days = (last - first).days + 1
+        if days <= 0:
+            return np.zeros((len(self.websites) * len(METRICS), 0))
+        rows_by_shard = db.scatter_query("""
+            SELECT website_id, stat_date, total_sales, total_revenue, total_items_sold
+            FROM sales_daily_stats
+            WHERE stat_date BETWEEN %s AND %s
+        """, (first, last), readonly=True)
+        rows = [row for shard_rows in rows_by_shard.values() for row in shard_rows]
+        return self._series(rows, days, lambda row: (row['stat_date'] - first).days)
+
+    def _load_hours(self, start, end):
+        """Hourly totals over all shops for [start, end), as (n, hours)"""
+        hours = int((end - start).total_seconds() // 3600)
+        if hours <= 0:
+            return np.zeros((len(self.websites) * len(METRICS), 0))
+        rows_by_shard = db.scatter_query("""
+            SELECT
+                website_id, stat_date, stat_hour,
+                SUM(total_sales) as total_sales,
+                SUM(total_revenue) as total_revenue,
+                SUM(total_items_sold) as total_items_sold
+            FROM sales_hourly_stats
+            WHERE (stat_date, stat_hour) >= (%s, %s)
+            AND (stat_date, stat_hour) < (%s, %s)
+            GROUP BY website_id, stat_date, stat_hour
+        """, (start.date(), start.hour, end.date(), end.hour), readonly=True)
+        rows = [row for shard_rows in rows_by_shard.values() for row in shard_rows]
+
+        def column(row):
+            hour_start = datetime.combine(row['stat_date'], datetime.min.time()) + timedelta(hours=row['stat_hour'])
+            return int((hour_start - start).total_seconds() // 3600)
+
+        return self._series(rows, hours, column)
+
+    @staticmethod
+    def _weekdays(first, days):
+        return (first.weekday() + np.arange(days)) % SEASON
+
+    # ------------------------------------------------------------------
+    # Fitting
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _website_ids():
+        return [row['id'] for row in db.execute_query("SELECT id FROM websites ORDER BY id")]
+
+    def fit(self, now=None, websites=None):
+        """Search the smoothing parameters and fit every series from scratch"""
+        now = now or datetime.now()
+        current_hour = now.replace(minute=0, second=0, microsecond=0)
+        yesterday = now.date() - timedelta(days=1)
+
+        websites = self._website_ids() if websites is None else websites
+        self._reset()
+        self.websites = websites
+
+        first = yesterday - timedelta(days=self.history_days - 1)
+        y = self._load_days(first, yesterday)
+        weekdays = self._weekdays(first, y.shape[1])
+
+        # Every grid point for every series in one pass, then the best point per series
+        alpha, beta, gamma = (PARAMETER_GRID[:, column][:, None] for column in range(3))
+        *_, sse, _ = holt_winters(y, weekdays, alpha, beta, gamma)
+        best = np.argmin(sse, axis=0)
+        self._params = tuple(PARAMETER_GRID[best, column] for column in range(3))
+        level, trend, season, self._sse, self._errors = holt_winters(y, weekdays, *self._params)
+        self._state = (level, trend, season)
+        self._last_day = yesterday
+
+        self._hours_end = current_hour
+        self._hours = self._load_hours(current_hour - timedelta(hours=self.profile_weeks * HOURS_PER_WEEK), current_hour)
+        self.fitted_at = now
+        logger.info(f"Forecast models fitted for {len(websites)} websites "
+                    f"({y.shape[1]} days, {len(PARAMETER_GRID)} parameter sets)")
+
+    def update(self, now=None):
+        """Advance the models with the days and hours closed since the last update"""
+        now = now or datetime.now()
+        current_hour = now.replace(minute=0, second=0, microsecond=0)
+        yesterday = now.date() - timedelta(days=1)
+
+        if yesterday > self._last_day:
+            first = self._last_day + timedelta(days=1)
+            y = self._load_days(first, yesterday)
+            level, trend, season, sse, count = holt_winters(
+                y, self._weekdays(first, y.shape[1]), *self._params, state=self._state
+            )
+            self._state = (level, trend, season)
+            self._sse = self._sse + sse
+            self._errors += count
+            self._last_day = yesterday
+
+        closed = int((current_hour - self._hours_end).total_seconds() // 3600)
+        if closed > 0:
+            new = self._load_hours(max(self._hours_end, current_hour - timedelta(hours=self._hours.shape[1])),
+                                   current_hour)
+            self._hours = np.concatenate([self._hours[:, new.shape[1]:], new], axis=1)
+            self._hours_end = current_hour
+
+    # ------------------------------------------------------------------
+    # Projection
+    # ------------------------------------------------------------------
+
+    def _hour_profile(self):
+        """Share of its weekday's total and error spread of every hour slot, each (n, 7, 24)"""
+        n, hours = self._hours.shape
+        weeks = hours // HOURS_PER_WEEK
+        start = self._hours_end - timedelta(hours=hours)
+        first_slot = start.weekday() * 24 + start.hour
+        # Week-sized chunks, then rolled so index [w * 24 + h] is weekday w, hour h
+        by_week = np.roll(self._hours.reshape(n, weeks, HOURS_PER_WEEK), first_slot, axis=-1)
+        by_week = by_week.reshape(n, weeks, SEASON, 24)
+
+        day_totals = by_week.sum(axis=-1)  # (n, weeks, 7)
+        slot_sums = by_week.sum(axis=1)
+        weekday_sums = slot_sums.sum(axis=-1, keepdims=True)
+        share = np.divide(slot_sums, weekday_sums, out=np.full_like(slot_sums, 1 / 24), where=weekday_sums > 0)
+
+        residuals = by_week - share[:, None] * day_totals[..., None]
+        spread = np.sqrt((residuals ** 2).mean(axis=1))
+        return share, spread
+
+    def _daily_forecast(self, horizon):
+        """Forecast and one-step-scaled standard deviation for days 1..horizon after the last closed day"""
+        level, trend, season = self._state
+        steps = np.arange(1, horizon + 1)
+        weekdays = (self._last_day.weekday() + steps) % SEASON
+        forecast = level[:, None] + steps * trend[:, None] + season[:, weekdays]
+        sigma = np.sqrt(self._sse / max(self._errors, 1))
+        std = sigma[:, None] * _interval_factors(*self._params, horizon)
+        return forecast, std
+
+    def project(self):
+        """Forecast arrays: hourly (24 hours from now) and daily (7 days after today)"""
+        hour_starts = [self._hours_end + timedelta(hours=i) for i in range(24)]
+        day_offsets = np.array([(start.date() - self._last_day).days for start in hour_starts])
+        horizon = max(int(day_offsets.max()), 1 + SEASON)
+        daily, daily_std = self._daily_forecast(horizon)
+        daily = np.maximum(daily, 0)
+
+        share, spread = self._hour_profile()
+        weekdays = np.array([start.weekday() for start in hour_starts])
+        hours_of_day = np.array([start.hour for start in hour_starts])
+        hour_share = share[:, weekdays, hours_of_day]
+        hourly = hour_share * daily[:, day_offsets - 1]
+        hourly_std = np.sqrt((hour_share * daily_std[:, day_offsets - 1]) ** 2
+                             + spread[:, weekdays, hours_of_day] ** 2)
+
+        # Days in the 24 hours are forecast independently; hours of a day share its error
+        hourly_total_var = (spread[:, weekdays, hours_of_day] ** 2).sum(axis=1)
+        for offset in np.unique(day_offsets):
+            in_day = day_offsets == offset
+            hourly_total_var += (hour_share[:, in_day].sum(axis=1) * daily_std[:, offset - 1]) ** 2
+
+        week = slice(1, 1 + SEASON)  # tomorrow onwards
+        return {
+            'next_day': {
+                'starts': hour_starts,
+                'forecast': hourly,
+                'std': hourly_std,
+                'total': hourly.sum(axis=1),
+                'total_std': np.sqrt(hourly_total_var)
+            },
+            'next_week': {
+                'starts': [self._last_day + timedelta(days=int(step)) for step in range(2, 2 + SEASON)],
+                'forecast': daily[:, week],
+                'std': daily_std[:, week],
+                'total': daily[:, week].sum(axis=1),
+                'total_std': np.sqrt((daily_std[:, week] ** 2).sum(axis=1))
+            }
+        }
+
+    @staticmethod
+    def _band(forecast, std):
+        return {
+            'forecast': round(float(forecast), 2),
+            'lower': round(float(max(forecast - Z * std, 0)), 2),
+            'upper': round(float(forecast + Z * std), 2)
+        }
+
+    def build_payloads(self, projection):
+        """Forecast payload per (website_id, horizon)"""
+        metrics = len(METRICS)
+        sigma = np.sqrt(self._sse / max(self._errors, 1))
+        payloads = {}
+        for w, website_id in enumerate(self.websites):
+            rows = slice(w * metrics, (w + 1) * metrics)
+            model = {
+                metric: {
+                    'alpha': float(self._params[0][rows][m]),
+                    'beta': float(self._params[1][rows][m]),
+                    'gamma': float(self._params[2][rows][m]),
+                    'daily_sigma': round(float(sigma[rows][m]), 2)
+                }
+                for m, metric in enumerate(METRICS)
+            }
+            for horizon in HORIZONS:
+                result = projection[horizon]
+                forecast, std = result['forecast'][rows], result['std'][rows]
+                payloads[(website_id, horizon)] = {
+                    'website_id': website_id,
+                    'horizon': horizon,
+                    'interval': 'hour' if horizon == 'next_day' else 'day',
+                    'confidence': CONFIDENCE,
+                    'points': [
+                        dict(
+                            {'start': start.isoformat()},
+                            **{metric: self._band(forecast[m, i], std[m, i]) for m, metric in enumerate(METRICS)}
+                        )
+                        for i, start in enumerate(result['starts'])
+                    ],
+                    'totals': {
+                        metric: self._band(result['total'][rows][m], result['total_std'][rows][m])
+                        for m, metric in enumerate(METRICS)
+                    },
+                    'history_days': self.history_days,
+                    'model': model
+                }
+        return payloads
+
+    def _write(self, payloads):
+        """Upsert every website's forecasts on the default database, which the backend reads"""
+        rows = [
+            (website_id, horizon, json.dumps(payload), self.fitted_at)
+            for (website_id, horizon), payload in payloads.items()
+        ]
+        with db.get_cursor() as cursor:
+            execute_values(cursor, """
+                INSERT INTO sales_forecasts (website_id, horizon, forecast, fitted_at)
+                VALUES %s
+                ON CONFLICT (website_id, horizon)
+                DO UPDATE SET
+                    forecast = EXCLUDED.forecast,
+                    fitted_at = EXCLUDED.fitted_at,
+                    computed_at = CURRENT_TIMESTAMP
+            """, rows)
+
+    def refresh(self, now=None):
+        """Update (or refit when due) every model and store the forecasts"""
+        try:
+            start = time.perf_counter()
+            now = now or datetime.now()
+            with self._lock:
+                websites = self._website_ids()
+                if (self.fitted_at is None or now - self.fitted_at >= self.refit_interval
+                        or websites != self.websites):
+                    self.fit(now, websites)
+                else:
+                    self.update(now)
+                if not self.websites:
+                    return 0
+                payloads = self.build_payloads(self.project())
+            self._write(payloads)
+            logger.info(f"Sales forecasts refreshed for {len(self.websites)} websites "
+                        f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+            return len(payloads)
+        except Exception as e:
+            logger.error(f"Failed to refresh sales forecasts: {e}")
+            return None
+
+
+# Global forecaster instance
+sales_forecaster = SalesForecaster(
+    history_days=settings.FORECAST_HISTORY_DAYS,
+    profile_days=settings.FORECAST_PROFILE_DAYS,
+    refit_hours=settings.FORECAST_REFIT_HOURS
+)
@@ -0,0 +1,261 @@
+"""
+============================================
+Hourly Range Index
+Made by Hammad Naeem
+============================================
+
+Per-website prefix sums over sales_hourly_stats (sales, revenue and items
+sold), held in NumPy arrays so range questions never touch the database:
+
+- total(start, end): totals for [start, end) from two prefix lookups
+- totals(boundaries): totals of consecutive buckets (days, months, ...)
+- hour_of_day / weekday / hour_of_week(start, end): histograms over any
+  range from a prefix sum strided by one week, 168 lookups per query
+
+Hour i of the index starts at origin + i hours, and origin is a Monday
+midnight, so hour i falls on hour-of-week slot i % 168. Range boundaries
+are rounded down to the hour; hours outside the index count as zero.
+
+The index starts on the first Monday within history_days, which is capped
+at RETENTION_HOURLY_STATS_DAYS when retention runs: older hourly stats are
+rolled up into daily stats and would be read as empty hours.
+
+The index covers the hours whose stats are final: those before the last
+aggregation run (the latest updated_at of today's hourly stats). refresh()
+appends the hours closed since, so it runs after each aggregation.
+"""
+
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from config.settings import settings
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('total_sales', 'total_revenue', 'total_items_sold')
+HOUR = timedelta(hours=1)
+WEEK_HOURS = 7 * 24
+
+
+def _floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class HourlyRangeIndex:
+    """Prefix sums of hourly stats per website"""
+
+    def __init__(self, history_days=365):
+        self.history_days = history_days
+        self.origin = None  # Monday midnight starting hour 0
+        self.size = 0  # hours indexed: [origin, origin + size hours)
+        self._rows = {}  # website_id -> row in the arrays
+        self._prefix = None  # (websites, metrics, capacity + 1): totals of hours [0, i)
+        self._weekly = None  # (websites, metrics, capacity): hour i plus hours i - 168, i - 336, ...
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.origin is not None
+
+    @property
+    def end(self):
+        """First hour not in the index"""
+        return self.origin + self.size * HOUR if self.loaded else None
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _aggregated_until():
+        """Start of the hour of the last aggregation run, or None before any ran today"""
+        rows_by_shard = db.scatter_query("""
+            SELECT MAX(updated_at) as aggregated_at
+            FROM sales_hourly_stats
+            WHERE stat_date = CURRENT_DATE
+        """, readonly=True)
+        runs = [rows[0]['aggregated_at'] for rows in rows_by_shard.values() if rows[0]['aggregated_at']]
+        if not runs:
+            return None
+        # The shard aggregated longest ago bounds the hours that are final everywhere
+        return _floor_hour(min(runs).astimezone().replace(tzinfo=None))
+
+    def _load(self, start, end):
+        """Hourly totals over all shops for [start, end), as (websites, metrics, hours)"""
+        hours = int((end - start) / HOUR)
+        rows_by_shard = db.scatter_query("""
+            SELECT
+                website_id, stat_date, stat_hour,
+                SUM(total_sales) as total_sales,
+                SUM(total_revenue) as total_revenue,
+                SUM(total_items_sold) as total_items_sold
+            FROM sales_hourly_stats
+            WHERE (stat_date, stat_hour) >= (%s, %s)
+            AND (stat_date, stat_hour) < (%s, %s)
+            GROUP BY website_id, stat_date, stat_hour
+        """, (start.date(), start.hour, end.date(), end.hour), readonly=True)
+        rows = [row for shard_rows in rows_by_shard.values() for row in shard_rows]
+
+        for website_id in sorted({row['website_id'] for row in rows} - self._rows.keys()):
+            self._add_website(website_id)
+
+        values = np.zeros((len(self._rows), len(METRICS), hours))
+        for row in rows:
+            hour_start = datetime.combine(row['stat_date'], datetime.min.time()) + row['stat_hour'] * HOUR
+            column = int((hour_start - start) / HOUR)
+            for m, metric in enumerate(METRICS):
+                values[self._rows[row['website_id']], m, column] = float(row[metric] or 0)
+        return values
+
+    def _add_website(self, website_id):
+        self._rows[website_id] = len(self._rows)
+        if self._prefix is not None:
+            self._prefix = np.concatenate([self._prefix, np.zeros((1,) + self._prefix.shape[1:])])
+            self._weekly = np.concatenate([self._weekly, np.zeros((1,) + self._weekly.shape[1:])])
+
+    def _reserve(self, hours):
+        """Grow the arrays (doubling) to hold `hours` more hours"""
+        capacity = self._weekly.shape[2]
+        if self.size + hours <= capacity:
+            return
+        capacity = max(self.size + hours, capacity * 2, WEEK_HOURS)
+        websites = len(self._rows)
+        prefix = np.zeros((websites, len(METRICS), capacity + 1))
+        weekly = np.zeros((websites, len(METRICS), capacity))
+        prefix[..., :self.size + 1] = self._prefix[..., :self.size + 1]
+        weekly[..., :self.size] = self._weekly[..., :self.size]
+        self._prefix, self._weekly = prefix, weekly
+
+    def _append(self, values):
+        """Append hours (websites, metrics, hours) after the last indexed hour"""
+        hours = values.shape[2]
+        self._reserve(hours)
+        size = self.size
+        self._prefix[..., size + 1:size + hours + 1] = self._prefix[..., size, None] + np.cumsum(values, axis=2)
+        # A week at a time, each new hour adds onto the same slot a week earlier
+        for offset in range(0, hours, WEEK_HOURS):
+            chunk = values[..., offset:offset + WEEK_HOURS]
+            first = size + offset
+            target = self._weekly[..., first:first + chunk.shape[2]]
+            target[...] = chunk
+            previous = np.arange(first, first + chunk.shape[2]) - WEEK_HOURS
+            earlier = previous >= 0
+            target[..., earlier] += self._weekly[..., previous[earlier]]
+        self.size += hours
+
+    def refresh(self):
+        """Build the index, or append the hours aggregated since the last refresh"""
+        try:
+            start = time.perf_counter()
+            now = datetime.now()
+            today = _floor_hour(now).replace(hour=0)
+            until = self._aggregated_until() or today
+            until = min(until, _floor_hour(now))
+
+            with self._lock:
+                if not self.loaded:
+                    first = today - timedelta(days=self.history_days)
+                    self.origin = first + timedelta(days=-first.weekday() % 7)
+                    self._prefix = np.zeros((len(self._rows), len(METRICS), 1))
+                    self._weekly = np.zeros((len(self._rows), len(METRICS), 0))
+                    self.size = 0
+                end = self.end
+                if until <= end:
+                    return 0
+                self._append(self._load(end, until))
+
+            logger.info(f"Hourly range index extended to {until:%Y-%m-%d %H:00} "
+                        f"({(time.perf_counter() - start) * 1000:.1f} ms, {len(self._rows)} websites)")
+            return int((until - end) / HOUR)
+
+        except Exception as e:
+            logger.error(f"Failed to refresh hourly range index: {e}")
+            return None
+
+    def ensure_loaded(self):
+        """Build the index on first use"""
+        if not self.loaded:
+            self.refresh()
+        return self.loaded
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _hour_index(self, moment):
+        return int(np.clip((_floor_hour(moment) - self.origin) // HOUR, 0, self.size))
+
+    def _gather(self, array, positions, website_id):
+        """Hours at positions for one website, or for all websites added up, as (metrics, positions)"""
+        if website_id is None:
+            return array[:, :, positions].sum(axis=0)
+        row = self._rows.get(website_id)
+        if row is None:
+            return np.zeros((len(METRICS), len(positions)))
+        return array[row][:, positions]
+
+    @staticmethod
+    def _by_metric(values):
+        """{metric: values} for arrays shaped (metrics, ...)"""
+        return {
+            metric: (np.rint(values[m]).astype(np.int64) if metric != 'total_revenue' else np.round(values[m], 2))
+            for m, metric in enumerate(METRICS)
+        }
+
+    def totals(self, boundaries, website_id=None):
+        """
+        Totals of the buckets between consecutive boundaries (e.g. day or
+        month starts), as {metric: array of len(boundaries) - 1}.
+        """
+        with self._lock:
+            if not self.loaded:
+                return self._by_metric(np.zeros((len(METRICS), max(len(boundaries) - 1, 0))))
+            indexes = np.array([self._hour_index(moment) for moment in boundaries], dtype=np.int64)
+            values = self._gather(self._prefix, indexes, website_id)
+        return self._by_metric(np.diff(values, axis=1))
+
+    def total(self, start, end, website_id=None):
+        """Totals for [start, end) as {metric: value}"""
+        return {metric: values[0].item() for metric, values in self.totals([start, end], website_id).items()}
+
+    def hour_of_week(self, start, end, website_id=None):
+        """Totals for [start, end) per weekday (Monday = 0) and hour, as {metric: (7, 24) array}"""
+        with self._lock:
+            if not self.loaded:
+                return self._by_metric(np.zeros((len(METRICS), 7, 24)))
+            a, b = self._hour_index(start), self._hour_index(end)
+            slots = np.arange(WEEK_HOURS)
+            # Last and first hour of each slot inside [a, b)
+            last = b - 1 - (b - 1 - slots) % WEEK_HOURS
+            first = a + (slots - a) % WEEK_HOURS
+            present = (last >= first) & (last >= 0)
+            before = first - WEEK_HOURS
+            values = np.zeros((len(METRICS), WEEK_HOURS))
+            values[:, present] = self._gather(self._weekly, last[present], website_id)
+            subtract = present & (before >= 0)
+            values[:, subtract] -= self._gather(self._weekly, before[subtract], website_id)
+        return self._by_metric(values.reshape(len(METRICS), 7, 24))
+
+    def hour_of_day(self, start, end, website_id=None):
+        """Totals for [start, end) per hour of day, as {metric: array of 24}"""
+        return {metric: values.sum(axis=0) for metric, values in self.hour_of_week(start, end, website_id).items()}
+
+    def weekday(self, start, end, website_id=None):
+        """Totals for [start, end) per weekday (Monday = 0), as {metric: array of 7}"""
+        return {metric: values.sum(axis=1) for metric, values in self.hour_of_week(start, end, website_id).items()}
+
+
+def _history_days():
+    """RANGE_INDEX_HISTORY_DAYS, capped at the hourly stats retention keeps"""
+    if settings.ENABLE_RETENTION and settings.RETENTION_HOURLY_STATS_DAYS > 0:
+        return min(settings.RANGE_INDEX_HISTORY_DAYS, settings.RETENTION_HOURLY_STATS_DAYS)
+    return settings.RANGE_INDEX_HISTORY_DAYS
+
+
+# Global index instance
+hourly_index = HourlyRangeIndex(history_days=_history_days())
@@ -6,51 +6,66 @@ Made by Hammad Naeem
 """
 
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from config.settings import settings
 from database.connection import db
+from analytics.range_index import hourly_index
 
 logger = logging.getLogger(__name__)
 
 
+def _merge_totals(rows, count_key, revenue_key, avg_key=None):
+    """Add up per-shard count/revenue rows, recomputing the average order value"""
+    count = sum(row[count_key] for row in rows)
+    revenue = sum(row[revenue_key] for row in rows)
+    merged = {count_key: count, revenue_key: revenue}
+    if avg_key:
+        merged[avg_key] = revenue / count if count else 0
+    return merged
+
+
 class RealTimeAnalytics:
     """Real-time analytics calculations"""
     
     @staticmethod
     def get_current_stats():
-        """Get current real-time statistics"""
+        """Get current real-time statistics (gathered from every shard)"""
         try:
             # Today's stats
-            today_stats = db.execute_query("""
+            today_stats = db.scatter_query("""
                 SELECT 
                     COUNT(*) as total_sales,
                     COALESCE(SUM(total_amount), 0) as total_revenue,
                     COALESCE(AVG(total_amount), 0) as avg_order_value
                 FROM sales
                 WHERE sale_date::DATE = CURRENT_DATE
-            """)
+            """, readonly=True)
             
             # Last hour stats
-            last_hour_stats = db.execute_query("""
+            last_hour_stats = db.scatter_query("""
                 SELECT 
                     COUNT(*) as sales,
                     COALESCE(SUM(total_amount), 0) as revenue
                 FROM sales
                 WHERE sale_date >= CURRENT_TIMESTAMP - INTERVAL '1 hour'
-            """)
+            """, readonly=True)
             
             # Last minute stats
-            last_minute_stats = db.execute_query("""
+            last_minute_stats = db.scatter_query("""
                 SELECT 
                     COUNT(*) as sales,
                     COALESCE(SUM(total_amount), 0) as revenue
                 FROM sales
                 WHERE sale_date >= CURRENT_TIMESTAMP - INTERVAL '1 minute'
-            """)
+            """, readonly=True)
             
             return {
-                'today': today_stats[0] if today_stats else {},
-                'last_hour': last_hour_stats[0] if last_hour_stats else {},
-                'last_minute': last_minute_stats[0] if last_minute_stats else {},
+                'today': _merge_totals(
+                    [rows[0] for rows in today_stats.values()],
+                    'total_sales', 'total_revenue', 'avg_order_value'
+                ),
+                'last_hour': _merge_totals([rows[0] for rows in last_hour_stats.values()], 'sales', 'revenue'),
+                'last_minute': _merge_totals([rows[0] for rows in last_minute_stats.values()], 'sales', 'revenue'),
                 'timestamp': datetime.now().isoformat()
             }
             
@@ -60,9 +75,9 @@ class RealTimeAnalytics:
     
     @staticmethod
     def get_website_rankings():
-        """Get website performance rankings"""
+        """Get website performance rankings (gathered from every shard)"""
         try:
-            return db.execute_query("""
+            rows_by_shard = db.scatter_query("""
                 SELECT 
                     w.id,
                     w.name,
@@ -75,33 +90,62 @@ class RealTimeAnalytics:
                 WHERE w.is_active = true
                 GROUP BY w.id, w.name
                 ORDER BY total_revenue DESC
-            """)
+            """, readonly=True)
+            
+            # Every shard lists every website; add up what each one sold
+            rows_by_website = {}
+            for rows in rows_by_shard.values():
+                for row in rows:
+                    rows_by_website.setdefault((row['id'], row['name']), []).append(row)
+            
+            rankings = [
+                dict(id=website_id, name=name,
+                     **_merge_totals(rows, 'total_sales', 'total_revenue', 'avg_order_value'))
+                for (website_id, name), rows in rows_by_website.items()
+            ]
+            return sorted(rankings, key=lambda r: r['total_revenue'], reverse=True)
         except Exception as e:
             logger.error(f"Failed to get website rankings: {e}")
             return []
     
     @staticmethod
     def get_hourly_breakdown():
-        """Get hourly sales breakdown for today"""
+        """
+        Get hourly sales breakdown for today.
+        
+        Hours already in the hourly range index come from it; only the rest
+        of today (normally the current hour) is read from sales on every shard.
+        """
         try:
-            result = db.execute_query("""
+            today = datetime.combine(date.today(), datetime.min.time())
+            hourly_data = {h: {'sales': 0, 'revenue': 0} for h in range(24)}
+            
+            indexed_until = today
+            if settings.ENABLE_RANGE_INDEX and hourly_index.ensure_loaded():
+                indexed_until = max(today, hourly_index.end)
+                indexed = hourly_index.hour_of_day(today, indexed_until)
+                for h, hour in hourly_data.items():
+                    hour['sales'] = int(indexed['total_sales'][h])
+                    hour['revenue'] = float(indexed['total_revenue'][h])
+            
+            rows_by_shard = db.scatter_query("""
                 SELECT 
                     EXTRACT(HOUR FROM sale_date)::INTEGER as hour,
                     COUNT(*) as sales,
                     COALESCE(SUM(total_amount), 0) as revenue
                 FROM sales
                 WHERE sale_date::DATE = CURRENT_DATE
+                AND sale_date >= %s
                 GROUP BY EXTRACT(HOUR FROM sale_date)
                 ORDER BY hour
-            """)
+            """, (indexed_until,), readonly=True)
             
             # Fill in missing hours
-            hourly_data = {h: {'sales': 0, 'revenue': 0} for h in range(24)}
-            for row in result:
-                hourly_data[row['hour']] = {
-                    'sales': row['sales'],
-                    'revenue': float(row['revenue'])
-                }
+            for rows in rows_by_shard.values():
+                for row in rows:
+                    hour = hourly_data[row['hour']]
+                    hour['sales'] += row['sales']
+                    hour['revenue'] += float(row['revenue'])
             
             return hourly_data
             
@@ -0,0 +1,273 @@
+"""
+============================================
+Dashboard Snapshot Module
+Made by Hammad Naeem
+============================================
+
+Precomputes the payloads served by the backend's /analytics/dashboard and
+/analytics/trends endpoints and stores them in dashboard_snapshots, so each
+dashboard request is a single primary-key lookup.
+
+Closed days are summed from sales, each day once, and cached. Today's
+totals are kept in memory and advanced incrementally from the sales written
+since the last refresh; today's distinct customers are kept as a set of
+ids, so uniqueCustomers is the exact COUNT(DISTINCT customer_id) the
+backend reports.
+Sales are read from every shard; the snapshots are written to the default
+database, which the backend reads.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+# Sales are read again for this long after the watermark, so a sale whose
+# transaction committed after a refresh that had already passed its
+# sale_date is still counted (ids already counted are skipped)
+WATERMARK_OVERLAP = timedelta(seconds=60)
+
+
+def _percent_change(current, previous):
+    """Percentage change the way the backend reports it (100 when no baseline)"""
+    if previous > 0:
+        return round((current - previous) / previous * 100, 2)
+    return 100
+
+
+def _percent_change_text(current, previous):
+    """Percentage change formatted like the backend's toFixed(2)"""
+    if previous > 0:
+        return f"{(current - previous) / previous * 100:.2f}"
+    return 100
+
+
+class DashboardSnapshots:
+    """Maintains the dashboard_snapshots rows"""
+
+    def __init__(self):
+        self._today = None
+        self._today_totals = None
+        self._today_customers = None
+        self._watermark = None
+        self._recent_ids = {}  # sale id -> sale_date, within the overlap window
+        self._closed_days = {}  # closed date -> (sales, revenue), read once from sales
+
+    def _reset_today(self, today):
+        self._today = today
+        self._today_totals = {'total_sales': 0, 'total_revenue': 0.0}
+        self._today_customers = set()
+        self._watermark = None
+        self._recent_ids = {}
+
+    def _advance_today(self, today):
+        """Add sales written since the last refresh to today's running totals"""
+        if self._today != today:
+            self._reset_today(today)
+
+        if self._watermark is None:
+            rows_by_shard = db.scatter_query("""
+                SELECT id, sale_date, customer_id, total_amount
+                FROM sales
+                WHERE sale_date >= CURRENT_DATE
+            """)
+        else:
+            rows_by_shard = db.scatter_query("""
+                SELECT id, sale_date, customer_id, total_amount
+                FROM sales
+                WHERE sale_date >= GREATEST(%s, CURRENT_DATE)
+            """, (self._watermark - WATERMARK_OVERLAP,))
+        rows = [row for shard_rows in rows_by_shard.values() for row in shard_rows]
+
+        new_rows = [row for row in rows if row['id'] not in self._recent_ids]
+        for row in new_rows:
+            self._today_totals['total_sales'] += 1
+            self._today_totals['total_revenue'] += float(row['total_amount'])
+        self._today_customers.update(
+            row['customer_id'] for row in new_rows if row['customer_id'] is not None
+        )
+
+        if rows:
+            latest = max(row['sale_date'] for row in rows)
+            self._watermark = max(latest, self._watermark) if self._watermark else latest
+            self._recent_ids.update((row['id'], row['sale_date']) for row in rows)
+
+            horizon = self._watermark - WATERMARK_OVERLAP
+            self._recent_ids = {
+                sale_id: sale_date
+                for sale_id, sale_date in self._recent_ids.items()
+                if sale_date >= horizon
+            }
+
+        return len(new_rows)
+
+    def _closed_day_totals(self):
+        """
+        Sum closed days for every period the dashboard shows.
+
+        Days are read from sales, once: a closed day is cached as soon as
+        WATERMARK_OVERLAP has passed since its end, so late commits are in.
+        """
+        clock = db.execute_query("SELECT CURRENT_DATE as today, LOCALTIMESTAMP as now")[0]
+        today = clock['today']
+        yesterday = today - timedelta(days=1)
+        week_start = today - timedelta(days=today.weekday())
+        month_start = today.replace(day=1)
+        last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+        first = min(last_month_start, week_start - timedelta(days=7))
+
+        self._closed_days = {day: totals for day, totals in self._closed_days.items() if first <= day}
+        pending = [
+            first + timedelta(days=offset)
+            for offset in range((today - first).days)
+            if first + timedelta(days=offset) not in self._closed_days
+        ]
+        days = dict(self._closed_days)
+        if pending:
+            rows_by_shard = db.scatter_query("""
+                SELECT
+                    sale_date::DATE as stat_date,
+                    COUNT(*) as total_sales,
+                    COALESCE(SUM(total_amount), 0) as total_revenue
+                FROM sales
+                WHERE sale_date >= %s
+                AND sale_date < CURRENT_DATE
+                GROUP BY sale_date::DATE
+            """, (pending[0],))
+            found = {}
+            for row in (row for rows in rows_by_shard.values() for row in rows):
+                sales, revenue = found.get(row['stat_date'], (0, Decimal('0')))
+                found[row['stat_date']] = (sales + row['total_sales'], revenue + row['total_revenue'])
+            settled = clock['now'] - datetime.combine(today, datetime.min.time()) >= WATERMARK_OVERLAP
+            for day in pending:
+                days[day] = found.get(day, (0, Decimal('0')))
+                if day < yesterday or settled:
+                    self._closed_days[day] = days[day]
+
+        periods = {
+            'yesterday': (yesterday, today),
+            'week': (week_start, today),
+            'last_week': (week_start - timedelta(days=7), week_start),
+            'month': (month_start, today),
+            'last_month': (last_month_start, month_start),
+        }
+        closed = {'today': today}
+        for name, (start, end) in periods.items():
+            totals = [days[day] for day in days if start <= day < end]
+            closed[f'{name}_sales'] = sum(sales for sales, _ in totals)
+            closed[f'{name}_revenue'] = sum((revenue for _, revenue in totals), Decimal('0'))
+        return closed
+
+    @staticmethod
+    def _catalog_counts():
+        """Website, product, low-stock and last-hour sales counts over every shard"""
+        rows_by_shard = db.scatter_query("""
+            SELECT
+                (SELECT COUNT(*) FROM websites WHERE is_active = true) as websites,
+                (SELECT COUNT(*) FROM products WHERE is_active = true) as products,
+                ARRAY(SELECT id FROM products
+                      WHERE stock_quantity < reorder_level AND is_active = true) as low_stock,
+                (SELECT COUNT(*) FROM sales
+                 WHERE sale_date >= CURRENT_TIMESTAMP - INTERVAL '1 hour') as recent_sales
+        """)
+        counts = [rows[0] for rows in rows_by_shard.values()]
+        # Every shard holds the same catalog, but stock and sales are per shard:
+        # a product is low on stock when it is low on any shard
+        return {
+            'websites': counts[0]['websites'],
+            'products': counts[0]['products'],
+            'low_stock': len(set().union(*(row['low_stock'] for row in counts))),
+            'recent_sales': sum(row['recent_sales'] for row in counts)
+        }
+
+    def build_payloads(self):
+        """Build the dashboard and trends payloads"""
+        closed = self._closed_day_totals()
+        self._advance_today(closed['today'])
+        counts = self._catalog_counts()
+
+        today_sales = self._today_totals['total_sales']
+        today_revenue = self._today_totals['total_revenue']
+        yesterday_sales = int(closed['yesterday_sales'])
+        yesterday_revenue = float(closed['yesterday_revenue'])
+
+        week = {'sales': int(closed['week_sales']) + today_sales,
+                'revenue': round(float(closed['week_revenue']) + today_revenue, 2)}
+        last_week = {'sales': int(closed['last_week_sales']),
+                     'revenue': float(closed['last_week_revenue'])}
+        month = {'sales': int(closed['month_sales']) + today_sales,
+                 'revenue': round(float(closed['month_revenue']) + today_revenue, 2)}
+        last_month = {'sales': int(closed['last_month_sales']),
+                      'revenue': float(closed['last_month_revenue'])}
+
+        dashboard = {
+            'today': {
+                'totalSales': today_sales,
+                'totalRevenue': round(today_revenue, 2),
+                'avgOrderValue': round(today_revenue / today_sales, 2) if today_sales else 0,
+                'uniqueCustomers': len(self._today_customers)
+            },
+            'comparison': {
+                'revenueChange': _percent_change(today_revenue, yesterday_revenue),
+                'salesChange': _percent_change(today_sales, yesterday_sales)
+            },
+            'month': {
+                'totalSales': month['sales'],
+                'totalRevenue': month['revenue']
+            },
+            'counts': {
+                'websites': int(counts['websites']),
+                'products': int(counts['products']),
+                'lowStock': int(counts['low_stock']),
+                'recentSales': int(counts['recent_sales'])
+            }
+        }
+
+        trends = {
+            'weekly': {
+                'current': week,
+                'previous': last_week,
+                'salesChange': _percent_change_text(week['sales'], last_week['sales']),
+                'revenueChange': _percent_change_text(week['revenue'], last_week['revenue'])
+            },
+            'monthly': {
+                'current': month,
+                'previous': last_month,
+                'salesChange': _percent_change_text(month['sales'], last_month['sales']),
+                'revenueChange': _percent_change_text(month['revenue'], last_month['revenue'])
+            }
+        }
+
+        return {'dashboard': dashboard, 'trends': trends}
+
+    @staticmethod
+    def _write(snapshot_key, payload):
+        """Write a snapshot row to the default database, bumping its version"""
+        db.execute_query("""
+            INSERT INTO dashboard_snapshots (snapshot_key, version, payload, computed_at)
+            VALUES (%s, 1, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (snapshot_key)
+            DO UPDATE SET
+                version = dashboard_snapshots.version + 1,
+                payload = EXCLUDED.payload,
+                computed_at = EXCLUDED.computed_at
+        """, (snapshot_key, json.dumps(payload)), fetch=False)
+
+    def refresh(self):
+        """Recompute and store every snapshot"""
+        try:
+            payloads = self.build_payloads()
+            for snapshot_key, payload in payloads.items():
+                self._write(snapshot_key, payload)
+            logger.info(f"Dashboard snapshots refreshed ({self._today_totals['total_sales']} sales today)")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to refresh dashboard snapshots: {e}")
+            return False
+
+
+dashboard_snapshots = DashboardSnapshots()
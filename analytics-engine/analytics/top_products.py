@@ -0,0 +1,219 @@
+"""
+============================================
+Top Products Tracker
+Made by Hammad Naeem
+============================================
+
+Approximate top-K products per website over rolling windows, fed by the
+line items of every sale the generator writes (no SQL at query time):
+
+- 'hour':  last hour, from 5-minute buckets
+- 'today': since midnight, from the current day bucket
+- '30d':   last 30 days, from daily buckets
+
+Each bucket is a Space-Saving summary of units sold with TOP_PRODUCTS_CAPACITY
+counters, so memory is bounded by websites x buckets x capacity. Windows
+merge their buckets; every reported quantity overestimates the true one by at
+most its `error`, itself at most window units / capacity.
+
+Buckets changed since the last checkpoint are saved to
+top_products_checkpoints and loaded again on startup.
+"""
+
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from config.settings import settings
+from database.connection import db
+from analytics.sketches import SpaceSaving
+
+logger = logging.getLogger(__name__)
+
+MINUTE_BUCKET = timedelta(minutes=5)
+DAY_BUCKETS = 30
+
+WINDOWS = ('hour', 'today', '30d')
+
+
+class TopProductsTracker:
+    """Space-Saving top-K products per website and time bucket"""
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self._buckets = {}  # (website_id, granularity, bucket_start) -> SpaceSaving
+        self._names = {}  # product_id -> name
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket_starts(now):
+        """Start of the 5-minute and day buckets containing now"""
+        minute = now.replace(minute=now.minute - now.minute % 5, second=0, microsecond=0)
+        day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return {'5min': minute, 'day': day}
+
+    @staticmethod
+    def _is_expired(granularity, bucket_start, now):
+        if granularity == '5min':
+            return bucket_start + MINUTE_BUCKET <= now - timedelta(hours=1)
+        return bucket_start <= now - timedelta(days=DAY_BUCKETS)
+
+    def _expire(self, now):
+        """Drop buckets that no window covers any more"""
+        expired = [key for key in self._buckets if self._is_expired(key[1], key[2], now)]
+        for key in expired:
+            del self._buckets[key]
+            self._dirty.discard(key)
+
+    def record_sales(self, sales, now=None):
+        """Count the line items of written sales"""
+        now = now or datetime.now().astimezone()
+        starts = self._bucket_starts(now)
+        with self._lock:
+            for sale in sales:
+                for granularity, bucket_start in starts.items():
+                    key = (sale['website_id'], granularity, bucket_start)
+                    summary = self._buckets.get(key)
+                    if summary is None:
+                        summary = self._buckets[key] = SpaceSaving(self.capacity)
+                    for item in sale['items']:
+                        summary.add(item['product_id'], item['quantity'])
+                    self._dirty.add(key)
+                for item in sale['items']:
+                    self._names[item['product_id']] = item['product_name']
+            self._expire(now)
+
+    def _window_buckets(self, window, now):
+        """Bucket keys (granularity, start predicate) that make up a window"""
+        if window == 'hour':
+            horizon = now - timedelta(hours=1)
+            return lambda granularity, start: granularity == '5min' and start + MINUTE_BUCKET > horizon
+        today = self._bucket_starts(now)['day']
+        if window == 'today':
+            return lambda granularity, start: granularity == 'day' and start == today
+        if window == '30d':
+            horizon = today - timedelta(days=DAY_BUCKETS - 1)
+            return lambda granularity, start: granularity == 'day' and start >= horizon
+        raise ValueError(f"Unknown window '{window}', expected one of {WINDOWS}")
+
+    def top(self, website_id=None, window='hour', k=10, now=None):
+        """
+        Approximate top-k products for a website (all websites when None).
+
+        Each product's true units sold lie in [quantity - error, quantity].
+        """
+        now = now or datetime.now().astimezone()
+        in_window = self._window_buckets(window, now)
+        merged = SpaceSaving(self.capacity)
+        with self._lock:
+            for (bucket_website, granularity, start), summary in self._buckets.items():
+                if website_id is not None and bucket_website != website_id:
+                    continue
+                if in_window(granularity, start):
+                    merged.merge(summary)
+            names = dict(self._names)
+
+        return {
+            'website_id': website_id,
+            'window': window,
+            'total_units': merged.total,
+            'error_bound': round(merged.error_bound(), 2),
+            'products': [
+                {
+                    'product_id': product_id,
+                    'name': names.get(product_id),
+                    'quantity': quantity,
+                    'error': error,
+                    'min_quantity': quantity - error
+                }
+                for product_id, quantity, error in merged.top(k)
+            ]
+        }
+
+    @staticmethod
+    def _horizons(now):
+        """Oldest 5-minute and day bucket starts still inside a window"""
+        return now - timedelta(hours=1) - MINUTE_BUCKET, now - timedelta(days=DAY_BUCKETS)
+
+    def checkpoint(self):
+        """Save buckets changed since the last checkpoint and drop expired ones"""
+        now = datetime.now().astimezone()
+        with self._lock:
+            self._expire(now)
+            dirty = list(self._dirty)
+            self._dirty.clear()
+            rows_by_shard = {}
+            for key in dirty:
+                website_id, granularity, bucket_start = key
+                rows_by_shard.setdefault(db.shard_for(website_id), []).append(
+                    (website_id, granularity, bucket_start, self._buckets[key].to_bytes())
+                )
+
+        saved = 0
+        for shard in db.shard_names:
+            rows = rows_by_shard.get(shard, [])
+            try:
+                with db.get_cursor(shard=shard) as cursor:
+                    if rows:
+                        execute_values(cursor, """
+                            INSERT INTO top_products_checkpoints (website_id, granularity, bucket_start, summary)
+                            VALUES %s
+                            ON CONFLICT (website_id, granularity, bucket_start)
+                            DO UPDATE SET
+                                summary = EXCLUDED.summary,
+                                updated_at = CURRENT_TIMESTAMP
+                        """, rows)
+                    cursor.execute("""
+                        DELETE FROM top_products_checkpoints
+                        WHERE (granularity = '5min' AND bucket_start <= %s)
+                        OR (granularity = 'day' AND bucket_start <= %s)
+                    """, self._horizons(now))
+                saved += len(rows)
+            except Exception as e:
+                # Keep the buckets marked so the next checkpoint retries them
+                with self._lock:
+                    self._dirty.update(key for key in ((r[0], r[1], r[2]) for r in rows) if key in self._buckets)
+                logger.error(f"Failed to checkpoint top products on shard '{shard}': {e}")
+
+        logger.info(f"Top products checkpoint saved ({saved} buckets)")
+        return saved
+
+    def restore(self):
+        """Load the last checkpoint (buckets still inside a window)"""
+        try:
+            start = time.perf_counter()
+            now = datetime.now().astimezone()
+            rows_by_shard = db.scatter_query("""
+                SELECT website_id, granularity, bucket_start, summary
+                FROM top_products_checkpoints
+                WHERE (granularity = '5min' AND bucket_start > %s)
+                OR (granularity = 'day' AND bucket_start > %s)
+            """, self._horizons(now))
+            rows = [row for shard_rows in rows_by_shard.values() for row in shard_rows]
+            names = db.execute_query("SELECT id, name FROM products")
+
+            with self._lock:
+                for row in rows:
+                    key = (row['website_id'], row['granularity'], row['bucket_start'])
+                    restored = SpaceSaving.from_bytes(row['summary'])
+                    # Sales recorded since startup are merged with the checkpoint
+                    current = self._buckets.get(key)
+                    self._buckets[key] = restored.merge(current) if current else restored
+                for product in names:
+                    self._names.setdefault(product['id'], product['name'])
+
+            logger.info(f"Top products restored ({len(rows)} buckets in "
+                        f"{(time.perf_counter() - start) * 1000:.1f} ms)")
+            return len(rows)
+
+        except Exception as e:
+            logger.error(f"Failed to restore top products: {e}")
+            return None
+
+
+# Global tracker instance
+top_products = TopProductsTracker(capacity=settings.TOP_PRODUCTS_CAPACITY)
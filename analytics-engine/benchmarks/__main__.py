@@ -0,0 +1,192 @@
+"""
+============================================
+Engine Benchmark CLI
+Made by Hammad Naeem
+============================================
+
+Usage:
+    python -m benchmarks run --sales 100000 --output results/base.json
+    python -m benchmarks compare results/base.json results/new.json --threshold 0.10
+    python -m benchmarks record traces/day.trace --batches 1440 --seed 42
+    python -m benchmarks replay traces/day.trace --speed 60 --concurrency 4 --output results/replay.json
+"""
+
+import argparse
+import json
+import sys
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('benchmarks')
+
+
+def _print_results(results):
+    print(f"\n{'case':<40} {'median':>12} {'p95':>12}  unit")
+    for name, result in results['results'].items():
+        print(f"{name:<40} {result['median']:>12.4f} {result['p95']:>12.4f}  {result['unit']}")
+
+
+def run_command(args):
+    """Run the suite and write the results"""
+    from benchmarks.suite import run_suite
+
+    results = run_suite(
+        sales=args.sales,
+        days=args.days,
+        websites=args.websites,
+        products=args.products,
+        customers=args.customers,
+        repeats=args.repeats,
+        generation_batches=args.generation_batches,
+        keep_cluster=args.keep_cluster,
+        quiet=not args.verbose
+    )
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    _print_results(results)
+    print(f"\nResults written to {args.output}")
+    return 0
+
+
+def compare_command(args):
+    """Compare two result files and flag regressions"""
+    from benchmarks.suite import compare_results
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    if baseline['meta'].get('sales') != candidate['meta'].get('sales'):
+        logger.warning("⚠️  Runs were seeded with different data volumes")
+
+    rows = compare_results(baseline, candidate, threshold=args.threshold, metric=args.metric)
+
+    print(f"{'case':<40} {'baseline':>12} {'candidate':>12} {'change':>9}  status")
+    for row in rows:
+        if 'change' not in row:
+            print(f"{row['case']:<40} {'':>12} {'':>12} {'':>9}  {row['status']}")
+            continue
+        print(f"{row['case']:<40} {row['baseline']:>12.4f} {row['candidate']:>12.4f} "
+              f"{row['change']:>+8.1%}  {row['status']}")
+
+    regressions = [row for row in rows if row['status'] == 'regression']
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        return 1
+    print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+def record_command(args):
+    """Record a simulator workload trace without writing the sales"""
+    from benchmarks.replay import record_workload, throwaway_database
+
+    def record():
+        try:
+            return record_workload(args.trace, batches=args.batches, interval=args.interval, seed=args.seed)
+        finally:
+            from database.connection import db
+            db.close_all()
+
+    if args.throwaway:
+        with throwaway_database(websites=args.websites, products=args.products, customers=args.customers):
+            counts = record()
+    else:
+        counts = record()
+
+    print(f"Recorded {counts['sales']} sales in {counts['batches']} batches and {counts['jobs']} jobs to {args.trace}")
+    return 0
+
+
+def replay_command(args):
+    """Replay a workload trace and write the latency results"""
+    from benchmarks.replay import replay_workload, throwaway_database
+
+    def replay():
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+        try:
+            return replay_workload(args.trace, speed=args.speed, concurrency=args.concurrency)
+        finally:
+            from database.connection import db
+            db.close_all()
+
+    if args.throwaway:
+        with throwaway_database(websites=args.websites, products=args.products, customers=args.customers):
+            results = replay()
+    else:
+        results = replay()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    _print_results(results)
+    meta = results['meta']
+    print(f"\nReplayed {meta['sales']} sales and {meta['jobs']} jobs in {meta['duration_seconds']:.1f}s "
+          f"({meta['failed_sales']} sales and {meta['failed_jobs']} jobs failed)")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+def _add_catalog_args(parser):
+    parser.add_argument('--throwaway', action='store_true',
+                        help='Use a fresh local PostgreSQL seeded with the benchmark catalog')
+    parser.add_argument('--websites', type=int, default=6)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--customers', type=int, default=5000)
+
+
+def main():
+    """CLI entry point"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Analytics engine benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the suite on a throwaway PostgreSQL')
+    run_parser.add_argument('--sales', type=int, default=100000, help='Seeded sales (1k to 10M)')
+    run_parser.add_argument('--days', type=int, default=90, help='Days of history to spread sales over')
+    run_parser.add_argument('--websites', type=int, default=6)
+    run_parser.add_argument('--products', type=int, default=200)
+    run_parser.add_argument('--customers', type=int, default=5000)
+    run_parser.add_argument('--repeats', type=int, default=5, help='Timed runs per case')
+    run_parser.add_argument('--generation-batches', type=int, default=20, help='Batches for generation throughput')
+    run_parser.add_argument('--output', default='benchmark_results.json')
+    run_parser.add_argument('--keep-cluster', action='store_true', help='Keep the cluster files after the run')
+    run_parser.add_argument('--verbose', action='store_true', help='Keep engine INFO logging during timing')
+    run_parser.set_defaults(func=run_command)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='Allowed slowdown fraction')
+    compare_parser.add_argument('--metric', default='median', choices=['min', 'median', 'mean', 'p95'])
+    compare_parser.set_defaults(func=compare_command)
+
+    record_parser = subparsers.add_parser('record', help='Record a simulator workload trace')
+    record_parser.add_argument('trace', help='Trace file to write')
+    record_parser.add_argument('--batches', type=int, default=60, help='Generation batches to record')
+    record_parser.add_argument('--interval', type=float, default=60.0, help='Simulated seconds between batches')
+    record_parser.add_argument('--seed', type=int, default=None, help='Simulator seed (default: SIMULATION_SEED)')
+    _add_catalog_args(record_parser)
+    record_parser.set_defaults(func=record_command)
+
+    replay_parser = subparsers.add_parser('replay', help='Replay a workload trace against the database')
+    replay_parser.add_argument('trace', help='Trace file recorded with `record` or main.py --record-workload')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='Speed-up over the recorded timing (0 = no waits)')
+    replay_parser.add_argument('--concurrency', type=int, default=1, help='Concurrent replay workers')
+    replay_parser.add_argument('--output', default='replay_results.json')
+    replay_parser.add_argument('--verbose', action='store_true', help='Keep engine INFO logging during replay')
+    _add_catalog_args(replay_parser)
+    replay_parser.set_defaults(func=replay_command)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+============================================
+Audit Mode Benchmark
+Made by Hammad Naeem
+============================================
+
+Compares engine writes in 'row' audit mode (one transaction per sale,
+per-row audit triggers) against 'statement' audit mode (one bulk
+transaction per batch that inserts the same audit rows set-based).
+
+Reports per-sale write latency, WAL bytes per sale and audit rows per sale.
+The parity check confirms that each trail accounts for every stock change:
+replaying the audited old -> new stock levels per product must give the
+change actually made (tests/test_audit_mode.py compares the trails row by
+row).
+
+Runs against the database configured in .env, so point it at a scratch
+database: every run really inserts sales.
+
+Usage:
+    python -m benchmarks.audit_mode --batches 20 --batch-size 10
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from database.connection import db
+from simulation.sales_generator import sales_generator
+
+
+def _wal_lsn():
+    """Get the current WAL insert location"""
+    return db.execute_query("SELECT pg_current_wal_lsn() AS lsn")[0]['lsn']
+
+
+def _wal_bytes_since(lsn):
+    """Get WAL bytes written since lsn"""
+    return int(db.execute_query(
+        "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s) AS bytes", (lsn,)
+    )[0]['bytes'])
+
+
+def _audit_row_count():
+    """Get the current number of audit log rows on every shard"""
+    rows_by_shard = db.scatter_query("SELECT COUNT(*) AS count FROM audit_logs")
+    return sum(rows[0]['count'] for rows in rows_by_shard.values())
+
+
+def _last_audit_ids():
+    """Get the latest audit log id per shard"""
+    rows_by_shard = db.scatter_query("SELECT COALESCE(MAX(id), 0) AS id FROM audit_logs")
+    return {shard: rows[0]['id'] for shard, rows in rows_by_shard.items()}
+
+
+def _stock_levels():
+    """Get the stock of every product per shard"""
+    rows_by_shard = db.scatter_query("SELECT id, stock_quantity FROM products")
+    return {
+        (shard, row['id']): row['stock_quantity']
+        for shard, rows in rows_by_shard.items()
+        for row in rows
+    }
+
+
+def _audited_stock_changes(after_ids):
+    """Net stock change per product recorded by the products audit trail after after_ids"""
+    changes = {}
+    for shard, after_id in after_ids.items():
+        rows = db.execute_query("""
+            SELECT
+                record_id::INTEGER as product_id,
+                SUM((new_values->>'stock_quantity')::INTEGER
+                    - (old_values->>'stock_quantity')::INTEGER) as change
+            FROM audit_logs
+            WHERE table_name = 'products' AND action = 'UPDATE' AND id > %s
+            GROUP BY record_id
+        """, (after_id,), shard=shard)
+        for row in rows:
+            if row['change']:
+                changes[(shard, row['product_id'])] = row['change']
+    return changes
+
+
+def _top_up_stock(units):
+    """Give every product enough stock that the run never hits the stock check"""
+    db.execute_query(
+        "UPDATE products SET stock_quantity = stock_quantity + %s", (units,), fetch=False
+    )
+
+
+def _build_batches(batches, batch_size):
+    """Build the sales to write up front so generation is not timed"""
+    result = []
+    for _ in range(batches):
+        batch = [sale for sale in (sales_generator._build_sale() for _ in range(batch_size)) if sale]
+        result.append(batch)
+    return result
+
+
+def _write_row_mode(batch):
+    """Write a batch one sale per transaction, returning per-sale latencies"""
+    latencies = []
+    for sale in batch:
+        start = time.perf_counter()
+        sales_generator._insert_sale(
+            website_id=sale['website_id'],
+            shop_id=sale['shop_id'],
+            customer_id=sale['customer_id'],
+            subtotal=sale['subtotal'],
+            tax_amount=sale['tax_amount'],
+            total_amount=sale['total_amount'],
+            payment_method=sale['payment_method'],
+            items=sale['items']
+        )
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _write_statement_mode(batch):
+    """Write a batch in one bulk transaction, returning per-sale latencies"""
+    start = time.perf_counter()
+    sales_generator._write_bulk_by_shard(batch)
+    elapsed = time.perf_counter() - start
+    return [elapsed / len(batch)] * len(batch)
+
+
+def run_mode(mode, batches, batch_size):
+    """Run the benchmark for one audit mode"""
+    sales_batches = _build_batches(batches, batch_size)
+    writer = _write_statement_mode if mode == 'statement' else _write_row_mode
+    _top_up_stock(batches * batch_size * 25)
+    
+    audit_before = _audit_row_count()
+    audit_ids = _last_audit_ids()
+    stock_before = _stock_levels()
+    lsn = _wal_lsn()
+    latencies = []
+    for batch in sales_batches:
+        if batch:
+            latencies.extend(writer(batch))
+    wal_bytes = _wal_bytes_since(lsn)
+    audit_rows = _audit_row_count() - audit_before
+    
+    stock_after = _stock_levels()
+    stock_changes = {
+        key: stock_after[key] - stock_before.get(key, 0)
+        for key in stock_after
+        if stock_after[key] != stock_before.get(key, 0)
+    }
+    audited_changes = _audited_stock_changes(audit_ids)
+    
+    sales = len(latencies)
+    latencies.sort()
+    return {
+        'mode': mode,
+        'sales': sales,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0,
+        'wal_bytes': wal_bytes,
+        'wal_bytes_per_sale': wal_bytes / sales if sales else 0.0,
+        'audit_rows': audit_rows,
+        'audit_rows_per_sale': audit_rows / sales if sales else 0.0,
+        'stock_units_sold': -sum(stock_changes.values()),
+        'audit_stock_parity': audited_changes == stock_changes
+    }
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description='Benchmark engine writes per audit mode')
+    parser.add_argument('--batches', type=int, default=20, help='Batches per mode')
+    parser.add_argument('--batch-size', type=int, default=10, help='Sales per batch')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+    
+    results = [run_mode(mode, args.batches, args.batch_size) for mode in ('row', 'statement')]
+    
+    print(f"{'mode':<10} {'sales':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'WAL B/sale':>11} "
+          f"{'audit/sale':>11} {'stock parity':>13}")
+    for r in results:
+        print(f"{r['mode']:<10} {r['sales']:>6} {r['mean_ms']:>9.3f} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} "
+              f"{r['wal_bytes_per_sale']:>11.0f} {r['audit_rows_per_sale']:>11.2f} "
+              f"{'ok' if r['audit_stock_parity'] else 'MISMATCH':>13}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    
+    db.close_all()
+
+
+if __name__ == '__main__':
+    main()
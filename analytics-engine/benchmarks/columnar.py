@@ -0,0 +1,153 @@
+"""
+============================================
+Columnar Store Check
+Made by Hammad Naeem
+============================================
+
+Seeds a throwaway database with history, exports every closed day to a
+temporary columnar store and runs the same full-history aggregates both
+in PostgreSQL and on the memory-mapped columns:
+
+- revenue per website and month (year-over-year)
+- units sold per product and weekday (seasonality)
+- card revenue per hour of day
+
+Prints the time each side took and exits 1 when the results differ. Like
+`python -m benchmarks run`, it needs initdb/pg_ctl (PG_BIN or PATH) and a
+non-root user.
+
+Usage:
+    python -m benchmarks.columnar --sales 1000000 --days 365
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import logging
+
+import psycopg2
+
+from benchmarks.postgres import TemporaryPostgres
+from benchmarks.schema import apply_schema, seed_catalog, seed_sales
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('benchmarks.columnar')
+
+# name -> (SQL returning key columns then rows/sum, columnar aggregate arguments)
+CASES = {
+    'revenue by website and month': (
+        """
+        SELECT website_id, TO_CHAR(sale_date, 'YYYY-MM') as month,
+            COUNT(*) as rows, SUM(total_amount) as total_amount
+        FROM sales
+        WHERE sale_date < CURRENT_DATE
+        GROUP BY 1, 2
+        """,
+        dict(table='sales', by=['website_id', 'month'], values=['total_amount'])
+    ),
+    'units by product and weekday': (
+        """
+        SELECT si.product_id, (EXTRACT(ISODOW FROM s.sale_date)::INTEGER - 1) as weekday,
+            COUNT(*) as rows, SUM(si.quantity) as quantity
+        FROM sale_items si
+        JOIN sales s ON s.id = si.sale_id
+        WHERE s.sale_date < CURRENT_DATE
+        GROUP BY 1, 2
+        """,
+        dict(table='sale_items', by=['product_id', 'weekday'], values=['quantity'])
+    ),
+    'card revenue by hour': (
+        """
+        SELECT EXTRACT(HOUR FROM sale_date)::INTEGER as hour,
+            COUNT(*) as rows, SUM(total_amount) as total_amount
+        FROM sales
+        WHERE sale_date < CURRENT_DATE AND payment_method = 'card'
+        GROUP BY 1
+        """,
+        dict(table='sales', by=['hour'], values=['total_amount'], where={'payment_method': 'card'})
+    ),
+}
+
+
+def _normalize(rows, keys):
+    """Rows as {key tuple: (rows, rounded sum)} for comparison"""
+    result = {}
+    for row in rows:
+        value = [v for k, v in row.items() if k not in keys and k != 'rows'][0]
+        result[tuple(row[k] for k in keys)] = (int(row['rows']), round(float(value), 2))
+    return result
+
+
+def run_checks():
+    """Time each case in PostgreSQL and on the columnar store"""
+    from database.connection import db
+    from analytics.columnar import columnar_store
+
+    start = time.perf_counter()
+    exported = columnar_store.export()
+    export_seconds = time.perf_counter() - start
+
+    results = []
+    for name, (query, arguments) in CASES.items():
+        start = time.perf_counter()
+        sql_rows = db.execute_query(query)
+        sql_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store_rows = columnar_store.aggregate(**arguments)
+        store_seconds = time.perf_counter() - start
+
+        keys = arguments['by']
+        results.append({
+            'case': name,
+            'groups': len(store_rows),
+            'sql_seconds': sql_seconds,
+            'store_seconds': store_seconds,
+            'passed': _normalize(sql_rows, keys) == _normalize(store_rows, keys)
+        })
+    return len(exported), export_seconds, results
+
+
+def main():
+    """Columnar store check entry point"""
+    parser = argparse.ArgumentParser(description='Compare full-history aggregates in PostgreSQL and the columnar store')
+    parser.add_argument('--sales', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    with TemporaryPostgres() as pg, tempfile.TemporaryDirectory() as store_dir:
+        connection = psycopg2.connect(host='127.0.0.1', port=pg.port, dbname=pg.database, user=pg.user)
+        try:
+            apply_schema(connection)
+            seed_catalog(connection)
+            seed_sales(connection, sales=args.sales, days=args.days)
+        finally:
+            connection.close()
+
+        # Settings read the environment on first import, so set it up first
+        os.environ.update(pg.environment())
+        os.environ['COLUMNAR_STORE_DIR'] = store_dir
+
+        logging.getLogger().setLevel(logging.WARNING)
+        from database.connection import db
+        try:
+            days, export_seconds, results = run_checks()
+        finally:
+            db.close_all()
+
+    print(f"\nExported {days} days in {export_seconds:.1f}s")
+    print(f"\n{'case':<32} {'groups':>7} {'sql s':>8} {'store s':>8}  status")
+    for r in results:
+        print(f"{r['case']:<32} {r['groups']:>7} {r['sql_seconds']:>8.3f} {r['store_seconds']:>8.3f}  "
+              f"{'✅' if r['passed'] else '❌'}")
+
+    return 0 if all(r['passed'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+============================================
+Throwaway PostgreSQL Cluster
+Made by Hammad Naeem
+============================================
+
+Creates a temporary PostgreSQL cluster with initdb, starts it on a free
+local port and removes it again when done. The PostgreSQL binaries are
+taken from PG_BIN, or from PATH when PG_BIN is not set. PostgreSQL refuses
+to run as root, so run the benchmarks as an unprivileged user.
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _find_binary(name):
+    """Find a PostgreSQL binary in PG_BIN or PATH"""
+    pg_bin = os.getenv('PG_BIN')
+    if pg_bin:
+        path = os.path.join(pg_bin, name)
+        if os.path.exists(path):
+            return path
+    path = shutil.which(name)
+    if not path:
+        raise RuntimeError(f"PostgreSQL binary '{name}' not found. Set PG_BIN or add it to PATH")
+    return path
+
+
+def _free_port():
+    """Get a free local TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TemporaryPostgres:
+    """Context manager for a throwaway local PostgreSQL cluster"""
+
+    def __init__(self, database='sales_analytics_bench', user='postgres', keep=False):
+        self.database = database
+        self.user = user
+        self.keep = keep
+        self.port = None
+        self.directory = None
+
+    @property
+    def data_dir(self):
+        return os.path.join(self.directory, 'data')
+
+    def start(self):
+        """Create and start the cluster, then create the database"""
+        self.directory = tempfile.mkdtemp(prefix='sales_analytics_pg_')
+        self.port = _free_port()
+
+        logger.info(f"Creating throwaway PostgreSQL cluster in {self.directory}")
+        subprocess.run(
+            [_find_binary('initdb'), '-D', self.data_dir, '-U', self.user, '-A', 'trust', '-E', 'UTF8'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+
+        options = f"-p {self.port} -c listen_addresses=127.0.0.1 -c unix_socket_directories={self.directory}"
+        subprocess.run(
+            [_find_binary('pg_ctl'), '-D', self.data_dir, '-o', options,
+             '-l', os.path.join(self.directory, 'postgres.log'), '-w', 'start'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+
+        subprocess.run(
+            [_find_binary('createdb'), '-h', '127.0.0.1', '-p', str(self.port), '-U', self.user, self.database],
+            check=True
+        )
+        logger.info(f"✅ PostgreSQL running on 127.0.0.1:{self.port}, database {self.database}")
+        return self
+
+    def stop(self):
+        """Stop the cluster and remove its files"""
+        if self.directory is None:
+            return
+        subprocess.run(
+            [_find_binary('pg_ctl'), '-D', self.data_dir, '-m', 'fast', '-w', 'stop'],
+            stdout=subprocess.DEVNULL
+        )
+        if self.keep:
+            logger.info(f"Keeping cluster files in {self.directory}")
+        else:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory = None
+
+    def environment(self):
+        """Environment variables pointing the engine settings at this cluster"""
+        return {
+            'DB_HOST': '127.0.0.1',
+            'DB_PORT': str(self.port),
+            'DB_NAME': self.database,
+            'DB_USER': self.user,
+            'DB_PASSWORD': 'benchmark'
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class TemporaryStandby:
+    """Context manager for a streaming replica of a running TemporaryPostgres"""
+
+    def __init__(self, primary):
+        self.primary = primary
+        self.port = None
+        self.directory = None
+
+    @property
+    def data_dir(self):
+        return os.path.join(self.directory, 'data')
+
+    def start(self):
+        """Clone the primary with pg_basebackup and start it as a hot standby"""
+        self.directory = tempfile.mkdtemp(prefix='sales_analytics_pg_standby_')
+        self.port = _free_port()
+
+        logger.info(f"Creating streaming replica in {self.directory}")
+        subprocess.run(
+            [_find_binary('pg_basebackup'), '-h', '127.0.0.1', '-p', str(self.primary.port),
+             '-U', self.primary.user, '-D', self.data_dir, '-R', '-X', 'stream', '-c', 'fast'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+
+        options = f"-p {self.port} -c listen_addresses=127.0.0.1 -c unix_socket_directories={self.directory}"
+        subprocess.run(
+            [_find_binary('pg_ctl'), '-D', self.data_dir, '-o', options,
+             '-l', os.path.join(self.directory, 'postgres.log'), '-w', 'start'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        logger.info(f"✅ Replica streaming on 127.0.0.1:{self.port}")
+        return self
+
+    def stop(self):
+        """Stop the standby and remove its files"""
+        if self.directory is None:
+            return
+        subprocess.run(
+            [_find_binary('pg_ctl'), '-D', self.data_dir, '-m', 'fast', '-w', 'stop'],
+            stdout=subprocess.DEVNULL
+        )
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory = None
+
+    def dsn(self):
+        """DSN for DB_READ_REPLICAS"""
+        return f"host=127.0.0.1 port={self.port}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,220 @@
+"""
+============================================
+Workload Record and Replay
+Made by Hammad Naeem
+============================================
+
+Records a simulator workload into a trace (see simulation/workload.py)
+without running the engine, and replays a trace against the configured
+database at recorded speed or faster, with several concurrent workers.
+
+Replay re-issues every recorded batch through SalesGenerator.write_sales
+(so the current build's audit mode, sharding and pipeline-free write path
+apply) and every recorded job through the engine's own services, then
+reports latency distributions in the `python -m benchmarks` results format
+so two builds replaying the same trace can be compared with
+`python -m benchmarks compare`.
+
+Sales reference catalog ids only, so replay needs the catalog the trace
+was recorded against; --throwaway records or replays on a fresh local
+cluster seeded with the benchmark catalog (same ids every time).
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+import logging
+
+import psycopg2
+
+from benchmarks.postgres import TemporaryPostgres
+from benchmarks.schema import apply_schema, seed_catalog
+from benchmarks.suite import RESULTS_VERSION, _git_revision, _summarize
+
+logger = logging.getLogger(__name__)
+
+# Simulated schedule of recorded jobs, as main.py runs them: job -> every N seconds
+RECORDED_SCHEDULE = {
+    'aggregate_stats': 5 * 60,
+    'replenish_stock': 30 * 60,
+}
+
+
+@contextmanager
+def throwaway_database(websites=6, products=200, customers=5000):
+    """Fresh local cluster with the benchmark catalog, used through the DB_* environment"""
+    with TemporaryPostgres() as pg:
+        connection = psycopg2.connect(host='127.0.0.1', port=pg.port, dbname=pg.database, user=pg.user)
+        try:
+            apply_schema(connection)
+            seed_catalog(connection, websites=websites, products=products, customers=customers)
+        finally:
+            connection.close()
+        # Settings read the environment on first import, so set it up first
+        os.environ.update(pg.environment())
+        yield pg
+
+
+def record_workload(path, batches, interval, seed=None):
+    """
+    Build `batches` batches of sales without writing them and save them as a trace.
+
+    Batches are spaced `interval` seconds apart in the trace, with the
+    aggregation and stock replenishment jobs at their usual cadence.
+    seed defaults to SIMULATION_SEED.
+    """
+    from config.settings import settings
+    from simulation import patterns
+    from simulation.sales_generator import sales_generator
+    from simulation.workload import WorkloadRecorder
+
+    if seed is None:
+        seed = settings.SIMULATION_SEED
+    patterns.seed(seed)
+    sales_generator.ensure_loaded()
+    now = [0.0]  # simulated seconds since the start of the trace
+    recorder = WorkloadRecorder(path, seed=seed, clock=lambda: now[0])
+    sales_generator.recorder = recorder
+    try:
+        for index in range(batches):
+            now[0] = index * interval
+            for job, every in RECORDED_SCHEDULE.items():
+                if index and now[0] // every != (now[0] - interval) // every:
+                    recorder.record_job(job)
+            recorder.record_job('generate_sales')
+            sales_generator.build_batch()
+    finally:
+        sales_generator.recorder = None
+        recorder.close()
+    return {'sales': recorder.sales, 'jobs': recorder.jobs, 'batches': batches}
+
+
+def _job_runners():
+    """Engine calls replayed for each recorded job"""
+    from analytics.aggregations import aggregations
+    from analytics.snapshots import dashboard_snapshots
+    from simulation.sales_generator import sales_generator
+
+    def aggregate_stats():
+        aggregations.aggregate_hourly_stats()
+        aggregations.aggregate_daily_stats()
+        aggregations.aggregate_hourly_sketches()
+
+    return {
+        'aggregate_stats': aggregate_stats,
+        'dashboard_snapshot': dashboard_snapshots.refresh,
+        'replenish_stock': sales_generator.replenish_stock,
+        'reconcile_customer_stats': aggregations.reconcile_customer_stats,
+    }
+
+
+def _fill_names(events):
+    """Add the product and website names replay writes but traces do not store"""
+    from database.connection import db
+
+    products = {row['id']: row['name'] for row in db.execute_query("SELECT id, name FROM products")}
+    websites = {row['id']: row['name'] for row in db.execute_query("SELECT id, name FROM websites")}
+    missing = set()
+    for kind, _, payload in events:
+        if kind != 'batch':
+            continue
+        for sale in payload:
+            sale['website_name'] = websites.get(sale['website_id'], str(sale['website_id']))
+            for item in sale['items']:
+                name = products.get(item['product_id'])
+                if name is None:
+                    missing.add(item['product_id'])
+                item['product_name'] = name or f"Product {item['product_id']}"
+    if missing:
+        logger.warning(f"⚠️  {len(missing)} traced products are not in this catalog; "
+                       f"their sales will fail (was the trace recorded against another database?)")
+
+
+def replay_workload(path, speed=1.0, concurrency=1):
+    """
+    Re-issue a trace against the configured database.
+
+    speed: 1.0 keeps the recorded timing, 10 runs ten times faster and 0
+    issues everything as fast as the workers allow.
+    """
+    from config.settings import settings
+    from simulation.sales_generator import sales_generator
+    from simulation.workload import read_trace
+
+    header, events = read_trace(path)
+    _fill_names(events)
+    runners = _job_runners()
+
+    latencies = {}  # case -> seconds
+    lags = []
+    failed = {'sales': 0, 'jobs': 0}
+    lock = threading.Lock()
+
+    def run(kind, payload, due):
+        started = time.perf_counter()
+        try:
+            if kind == 'batch':
+                case = 'replay.write_batch'
+                written = sales_generator.write_sales(payload)
+                with lock:
+                    failed['sales'] += len(payload) - written
+            else:
+                case = f'replay.job.{payload}'
+                runners[payload]()
+        except Exception as e:
+            logger.error(f"Replayed {kind} failed: {e}")
+            with lock:
+                failed['jobs' if kind == 'job' else 'sales'] += 1 if kind == 'job' else len(payload)
+        finally:
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.setdefault(case, []).append(elapsed)
+                lags.append(max(0.0, started - due))
+
+    replayed = [event for event in events if event[0] == 'batch' or event[2] in runners]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='replay') as executor:
+        for kind, offset, payload in replayed:
+            due = start + (offset / speed if speed else 0.0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(run, kind, payload, due)
+    duration = time.perf_counter() - start
+
+    sales = sum(len(payload) for kind, _, payload in replayed if kind == 'batch')
+    results = {}
+    for case, samples in sorted(latencies.items()):
+        result = _summarize(samples)
+        result['p99'] = sorted(samples)[max(0, int(round(len(samples) * 0.99)) - 1)]
+        result.update({'unit': 's', 'higher_is_better': False})
+        results[case] = result
+    results['replay.schedule_lag'] = dict(_summarize(lags or [0.0]), unit='s', higher_is_better=False)
+    results['replay.throughput'] = dict(
+        _summarize([(sales - failed['sales']) / duration if duration else 0.0]),
+        unit='sales/s', higher_is_better=True
+    )
+
+    return {
+        'version': RESULTS_VERSION,
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_revision': _git_revision(),
+            'trace': os.path.abspath(path),
+            'trace_recorded_at': datetime.fromtimestamp(header['recorded_at']).isoformat(),
+            'seed': header['seed'],
+            'sales': sales,
+            'batches': sum(1 for event in replayed if event[0] == 'batch'),
+            'jobs': sum(1 for event in replayed if event[0] == 'job'),
+            'speed': speed,
+            'concurrency': concurrency,
+            'audit_mode': settings.AUDIT_MODE,
+            'duration_seconds': duration,
+            'failed_sales': failed['sales'],
+            'failed_jobs': failed['jobs']
+        },
+        'results': results
+    }
@@ -0,0 +1,143 @@
+"""
+============================================
+Read Replica Routing Check
+Made by Hammad Naeem
+============================================
+
+Starts a throwaway primary with a local streaming replica and checks that
+the engine's read-only analytics queries:
+
+1. go to the replica while it keeps up
+2. fall back to the primary once replay is paused and the replica falls
+   further behind than DB_REPLICA_MAX_LAG_SECONDS
+3. return to the replica after replay resumes
+
+and that the realtime stats match the primary in every phase. Prints the
+per-route latency metrics and exits 1 when a phase routes the wrong way.
+Needs initdb/pg_ctl/pg_basebackup (PG_BIN or PATH) and a non-root user.
+
+Usage:
+    python -m benchmarks.replica --batches 5
+"""
+
+import argparse
+import os
+import sys
+import time
+import logging
+
+import psycopg2
+
+from benchmarks.postgres import TemporaryPostgres, TemporaryStandby
+from benchmarks.schema import apply_schema, seed_catalog
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('benchmarks.replica')
+
+MAX_LAG_SECONDS = 1.0
+LAG_CHECK_INTERVAL_SECONDS = 0.2
+
+
+def _set_replay(standby, paused):
+    """Pause or resume WAL replay on the standby"""
+    connection = psycopg2.connect(host='127.0.0.1', port=standby.port, dbname='postgres',
+                                  user=standby.primary.user)
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_wal_replay_pause()" if paused else "SELECT pg_wal_replay_resume()")
+    connection.close()
+
+
+def _run_phase(name, batches, reads):
+    """Generate sales, read the realtime stats and report which route served them"""
+    from database.connection import db
+    from simulation.sales_generator import sales_generator
+    from analytics.realtime import realtime_analytics
+
+    for _ in range(batches):
+        sales_generator.generate_batch()
+    # Let a live replica catch up, or a paused one fall behind the lag bound
+    time.sleep(MAX_LAG_SECONDS + LAG_CHECK_INTERVAL_SECONDS + 0.5)
+
+    before = {route: m['queries'] for route, m in db.route_metrics().items()}
+    matches = 0
+    for _ in range(reads):
+        stats = realtime_analytics.get_current_stats()
+        primary = db.execute_query(
+            "SELECT COUNT(*) as total_sales FROM sales WHERE sale_date::DATE = CURRENT_DATE"
+        )[0]['total_sales']
+        matches += stats['today']['total_sales'] == primary
+    after = db.route_metrics()
+
+    used = {route: m['queries'] - before.get(route, 0) for route, m in after.items()}
+    used = {route: count for route, count in used.items() if count and route != 'default/primary'}
+    return {'phase': name, 'routes': used, 'matches': matches, 'reads': reads}
+
+
+def run_checks(standby, batches, reads):
+    """Run the replica, paused-replay and resumed phases"""
+    results = [_run_phase('replica in sync', batches, reads)]
+
+    _set_replay(standby, paused=True)
+    results.append(_run_phase('replay paused', batches, reads))
+
+    _set_replay(standby, paused=False)
+    results.append(_run_phase('replay resumed', 0, reads))
+
+    expected = ['default/replica-0', 'default/primary-fallback', 'default/replica-0']
+    for result, route in zip(results, expected):
+        result['expected'] = route
+        result['passed'] = list(result['routes']) == [route]
+    # A stale replica may lag behind the primary, but the fallback must not
+    results[1]['passed'] = results[1]['passed'] and results[1]['matches'] == reads
+    return results
+
+
+def main():
+    """Replica check entry point"""
+    parser = argparse.ArgumentParser(description='Check read replica routing on a local streaming replica')
+    parser.add_argument('--batches', type=int, default=5, help='Generation batches per phase')
+    parser.add_argument('--reads', type=int, default=20, help='Realtime reads per phase')
+    args = parser.parse_args()
+
+    with TemporaryPostgres() as pg:
+        connection = psycopg2.connect(host='127.0.0.1', port=pg.port, dbname=pg.database, user=pg.user)
+        try:
+            apply_schema(connection)
+            seed_catalog(connection, websites=4, products=60, customers=500)
+        finally:
+            connection.close()
+
+        with TemporaryStandby(pg) as standby:
+            # Settings read the environment on first import, so set it up first
+            os.environ.update(pg.environment())
+            os.environ['DB_READ_REPLICAS'] = standby.dsn()
+            os.environ['DB_REPLICA_MAX_LAG_SECONDS'] = str(MAX_LAG_SECONDS)
+            os.environ['DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS'] = str(LAG_CHECK_INTERVAL_SECONDS)
+
+            logging.getLogger().setLevel(logging.WARNING)
+            from database.connection import db
+            try:
+                results = run_checks(standby, args.batches, args.reads)
+                metrics = db.route_metrics()
+            finally:
+                db.close_all()
+
+    print(f"\n{'phase':<18} {'expected route':<26} {'routes used':<40} {'stats match':>11}  status")
+    for r in results:
+        routes = ', '.join(f"{route} x{count}" for route, count in r['routes'].items())
+        print(f"{r['phase']:<18} {r['expected']:<26} {routes:<40} {r['matches']:>5}/{r['reads']:<5}  "
+              f"{'✅' if r['passed'] else '❌'}")
+
+    print(f"\n{'route':<28} {'queries':>8} {'avg ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for route, m in sorted(metrics.items()):
+        print(f"{route:<28} {m['queries']:>8} {m['avg_ms']:>8.2f} {m['p95_ms']:>8.2f} {m['max_ms']:>8.2f}")
+
+    return 0 if all(r['passed'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
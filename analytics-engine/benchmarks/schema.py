@@ -0,0 +1,256 @@
+"""
+============================================
+Benchmark Schema and Seed Data
+Made by Hammad Naeem
+============================================
+
+Applies the schema that backend/database/init.js creates (tables, triggers,
+stored procedures and views are read straight out of init.js so the two can
+never drift apart) and seeds a configurable volume of catalog and sales data.
+"""
+
+import re
+import time
+from pathlib import Path
+import logging
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+INIT_JS_PATH = Path(__file__).resolve().parent.parent.parent / 'backend' / 'database' / 'init.js'
+
+# SQL blocks in init.js, in the order initializeDatabase() runs them
+SQL_BLOCKS = ['schemaSQL', 'triggersSQL', 'proceduresSQL', 'viewsSQL']
+
+UUID_EXTENSION_SQL = 'CREATE EXTENSION IF NOT EXISTS "uuid-ossp";'
+
+# Used when the local PostgreSQL build ships without contrib (PostgreSQL 13+)
+UUID_FALLBACK_SQL = """
+    CREATE OR REPLACE FUNCTION uuid_generate_v4()
+    RETURNS UUID AS $$ SELECT gen_random_uuid() $$ LANGUAGE sql VOLATILE;
+"""
+
+
+def load_init_sql(path=INIT_JS_PATH):
+    """Extract the SQL blocks from init.js"""
+    source = Path(path).read_text(encoding='utf-8')
+    blocks = []
+    for name in SQL_BLOCKS:
+        match = re.search(r"const %s = `(.*?)`;" % name, source, re.S)
+        if not match:
+            raise RuntimeError(f"Could not find {name} in {path}")
+        blocks.append((name, match.group(1)))
+    return blocks
+
+
+def apply_schema(connection):
+    """Apply the init.js schema to an empty database"""
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(UUID_EXTENSION_SQL)
+        except psycopg2.Error:
+            logger.warning("uuid-ossp extension not available, using gen_random_uuid() instead")
+            cursor.execute(UUID_FALLBACK_SQL)
+
+        for name, sql in load_init_sql():
+            cursor.execute(sql.replace(UUID_EXTENSION_SQL, ''))
+            logger.info(f"Applied {name} from init.js")
+
+
+def seed_catalog(connection, websites=6, shops_per_website=2, products=200, customers=5000):
+    """Seed websites, shops, products and customers"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO websites (name, url, category)
+            SELECT 'Bench Website ' || g, 'https://bench-' || g || '.example', 'Benchmark'
+            FROM generate_series(1, %s) g
+        """, (websites,))
+
+        cursor.execute("""
+            INSERT INTO shops (website_id, name, city)
+            SELECT w.id, 'Bench Shop ' || w.id || '-' || g, 'Lahore'
+            FROM websites w
+            CROSS JOIN generate_series(1, %s) g
+        """, (shops_per_website,))
+
+        cursor.execute("""
+            INSERT INTO products (sku, name, unit_price, cost_price, stock_quantity, reorder_level)
+            SELECT
+                'BENCH-' || LPAD(g::TEXT, 6, '0'),
+                'Bench Product ' || g,
+                ROUND((100 + random() * 49900)::NUMERIC, 2),
+                50,
+                1000000,
+                10
+            FROM generate_series(1, %s) g
+        """, (products,))
+
+        # Every product is listed on its "home" website and on the next one
+        cursor.execute("""
+            INSERT INTO website_products (website_id, product_id)
+            SELECT w.id, p.id
+            FROM products p
+            JOIN websites w ON (p.id %% %s) IN ((w.id - 1) %% %s, w.id %% %s)
+            ON CONFLICT (website_id, product_id) DO NOTHING
+        """, (websites, websites, websites))
+
+        cursor.execute("""
+            INSERT INTO customers (email, first_name, last_name, city)
+            SELECT 'customer' || g || '@bench.example', 'Customer', g::TEXT, 'Karachi'
+            FROM generate_series(1, %s) g
+        """, (customers,))
+
+    logger.info(f"Seeded {websites} websites, {websites * shops_per_website} shops, "
+                f"{products} products, {customers} customers")
+
+
+def seed_sales(connection, sales, days=90, chunk_size=250000):
+    """
+    Seed historical sales and sale items spread over the last `days` days.
+
+    Triggers are disabled while seeding (session_replication_role = replica),
+    so no audit rows, stock or customer updates are written for seed data.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM websites")
+        websites = cursor.fetchone()[0]
+        cursor.execute("SELECT MIN(id), COUNT(*) FROM shops")
+        first_shop, shops = cursor.fetchone()
+        shops_per_website = shops // websites
+        cursor.execute("SELECT COUNT(*) FROM products")
+        products = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM customers")
+        customers = cursor.fetchone()[0]
+
+        cursor.execute("SET session_replication_role = replica")
+        cursor.execute("SET synchronous_commit = off")
+
+        start_time = time.perf_counter()
+        for start in range(1, sales + 1, chunk_size):
+            end = min(start + chunk_size - 1, sales)
+            cursor.execute("""
+                WITH new_sales AS MATERIALIZED (
+                    SELECT
+                        g,
+                        uuid_generate_v4() AS id,
+                        website_id,
+                        %(first_shop)s + (website_id - 1) * %(shops_per_website)s
+                            + FLOOR(random() * %(shops_per_website)s)::INTEGER AS shop_id,
+                        CASE WHEN random() < 0.6
+                            THEN 1 + FLOOR(random() * %(customers)s)::INTEGER
+                        END AS customer_id,
+                        1 + FLOOR(random() * 3)::INTEGER AS item_count,
+                        (ARRAY['cash', 'card', 'bank_transfer', 'online'])[1 + FLOOR(random() * 4)::INTEGER] AS payment_method,
+                        CURRENT_TIMESTAMP - random() * (%(days)s * INTERVAL '1 day') AS sale_date
+                    FROM (
+                        SELECT g, 1 + FLOOR(random() * %(websites)s)::INTEGER AS website_id
+                        FROM generate_series(%(start)s, %(end)s) g
+                    ) base
+                ),
+                items AS MATERIALIZED (
+                    SELECT
+                        ns.id AS sale_id,
+                        p.id AS product_id,
+                        p.name AS product_name,
+                        1 + FLOOR(random() * 3)::INTEGER AS quantity,
+                        p.unit_price,
+                        ns.sale_date
+                    FROM new_sales ns
+                    CROSS JOIN LATERAL generate_series(1, ns.item_count) i
+                    JOIN products p ON p.id = 1 + ((ns.g * 31 + i * 17) %% %(products)s)
+                ),
+                totals AS (
+                    SELECT sale_id, SUM(quantity * unit_price) AS subtotal
+                    FROM items
+                    GROUP BY sale_id
+                ),
+                inserted_items AS (
+                    INSERT INTO sale_items (
+                        sale_id, product_id, product_name,
+                        quantity, unit_price, line_total, created_at
+                    )
+                    SELECT sale_id, product_id, product_name,
+                        quantity, unit_price, quantity * unit_price, sale_date
+                    FROM items
+                )
+                INSERT INTO sales (
+                    id, sale_number, website_id, shop_id, customer_id,
+                    subtotal, tax_amount, total_amount,
+                    payment_method, payment_status, order_status, notes,
+                    sale_date, created_at
+                )
+                SELECT
+                    ns.id, 'B' || LPAD(ns.g::TEXT, 10, '0'), ns.website_id, ns.shop_id, ns.customer_id,
+                    t.subtotal, ROUND(t.subtotal * 0.17, 2), ROUND(t.subtotal * 1.17, 2),
+                    ns.payment_method, 'completed', 'completed', 'Benchmark seed',
+                    ns.sale_date, ns.sale_date
+                FROM new_sales ns
+                JOIN totals t ON t.sale_id = ns.id
+            """, {
+                'start': start, 'end': end, 'days': days,
+                'websites': websites, 'first_shop': first_shop,
+                'shops_per_website': shops_per_website,
+                'products': products, 'customers': customers
+            })
+            logger.info(f"Seeded sales {start}-{end} of {sales}")
+
+        cursor.execute("SET session_replication_role = DEFAULT")
+        cursor.execute("ANALYZE")
+
+    logger.info(f"Seeded {sales} sales in {time.perf_counter() - start_time:.1f}s")
+
+
+def seed_rollups(connection):
+    """Build sales_hourly_stats and sales_daily_stats for the whole seeded history"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO sales_hourly_stats (
+                website_id, shop_id, stat_date, stat_hour,
+                total_sales, total_revenue, total_items_sold, average_order_value
+            )
+            SELECT
+                s.website_id,
+                s.shop_id,
+                s.sale_date::DATE,
+                EXTRACT(HOUR FROM s.sale_date)::INTEGER,
+                COUNT(*)::INTEGER,
+                SUM(s.total_amount),
+                COALESCE(SUM(si.items), 0)::INTEGER,
+                AVG(s.total_amount)
+            FROM sales s
+            LEFT JOIN (
+                SELECT sale_id, SUM(quantity) as items
+                FROM sale_items
+                GROUP BY sale_id
+            ) si ON si.sale_id = s.id
+            GROUP BY s.website_id, s.shop_id, s.sale_date::DATE, EXTRACT(HOUR FROM s.sale_date)
+            ON CONFLICT (website_id, shop_id, stat_date, stat_hour) DO NOTHING
+        """)
+        cursor.execute("""
+            INSERT INTO sales_daily_stats (
+                website_id, stat_date,
+                total_sales, total_revenue, total_items_sold,
+                unique_customers, average_order_value
+            )
+            SELECT
+                s.website_id,
+                s.sale_date::DATE,
+                COUNT(*)::INTEGER,
+                SUM(s.total_amount),
+                COALESCE(SUM(si.items), 0)::INTEGER,
+                COUNT(DISTINCT s.customer_id)::INTEGER,
+                AVG(s.total_amount)
+            FROM sales s
+            LEFT JOIN (
+                SELECT sale_id, SUM(quantity) as items
+                FROM sale_items
+                GROUP BY sale_id
+            ) si ON si.sale_id = s.id
+            GROUP BY s.website_id, s.sale_date::DATE
+            ON CONFLICT (website_id, stat_date) DO NOTHING
+        """)
+        cursor.execute("ANALYZE sales_hourly_stats")
+        cursor.execute("ANALYZE sales_daily_stats")
+    logger.info("Seeded hourly and daily rollups")
@@ -0,0 +1,198 @@
+"""
+============================================
+Website Sharding Check
+Made by Hammad Naeem
+============================================
+
+Runs the engine against several databases in one throwaway local
+PostgreSQL cluster (one database per shard, websites spread round-robin)
+and checks that:
+
+- every sale lands on the shard its website is mapped to, in both audit modes
+- each shard's hourly stats only cover its own websites
+- the scatter-gathered realtime stats, rankings, hourly breakdown, top
+  products and dashboard snapshot match totals computed directly on each shard
+- forecasts for every shard's websites land on the default database
+- retention purges old audit rows on every shard
+
+Exits 1 when any check fails. Like `python -m benchmarks run`, it needs
+initdb/pg_ctl (PG_BIN or PATH) and a non-root user.
+
+Usage:
+    python -m benchmarks.sharding --shards 3 --batches 10
+"""
+
+import argparse
+import json
+import os
+import sys
+import logging
+
+import psycopg2
+
+from benchmarks.postgres import TemporaryPostgres
+from benchmarks.schema import apply_schema, seed_catalog
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('benchmarks.sharding')
+
+
+def _create_shards(pg, shards, websites):
+    """Create one database per extra shard and map websites round-robin"""
+    admin = psycopg2.connect(host='127.0.0.1', port=pg.port, dbname=pg.database, user=pg.user)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        for index in range(1, shards):
+            cursor.execute(f"CREATE DATABASE {pg.database}_shard_{index}")
+    admin.close()
+
+    config = []
+    for index in range(1, shards):
+        config.append({
+            'name': f'shard_{index}',
+            'database': f'{pg.database}_shard_{index}',
+            'websites': [w for w in range(1, websites + 1) if w % shards == index]
+        })
+
+    # Every shard gets the schema and the same catalog (ids match across shards)
+    for database in [pg.database] + [entry['database'] for entry in config]:
+        connection = psycopg2.connect(host='127.0.0.1', port=pg.port, dbname=database, user=pg.user)
+        try:
+            apply_schema(connection)
+            seed_catalog(connection, websites=websites, products=60, customers=500)
+        finally:
+            connection.close()
+    return config
+
+
+def _direct_totals(db):
+    """Per-shard sales computed directly on each shard"""
+    return db.scatter_query("""
+        SELECT website_id, COUNT(*) as sales, COALESCE(SUM(total_amount), 0) as revenue
+        FROM sales
+        WHERE sale_date::DATE = CURRENT_DATE
+        GROUP BY website_id
+    """)
+
+
+def run_checks(batches):
+    """Generate sales in both audit modes and compare merged reads with direct totals"""
+    from config.settings import settings
+    from database.connection import db
+    from simulation.sales_generator import sales_generator
+    from analytics.aggregations import aggregations
+    from analytics.realtime import realtime_analytics
+    from analytics.snapshots import dashboard_snapshots
+    from analytics.forecasting import sales_forecaster
+    from maintenance.retention import RetentionManager
+
+    for mode in ('row', 'statement'):
+        settings.AUDIT_MODE = mode
+        for _ in range(batches):
+            sales_generator.generate_batch()
+    aggregations.aggregate_hourly_stats()
+
+    checks = []
+
+    def check(name, passed, detail=''):
+        checks.append((name, passed, detail))
+
+    direct = _direct_totals(db)
+    misplaced = [
+        (shard, row['website_id'])
+        for shard, rows in direct.items()
+        for row in rows
+        if db.shard_for(row['website_id']) != shard
+    ]
+    check('sales routed to their shard', not misplaced, f"misplaced {misplaced}" if misplaced else '')
+
+    hourly = db.scatter_query("SELECT DISTINCT website_id FROM sales_hourly_stats")
+    misplaced = [(shard, row['website_id']) for shard, rows in hourly.items()
+                 for row in rows if db.shard_for(row['website_id']) != shard]
+    check('hourly stats stay on their shard', not misplaced, f"misplaced {misplaced}" if misplaced else '')
+
+    total_sales = sum(row['sales'] for rows in direct.values() for row in rows)
+    total_revenue = sum(row['revenue'] for rows in direct.values() for row in rows)
+    per_shard = {shard: sum(row['sales'] for row in rows) for shard, rows in direct.items()}
+
+    today = realtime_analytics.get_current_stats()['today']
+    check('current stats match shard totals',
+          today['total_sales'] == total_sales and today['total_revenue'] == total_revenue,
+          f"{today['total_sales']} sales vs {total_sales} ({per_shard})")
+
+    expected = {row['website_id']: row['sales'] for rows in direct.values() for row in rows}
+    rankings = {row['id']: row['total_sales'] for row in realtime_analytics.get_website_rankings()}
+    check('website rankings match shard totals',
+          all(rankings.get(website_id) == sales for website_id, sales in expected.items()),
+          f"{len(rankings)} websites ranked")
+
+    hourly_total = sum(hour['sales'] for hour in realtime_analytics.get_hourly_breakdown().values())
+    check('hourly breakdown adds up', hourly_total == total_sales, f"{hourly_total} sales")
+
+    sold = db.scatter_query("SELECT COALESCE(SUM(quantity), 0) as sold FROM sale_items")
+    sold_total = sum(rows[0]['sold'] for rows in sold.values())
+    top_total = sum(row['total_sold'] for row in aggregations.get_top_products(limit=1000, days=1))
+    check('top products merge every shard', top_total == sold_total, f"{top_total} units")
+
+    dashboard_snapshots.refresh()
+    snapshot = db.execute_query(
+        "SELECT payload FROM dashboard_snapshots WHERE snapshot_key = 'dashboard'"
+    )[0]['payload']
+    check('dashboard snapshot merges every shard',
+          snapshot['today']['totalSales'] == total_sales and snapshot['counts']['recentSales'] == total_sales,
+          f"{snapshot['today']['totalSales']} sales today, {snapshot['counts']['recentSales']} in the last hour")
+
+    aggregations.aggregate_daily_stats()
+    sales_forecaster.refresh()
+    forecasts = db.execute_query("SELECT COUNT(DISTINCT website_id) as websites FROM sales_forecasts")[0]['websites']
+    check('forecasts stored on the default database', forecasts == len(expected),
+          f"{forecasts} of {len(expected)} websites")
+
+    db.scatter_query(
+        "UPDATE audit_logs SET created_at = created_at - INTERVAL '200 days' WHERE id % 2 = 0", fetch=False
+    )
+    purged = RetentionManager(hourly_stats_days=0, sales_days=0, audit_log_days=90, chunk_pause=0).run()
+    old = db.scatter_query("SELECT COUNT(*) as count FROM audit_logs WHERE created_at < NOW() - INTERVAL '90 days'")
+    left = sum(rows[0]['count'] for rows in old.values())
+    check('retention purges every shard', left == 0, f"{purged['audit_logs']['rows']} audit rows purged, {left} left")
+
+    return checks
+
+
+def main():
+    """Sharding check entry point"""
+    parser = argparse.ArgumentParser(description='Check website-sharded routing on local databases')
+    parser.add_argument('--shards', type=int, default=3, help='Databases, including the default one')
+    parser.add_argument('--websites', type=int, default=6)
+    parser.add_argument('--batches', type=int, default=10, help='Generation batches per audit mode')
+    parser.add_argument('--keep-cluster', action='store_true', help='Keep the cluster files after the run')
+    args = parser.parse_args()
+
+    with TemporaryPostgres(keep=args.keep_cluster) as pg:
+        shard_config = _create_shards(pg, args.shards, args.websites)
+
+        # Settings read the environment on first import, so set it up first
+        os.environ.update(pg.environment())
+        os.environ['DB_SHARDS'] = json.dumps(shard_config)
+        os.environ['ENABLE_WRITE_PIPELINE'] = 'false'
+
+        logging.getLogger().setLevel(logging.WARNING)
+        try:
+            checks = run_checks(args.batches)
+        finally:
+            from database.connection import db
+            db.close_all()
+
+    print(f"\n{'check':<40} status")
+    for name, passed, detail in checks:
+        print(f"{name:<40} {'✅' if passed else '❌'}  {detail}")
+
+    failed = [name for name, passed, _ in checks if not passed]
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+============================================
+Engine Benchmark Suite
+Made by Hammad Naeem
+============================================
+
+Spins up a throwaway PostgreSQL cluster, applies the init.js schema, seeds
+the requested data volume and times the engine's own code paths:
+
+- sales generation throughput (SalesGenerator.generate_batch)
+- each aggregation job
+- each realtime query
+- catalog reload
+
+Results are written as JSON so two runs can be compared with
+`python -m benchmarks compare`.
+"""
+
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+import logging
+
+import psycopg2
+
+from benchmarks.postgres import TemporaryPostgres
+from benchmarks.schema import apply_schema, seed_catalog, seed_sales, seed_rollups
+
+logger = logging.getLogger(__name__)
+
+RESULTS_VERSION = 1
+
+
+def _git_revision():
+    """Get the current git revision, if available"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summarize(samples):
+    """Summarize timing samples (seconds)"""
+    ordered = sorted(samples)
+    return {
+        'samples': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.mean(ordered),
+        'p95': ordered[max(0, int(round(len(ordered) * 0.95)) - 1)],
+        'max': ordered[-1]
+    }
+
+
+def time_call(func, repeats, warmup=1):
+    """Time func over `repeats` runs after `warmup` untimed runs"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    result = _summarize(samples)
+    result.update({'unit': 's', 'higher_is_better': False})
+    return result
+
+
+def time_generation(sales_generator, batches):
+    """Measure sales generation throughput in sales per second"""
+    generated = 0
+    samples = []
+    for _ in range(batches):
+        start = time.perf_counter()
+        count = sales_generator.generate_batch()
+        elapsed = time.perf_counter() - start
+        generated += count
+        if count:
+            samples.append(count / elapsed)
+    result = _summarize(samples or [0.0])
+    result.update({'unit': 'sales/s', 'higher_is_better': True, 'sales_generated': generated})
+    return result
+
+
+def run_cases(repeats, generation_batches):
+    """Time every engine code path against the configured database"""
+    # Engine modules read settings at import, so import them only after the
+    # environment points at the benchmark database
+    from simulation.sales_generator import sales_generator
+    from analytics.aggregations import aggregations
+    from analytics.realtime import realtime_analytics
+
+    results = {}
+
+    logger.info("Timing sales generation...")
+    results['generation.generate_batch'] = time_generation(sales_generator, generation_batches)
+
+    cases = {
+        'aggregation.aggregate_hourly_stats': aggregations.aggregate_hourly_stats,
+        'aggregation.aggregate_daily_stats': aggregations.aggregate_daily_stats,
+        'aggregation.get_top_products': aggregations.get_top_products,
+        'realtime.get_current_stats': realtime_analytics.get_current_stats,
+        'realtime.get_website_rankings': realtime_analytics.get_website_rankings,
+        'realtime.get_hourly_breakdown': realtime_analytics.get_hourly_breakdown,
+        'catalog.reload_data': sales_generator.reload_data,
+    }
+    for name, func in cases.items():
+        logger.info(f"Timing {name}...")
+        results[name] = time_call(func, repeats)
+
+    return results
+
+
+def run_suite(sales=100000, days=90, websites=6, products=200, customers=5000,
+              repeats=5, generation_batches=20, keep_cluster=False, quiet=True):
+    """Run the full benchmark suite on a throwaway cluster and return the results"""
+    with TemporaryPostgres(keep=keep_cluster) as pg:
+        os.environ.update(pg.environment())
+
+        connection = psycopg2.connect(
+            host='127.0.0.1', port=pg.port, dbname=pg.database, user=pg.user
+        )
+        try:
+            seed_start = time.perf_counter()
+            apply_schema(connection)
+            seed_catalog(connection, websites=websites, products=products, customers=customers)
+            seed_sales(connection, sales=sales, days=days)
+            seed_rollups(connection)
+            seed_seconds = time.perf_counter() - seed_start
+
+            with connection.cursor() as cursor:
+                cursor.execute("SHOW server_version")
+                server_version = cursor.fetchone()[0]
+        finally:
+            connection.close()
+
+        # The engine logs every generated sale; keep benchmark output readable
+        if quiet:
+            logging.getLogger().setLevel(logging.WARNING)
+
+        try:
+            results = run_cases(repeats, generation_batches)
+        finally:
+            from database.connection import db
+            db.close_all()
+
+    return {
+        'version': RESULTS_VERSION,
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'postgres': server_version,
+            'sales': sales,
+            'days': days,
+            'websites': websites,
+            'products': products,
+            'customers': customers,
+            'repeats': repeats,
+            'generation_batches': generation_batches,
+            'seed_seconds': seed_seconds
+        },
+        'results': results
+    }
+
+
+def compare_results(baseline, candidate, threshold=0.10, metric='median'):
+    """
+    Compare two result sets.
+
+    A case regresses when the candidate is worse than the baseline by more
+    than `threshold` (a fraction) on `metric`, taking the case's direction
+    (lower-is-better latency vs higher-is-better throughput) into account.
+    """
+    rows = []
+    for name, base in baseline['results'].items():
+        new = candidate['results'].get(name)
+        if new is None:
+            rows.append({'case': name, 'status': 'missing'})
+            continue
+
+        base_value = base[metric]
+        new_value = new[metric]
+        change = (new_value - base_value) / base_value if base_value else 0.0
+        worse = -change if base.get('higher_is_better') else change
+
+        if worse > threshold:
+            status = 'regression'
+        elif worse < -threshold:
+            status = 'improvement'
+        else:
+            status = 'ok'
+
+        rows.append({
+            'case': name,
+            'unit': base.get('unit', 's'),
+            'baseline': base_value,
+            'candidate': new_value,
+            'change': change,
+            'status': status
+        })
+
+    for name in candidate['results']:
+        if name not in baseline['results']:
+            rows.append({'case': name, 'status': 'new'})
+
+    return rows
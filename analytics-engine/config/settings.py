@@ -6,6 +6,7 @@ Made by Hammad Naeem
 """
 
 import os
+import json
 from dotenv import load_dotenv
 from pathlib import Path
 import logging
@@ -16,6 +17,28 @@ logger = logging.getLogger(__name__)
 env_path = Path(__file__).resolve().parent.parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
+DEFAULT_SHARD = 'default'
+
+
+def _load_shards(raw):
+    """Parse DB_SHARDS (a JSON list of shard objects)"""
+    if not raw.strip():
+        return []
+    try:
+        shards = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"DB_SHARDS is not valid JSON: {e}")
+    
+    names = set()
+    for shard in shards:
+        name = shard.get('name')
+        if not name or name == DEFAULT_SHARD or name in names:
+            raise ValueError(f"DB_SHARDS: every shard needs a unique name other than '{DEFAULT_SHARD}'")
+        names.add(name)
+        shard['websites'] = [int(website_id) for website_id in shard.get('websites', [])]
+    return shards
+
+
 class Settings:
     """Application settings loaded from environment variables"""
     
@@ -26,9 +49,107 @@ class Settings:
     DB_USER = os.getenv('DB_USER', 'postgres')
     DB_PASSWORD = os.getenv('DB_PASSWORD', '')
     
+    # Website sharding: JSON list of shards such as
+    # [{"name": "east", "database": "sales_east", "websites": [1, 2]}].
+    # host/port/database/user/password default to the DB_* values above;
+    # websites that no shard lists stay on the default (DB_*) database.
+    DB_SHARDS = _load_shards(os.getenv('DB_SHARDS', ''))
+    
+    # Read replicas for the default database: libpq DSNs separated by ';'
+    # (e.g. "host=10.0.0.6 port=5432"); unset keys default to the DB_* values.
+    # Shards list their own under "replicas". Read-only queries go to a
+    # replica unless its replication lag exceeds DB_REPLICA_MAX_LAG_SECONDS.
+    DB_READ_REPLICAS = [dsn.strip() for dsn in os.getenv('DB_READ_REPLICAS', '').split(';') if dsn.strip()]
+    DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', 5))
+    DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS', 5))
+    
     # Simulation settings
     SIMULATION_INTERVAL = int(os.getenv('SIMULATION_INTERVAL_SECONDS', 60))
     ENABLE_SIMULATION = os.getenv('ENABLE_SIMULATION', 'true').lower() == 'true'
+    # Seed for the simulator's random choices (unset = different every run)
+    SIMULATION_SEED = int(os.getenv('SIMULATION_SEED')) if os.getenv('SIMULATION_SEED') else None
+
+    # Audit mode for engine writes: 'row' (per-row triggers, one sale per
+    # transaction) or 'statement' (bulk batch writes audited by the
+    # statement-level triggers)
+    AUDIT_MODE = os.getenv('ENGINE_AUDIT_MODE', 'row').lower()
+
+    # Customer stats for bulk engine writes: 'trigger' (per-sale trigger) or
+    # 'batch' (one set-based UPDATE of per-customer deltas per batch).
+    # Only bulk writes (AUDIT_MODE 'statement') batch their customer stats.
+    CUSTOMER_STATS_MODE = os.getenv('CUSTOMER_STATS_MODE', 'trigger').lower()
+    CUSTOMER_STATS_RECONCILE_MINUTES = int(os.getenv('CUSTOMER_STATS_RECONCILE_MINUTES', 60))
+
+    # Dashboard snapshots are refreshed often enough to never be older than this
+    DASHBOARD_SNAPSHOT_MAX_STALENESS = int(os.getenv('DASHBOARD_SNAPSHOT_MAX_STALENESS_SECONDS', 120))
+
+    # Write-behind pipeline: generated sales are queued and written by
+    # background writer threads in size/time bounded flushes
+    ENABLE_WRITE_PIPELINE = os.getenv('ENABLE_WRITE_PIPELINE', 'false').lower() == 'true'
+    WRITE_PIPELINE_QUEUE_SIZE = int(os.getenv('WRITE_PIPELINE_QUEUE_SIZE', 1000))
+    WRITE_PIPELINE_FLUSH_SIZE = int(os.getenv('WRITE_PIPELINE_FLUSH_SIZE', 50))
+    WRITE_PIPELINE_FLUSH_INTERVAL = float(os.getenv('WRITE_PIPELINE_FLUSH_INTERVAL_SECONDS', 1.0))
+    WRITE_PIPELINE_WRITERS = int(os.getenv('WRITE_PIPELINE_WRITERS', 1))
+    WRITE_PIPELINE_PUT_TIMEOUT = float(os.getenv('WRITE_PIPELINE_PUT_TIMEOUT_SECONDS', 5.0))
+    
+    # Retention (a policy of 0 days is disabled): hourly stats (and their
+    # sketches) are downsampled into sales_daily_stats, raw sales/sale_items
+    # are archived to gzip files under RETENTION_ARCHIVE_DIR, and audit logs
+    # are purged in chunks
+    ENABLE_RETENTION = os.getenv('ENABLE_RETENTION', 'false').lower() == 'true'
+    RETENTION_RUN_AT = os.getenv('RETENTION_RUN_AT', '03:00')
+    RETENTION_HOURLY_STATS_DAYS = int(os.getenv('RETENTION_HOURLY_STATS_DAYS', 90))
+    RETENTION_SALES_DAYS = int(os.getenv('RETENTION_SALES_DAYS', 365))
+    RETENTION_AUDIT_LOG_DAYS = int(os.getenv('RETENTION_AUDIT_LOG_DAYS', 90))
+    RETENTION_ARCHIVE_DIR = os.getenv(
+        'RETENTION_ARCHIVE_DIR',
+        str(Path(__file__).resolve().parent.parent / 'archive')
+    )
+    RETENTION_CHUNK_SIZE = int(os.getenv('RETENTION_CHUNK_SIZE', 5000))
+    RETENTION_CHUNK_PAUSE = float(os.getenv('RETENTION_CHUNK_PAUSE_SECONDS', 0.05))
+    
+    # Streaming top products per website (last hour, today, 30 days): counters
+    # per time bucket, and how often changed buckets are checkpointed to the DB
+    ENABLE_TOP_PRODUCTS = os.getenv('ENABLE_TOP_PRODUCTS', 'true').lower() == 'true'
+    TOP_PRODUCTS_CAPACITY = int(os.getenv('TOP_PRODUCTS_CAPACITY', 100))
+    TOP_PRODUCTS_CHECKPOINT_SECONDS = int(os.getenv('TOP_PRODUCTS_CHECKPOINT_SECONDS', 60))
+    
+    # Sales forecasts per website (next 24 hours, next 7 days): refreshed every
+    # hour at FORECAST_RUN_AT from the closed hours and days, with the models'
+    # parameters searched again every FORECAST_REFIT_HOURS
+    ENABLE_FORECASTING = os.getenv('ENABLE_FORECASTING', 'true').lower() == 'true'
+    FORECAST_RUN_AT = os.getenv('FORECAST_RUN_AT', ':10')
+    FORECAST_HISTORY_DAYS = int(os.getenv('FORECAST_HISTORY_DAYS', 56))
+    FORECAST_PROFILE_DAYS = int(os.getenv('FORECAST_PROFILE_DAYS', 28))
+    FORECAST_REFIT_HOURS = int(os.getenv('FORECAST_REFIT_HOURS', 24))
+    
+    # In-memory prefix sums over hourly stats per website, answering range
+    # totals and hour/weekday histograms without SQL (extended after each
+    # aggregation run, starting RANGE_INDEX_HISTORY_DAYS back, or
+    # RETENTION_HOURLY_STATS_DAYS back if less and retention is enabled)
+    ENABLE_RANGE_INDEX = os.getenv('ENABLE_RANGE_INDEX', 'true').lower() == 'true'
+    RANGE_INDEX_HISTORY_DAYS = int(os.getenv('RANGE_INDEX_HISTORY_DAYS', 365))
+    
+    # Columnar snapshot store: closed days of sales/sale_items exported daily
+    # as .npy columns for long-range analysis off the database (run it before
+    # retention so archived days are exported first)
+    ENABLE_COLUMNAR_EXPORT = os.getenv('ENABLE_COLUMNAR_EXPORT', 'false').lower() == 'true'
+    COLUMNAR_EXPORT_RUN_AT = os.getenv('COLUMNAR_EXPORT_RUN_AT', '02:30')
+    COLUMNAR_STORE_DIR = os.getenv(
+        'COLUMNAR_STORE_DIR',
+        str(Path(__file__).resolve().parent.parent / 'columnar')
+    )
+    
+    # Per-statement latency stats; statements slower than the threshold are
+    # logged and a sample is explained (at most once per statement per interval)
+    ENABLE_QUERY_STATS = os.getenv('ENABLE_QUERY_STATS', 'true').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 500))
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1))
+    SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS', 300))
+    SLOW_QUERY_DIR = os.getenv(
+        'SLOW_QUERY_DIR',
+        str(Path(__file__).resolve().parent.parent / 'slow_queries')
+    )
     
     # Sales patterns
     SALES_PER_MINUTE_MIN = 1
@@ -65,15 +186,48 @@ class Settings:
         return f"host={cls.DB_HOST} port={cls.DB_PORT} dbname={cls.DB_NAME} user={cls.DB_USER} password={cls.DB_PASSWORD}"
     
     @classmethod
-    def get_db_config(cls):
+    def get_db_config(cls, shard=DEFAULT_SHARD):
         """Get database configuration dictionary"""
-        return {
+        config = {
             'host': cls.DB_HOST,
             'port': cls.DB_PORT,
             'database': cls.DB_NAME,
             'user': cls.DB_USER,
             'password': cls.DB_PASSWORD
         }
+        if shard == DEFAULT_SHARD:
+            return config
+        
+        for entry in cls.DB_SHARDS:
+            if entry['name'] == shard:
+                config.update({key: entry[key] for key in config if key in entry})
+                config['port'] = int(config['port'])
+                return config
+        raise KeyError(f"Unknown database shard '{shard}'")
+    
+    @classmethod
+    def get_replica_dsns(cls, shard=DEFAULT_SHARD):
+        """Read replica DSNs for a shard"""
+        if shard == DEFAULT_SHARD:
+            return cls.DB_READ_REPLICAS
+        for entry in cls.DB_SHARDS:
+            if entry['name'] == shard:
+                return entry.get('replicas', [])
+        raise KeyError(f"Unknown database shard '{shard}'")
+    
+    @classmethod
+    def get_shard_names(cls):
+        """Names of every database shard, the default one first"""
+        return [DEFAULT_SHARD] + [entry['name'] for entry in cls.DB_SHARDS]
+    
+    @classmethod
+    def get_shard_map(cls):
+        """website_id -> shard name for websites placed on a shard"""
+        return {
+            website_id: entry['name']
+            for entry in cls.DB_SHARDS
+            for website_id in entry['websites']
+        }
     
     @classmethod
     def print_db_config_summary(cls):
@@ -84,6 +238,12 @@ class Settings:
         logger.info(f"  Database: {cls.DB_NAME}")
         logger.info(f"  User: {cls.DB_USER}")
         logger.info(f"  Password: {'*' * len(cls.DB_PASSWORD) if cls.DB_PASSWORD else 'NOT SET'}")
+        if cls.DB_READ_REPLICAS:
+            logger.info(f"  Read replicas: {len(cls.DB_READ_REPLICAS)} (max lag {cls.DB_REPLICA_MAX_LAG}s)")
+        for entry in cls.DB_SHARDS:
+            config = cls.get_db_config(entry['name'])
+            logger.info(f"  Shard {entry['name']}: {config['host']}:{config['port']}/{config['database']} "
+                        f"(websites {entry['websites']})")
 
 
 settings = Settings()
\ No newline at end of file
@@ -3,21 +3,38 @@
 PostgreSQL Database Connection Manager
 Made by Hammad Naeem
 ============================================
+
+Sales can be spread over several databases by website (settings.DB_SHARDS).
+Every shard holds the full schema and a copy of the catalog; a website's
+sales, stats and stock changes live on the shard it is mapped to. Calls
+without a shard use the default (DB_*) database, and scatter_query() runs
+one query on every shard in parallel.
+
+Each database can also have read replicas (settings.DB_READ_REPLICAS, or
+"replicas" on a shard). Cursors opened with readonly=True go to a replica
+round-robin, unless its replication lag (checked at most every
+DB_REPLICA_LAG_CHECK_INTERVAL seconds) exceeds DB_REPLICA_MAX_LAG, in
+which case they fall back to the primary. Latency is recorded per route.
+
+Every statement is also timed per fingerprint, with sampled EXPLAIN plans
+of slow ones (see database/slow_queries.py).
 """
 
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extensions import parse_dsn, cursor as TupleCursor
 from psycopg2.extras import RealDictCursor
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+import itertools
+import threading
+import time
 import logging
 
-from config.settings import settings
+from config.settings import settings, DEFAULT_SHARD
+from database.slow_queries import query_monitor, routed_cursor, timed_cursor
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
@@ -25,25 +42,205 @@ class DatabaseConnection:
     """Database connection manager with connection pooling"""
     
     _instance = None
-    _pool = None
+    _pool_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
+            cls._instance._pools = {}  # shard name -> pool
+            cls._instance._executor = None
+            cls._instance._shard_map = settings.get_shard_map()
+            cls._instance._replicas = {}  # shard name -> list of replica states
+            cls._instance._replica_counter = itertools.count()
+            cls._instance._route_latencies = {}  # route -> deque of seconds
+            cls._instance._route_counts = {}
+            cls._instance._metrics_lock = threading.Lock()
+            cls._instance._cursor_classes = {}  # cursor_factory -> timed or routed subclass
         return cls._instance
     
-    def initialize_pool(self, min_connections=1, max_connections=10):
+    @property
+    def shard_names(self):
+        """Every configured shard, the default one first"""
+        return settings.get_shard_names()
+    
+    @property
+    def is_sharded(self):
+        return len(self.shard_names) > 1
+    
+    def shard_for(self, website_id):
+        """Shard holding a website's sales"""
+        return self._shard_map.get(website_id, DEFAULT_SHARD)
+    
+    @property
+    def has_replicas(self):
+        return any(settings.get_replica_dsns(shard) for shard in self.shard_names)
+    
+    def _replicas_for(self, shard):
+        """Replica states for a shard, created from settings on first use"""
+        replicas = self._replicas.get(shard)
+        if replicas is None:
+            replicas = []
+            for index, dsn in enumerate(settings.get_replica_dsns(shard)):
+                params = settings.get_db_config(shard)
+                params['dbname'] = params.pop('database')
+                params.update(parse_dsn(dsn))
+                replicas.append({
+                    'route': f"{shard}/replica-{index}",
+                    'params': params,
+                    'pool': None,
+                    'lag': None,
+                    'healthy': False,
+                    'checked_at': 0.0,
+                    'lock': threading.Lock()
+                })
+            self._replicas[shard] = replicas
+        return replicas
+    
+    def _check_replica(self, replica):
+        """Refresh a replica's lag (seconds behind the primary) if the last check is old"""
+        if time.monotonic() - replica['checked_at'] < settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+            return
+        with replica['lock']:
+            if time.monotonic() - replica['checked_at'] < settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+                return
+            was_usable = replica['healthy'] and replica['lag'] is not None and replica['lag'] <= settings.DB_REPLICA_MAX_LAG
+            try:
+                if replica['pool'] is None:
+                    replica['pool'] = psycopg2.pool.ThreadedConnectionPool(1, 10, **replica['params'])
+                connection = replica['pool'].getconn()
+                try:
+                    with connection.cursor() as cursor:
+                        # Fully replayed (or not a standby at all) counts as no lag
+                        cursor.execute("""
+                            SELECT CASE
+                                WHEN NOT pg_is_in_recovery() THEN 0
+                                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                            END
+                        """)
+                        replica['lag'] = float(cursor.fetchone()[0])
+                    connection.rollback()
+                finally:
+                    replica['pool'].putconn(connection)
+                replica['healthy'] = True
+            except Exception as e:
+                replica['healthy'] = False
+                replica['lag'] = None
+                if was_usable or replica['checked_at'] == 0.0:
+                    logger.warning(f"⚠️  Replica {replica['route']} unavailable: {e}")
+            replica['checked_at'] = time.monotonic()
+            
+            usable = replica['healthy'] and replica['lag'] <= settings.DB_REPLICA_MAX_LAG
+            if was_usable and not usable and replica['healthy']:
+                logger.warning(f"⚠️  Replica {replica['route']} is {replica['lag']:.1f}s behind; reading from primary")
+            elif usable and not was_usable:
+                logger.info(f"✅ Replica {replica['route']} in use (lag {replica['lag']:.1f}s)")
+    
+    def _choose_replica(self, shard):
+        """Pick a fresh replica round-robin, or None to use the primary"""
+        replicas = self._replicas_for(shard)
+        if not replicas:
+            return None
+        start = next(self._replica_counter)
+        for offset in range(len(replicas)):
+            replica = replicas[(start + offset) % len(replicas)]
+            self._check_replica(replica)
+            if replica['healthy'] and replica['lag'] <= settings.DB_REPLICA_MAX_LAG:
+                return replica
+        return None
+    
+    def _record_route(self, route, seconds):
+        with self._metrics_lock:
+            latencies = self._route_latencies.get(route)
+            if latencies is None:
+                latencies = self._route_latencies[route] = deque(maxlen=1000)
+                self._route_counts[route] = 0
+            latencies.append(seconds)
+            self._route_counts[route] += 1
+    
+    def _cursor_class(self, cursor_factory):
+        """
+        Subclass of a cursor class that reports statement timings, or only
+        carries route and shard when query statistics are off (the plain
+        psycopg2 cursor is a C type that takes no new attributes)
+        """
+        cursor_class = self._cursor_classes.get(cursor_factory)
+        if cursor_class is None:
+            subclass = timed_cursor if query_monitor.enabled else routed_cursor
+            cursor_class = self._cursor_classes[cursor_factory] = subclass(cursor_factory)
+        return cursor_class
+    
+    def open_cursor(self, connection, shard=None, cursor_factory=TupleCursor, route=None):
+        """
+        Timed cursor on a connection from get_connection(), for callers that
+        manage the transaction themselves (rows are tuples by default)
+        """
+        shard = shard or DEFAULT_SHARD
+        cursor = connection.cursor(cursor_factory=self._cursor_class(cursor_factory))
+        cursor.route = route or f"{shard}/primary"
+        cursor.shard = shard
+        return cursor
+    
+    def _route_replica(self, route, shard):
+        """Replica serving a route from get_cursor(), or None for the primary"""
+        for replica in self._replicas_for(shard):
+            if replica['route'] == route and replica['pool'] is not None:
+                return replica
+        return None
+    
+    def get_route_connection(self, route, shard=None):
+        """Connection to the node a cursor's route ran on (a replica, or the shard primary)"""
+        shard = shard or DEFAULT_SHARD
+        replica = self._route_replica(route, shard)
+        if replica is not None:
+            return replica['pool'].getconn()
+        return self.get_connection(shard)
+    
+    def release_route_connection(self, connection, route, shard=None):
+        """Release a connection from get_route_connection()"""
+        shard = shard or DEFAULT_SHARD
+        replica = self._route_replica(route, shard)
+        if replica is not None:
+            replica['pool'].putconn(connection)
+        else:
+            self.release_connection(connection, shard)
+    
+    def route_metrics(self):
+        """Cursor count and latency per route (shard/primary, shard/replica-N, shard/primary-fallback)"""
+        with self._metrics_lock:
+            snapshot = {route: sorted(latencies) for route, latencies in self._route_latencies.items()}
+            counts = dict(self._route_counts)
+        return {
+            route: {
+                'queries': counts[route],
+                'avg_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+                'p95_ms': round(latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2)
+            }
+            for route, latencies in snapshot.items()
+        }
+    
+    def replica_status(self):
+        """Last measured lag and health of every replica"""
+        return {
+            replica['route']: {'healthy': replica['healthy'], 'lag_seconds': replica['lag']}
+            for shard in self.shard_names
+            for replica in self._replicas_for(shard)
+        }
+    
+    def initialize_pool(self, min_connections=1, max_connections=10, shard=DEFAULT_SHARD):
         """Initialize the connection pool"""
         try:
-            db_config = settings.get_db_config()
-            logger.info(f"Initializing database connection pool to {db_config['host']}:{db_config['port']}")
+            db_config = settings.get_db_config(shard)
+            shard_text = f" (shard {shard})" if shard != DEFAULT_SHARD else ""
+            logger.info(f"Initializing database connection pool to {db_config['host']}:{db_config['port']}{shard_text}")
             
-            self._pool = psycopg2.pool.ThreadedConnectionPool(
+            self._pools[shard] = psycopg2.pool.ThreadedConnectionPool(
                 min_connections,
                 max_connections,
                 **db_config
             )
-            logger.info("✅ Database connection pool initialized successfully")
+            logger.info(f"✅ Database connection pool initialized successfully{shard_text}")
             return True
         except psycopg2.OperationalError as e:
             if "password authentication failed" in str(e):
@@ -59,54 +256,98 @@ class DatabaseConnection:
             logger.error(f"❌ Unexpected error initializing database pool: {e}")
             return False
     
-    def get_connection(self):
+    def ensure_pool(self, shard=DEFAULT_SHARD):
+        """Initialize the connection pool once, even with concurrent callers"""
+        if shard in self._pools:
+            return True
+        with self._pool_lock:
+            if shard in self._pools:
+                return True
+            return self.initialize_pool(shard=shard)
+    
+    def get_connection(self, shard=None):
         """Get a connection from the pool"""
+        shard = shard or DEFAULT_SHARD
         try:
-            if self._pool is None:
-                success = self.initialize_pool()
+            if shard not in self._pools:
+                success = self.ensure_pool(shard)
                 if not success:
                     raise Exception("Failed to initialize connection pool")
             
-            connection = self._pool.getconn()
+            connection = self._pools[shard].getconn()
             logger.debug("Database connection acquired from pool")
             return connection
         except Exception as e:
             logger.error(f"Failed to get database connection: {e}")
             raise
     
-    def release_connection(self, connection):
+    def release_connection(self, connection, shard=None):
         """Release a connection back to the pool"""
         try:
-            if self._pool is not None and connection is not None:
-                self._pool.putconn(connection)
+            pool_ = self._pools.get(shard or DEFAULT_SHARD)
+            if pool_ is not None and connection is not None:
+                pool_.putconn(connection)
                 logger.debug("Database connection released to pool")
         except Exception as e:
             logger.error(f"Error releasing database connection: {e}")
     
     def close_all(self):
-        """Close all connections in the pool"""
+        """Close all connections in every pool"""
         try:
-            if self._pool is not None:
-                self._pool.closeall()
-                self._pool = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            # Pending EXPLAINs still need their pools
+            query_monitor.close()
+            for replicas in self._replicas.values():
+                for replica in replicas:
+                    if replica['pool'] is not None:
+                        replica['pool'].closeall()
+            self._replicas = {}
+            if self._pools:
+                for pool_ in self._pools.values():
+                    pool_.closeall()
+                self._pools = {}
                 logger.info("All database connections closed")
         except Exception as e:
             logger.error(f"Error closing database connections: {e}")
     
     @contextmanager
-    def get_cursor(self, commit=True):
-        """Context manager for database operations"""
+    def get_cursor(self, commit=True, shard=None, readonly=False, cursor_factory=RealDictCursor):
+        """
+        Context manager for database operations.
+        
+        readonly=True cursors are served by a fresh read replica when the
+        shard has one; they must not write. Rows are dicts unless another
+        cursor_factory is given.
+        """
+        shard = shard or DEFAULT_SHARD
         connection = None
         cursor = None
+        replica = self._choose_replica(shard) if readonly else None
+        if replica is not None:
+            route = replica['route']
+        elif readonly and self._replicas_for(shard):
+            route = f"{shard}/primary-fallback"
+        else:
+            route = f"{shard}/primary"
+        start = time.perf_counter()
         try:
-            connection = self.get_connection()
-            cursor = connection.cursor(cursor_factory=RealDictCursor)
+            if replica is not None:
+                connection = replica['pool'].getconn()
+            else:
+                connection = self.get_connection(shard)
+            cursor = self.open_cursor(connection, shard, cursor_factory, route)
             yield cursor
             if commit:
                 connection.commit()
                 logger.debug("Database transaction committed")
         except psycopg2.OperationalError as e:
-            if connection:
+            if replica is not None:
+                # Re-check the replica before routing more reads to it
+                replica['healthy'] = False
+                replica['checked_at'] = 0.0
+            if connection and not connection.closed:
                 connection.rollback()
             if "password authentication failed" in str(e):
                 logger.error("❌ Database authentication failed. Check DB_PASSWORD in .env")
@@ -124,12 +365,16 @@ class DatabaseConnection:
             if cursor:
                 cursor.close()
             if connection:
-                self.release_connection(connection)
+                if replica is not None:
+                    replica['pool'].putconn(connection)
+                else:
+                    self.release_connection(connection, shard)
+                self._record_route(route, time.perf_counter() - start)
     
-    def execute_query(self, query, params=None, fetch=True):
+    def execute_query(self, query, params=None, fetch=True, shard=None, readonly=False):
         """Execute a query and optionally fetch results"""
         try:
-            with self.get_cursor() as cursor:
+            with self.get_cursor(shard=shard, readonly=readonly) as cursor:
                 cursor.execute(query, params)
                 if fetch:
                     return cursor.fetchall()
@@ -138,10 +383,31 @@ class DatabaseConnection:
             logger.error(f"Query execution failed: {e}")
             raise
     
-    def execute_many(self, query, params_list):
+    def scatter_query(self, query, params=None, fetch=True, readonly=False):
+        """
+        Execute a query on every shard in parallel.
+        
+        Returns {shard name: rows}; callers merge the per-shard results.
+        With a single database the query simply runs inline.
+        """
+        shards = self.shard_names
+        if len(shards) == 1:
+            return {shards[0]: self.execute_query(query, params, fetch=fetch, shard=shards[0], readonly=readonly)}
+        
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='db-scatter')
+        
+        futures = {
+            shard: self._executor.submit(self.execute_query, query, params, fetch, shard, readonly)
+            for shard in shards
+        }
+        return {shard: future.result() for shard, future in futures.items()}
+    
+    def execute_many(self, query, params_list, shard=None):
         """Execute a query with multiple parameter sets"""
         try:
-            with self.get_cursor() as cursor:
+            with self.get_cursor(shard=shard) as cursor:
                 cursor.executemany(query, params_list)
                 logger.debug(f"Executed batch query with {len(params_list)} parameter sets")
         except Exception as e:
@@ -149,17 +415,18 @@ class DatabaseConnection:
             raise
     
     def test_connection(self):
-        """Test the database connection"""
+        """Test the connection to every shard"""
         try:
-            with self.get_cursor() as cursor:
-                cursor.execute("SELECT NOW() as current_time")
-                result = cursor.fetchone()
-                if result:
-                    logger.info(f"✅ Database connection successful at {result['current_time']}")
-                    return True
-                else:
-                    logger.error("❌ Database connection test returned no results")
-                    return False
+            for shard in self.shard_names:
+                with self.get_cursor(shard=shard) as cursor:
+                    cursor.execute("SELECT NOW() as current_time")
+                    result = cursor.fetchone()
+                    if not result:
+                        logger.error(f"❌ Database connection test returned no results (shard {shard})")
+                        return False
+                    shard_text = f" (shard {shard})" if shard != DEFAULT_SHARD else ""
+                    logger.info(f"✅ Database connection successful at {result['current_time']}{shard_text}")
+            return True
         except psycopg2.OperationalError as e:
             if "password authentication failed" in str(e):
                 logger.error("❌ Authentication Error: Database password is incorrect")
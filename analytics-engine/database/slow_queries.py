@@ -0,0 +1,351 @@
+"""
+============================================
+Query Statistics and Slow Query Capture
+Made by Hammad Naeem
+============================================
+
+Every statement run through a DatabaseConnection cursor is timed and added
+to per-fingerprint statistics (the statement with literals, parameters and
+VALUES lists normalized away). Statements slower than
+SLOW_QUERY_THRESHOLD_MS are logged, and a sample of them (at most one per
+fingerprint every SLOW_QUERY_EXPLAIN_INTERVAL seconds) is explained in the
+background on the node that ran it (the shard's primary, or the replica
+a read was routed to), in a transaction that is rolled back:
+
+- SELECTs with EXPLAIN (ANALYZE, BUFFERS) in a read-only transaction
+- writes and locking SELECTs (FOR UPDATE, FOR SHARE, ...) with a plain
+  EXPLAIN, since analyzing would run them again or cannot run read-only
+
+Statistics and the latest plan of each statement are saved to
+SLOW_QUERY_DIR/query_stats.json, and every captured plan is appended to
+SLOW_QUERY_DIR/plans.jsonl.
+
+Report the top statements with:
+    python -m database.slow_queries --top 10 --sort total
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Only the start of very long statements (rendered execute_values batches) is fingerprinted
+FINGERPRINT_PREFIX = 4096
+
+_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDERS = re.compile(r'%\(\w+\)s|%s')
+_NUMBERS = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_LISTS = re.compile(r'\(\s*\?(?:\s*(?:::\s*\w+)?\s*,\s*\?)*(?:\s*::\s*\w+)?\s*\)')
+_REPEATED_LISTS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_WHITESPACE = re.compile(r'\s+')
+_WRITES = re.compile(r'\b(INSERT|UPDATE|DELETE)\b', re.I)
+_LOCKING = re.compile(r'\bFOR\s+(NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b', re.I)
+
+
+def normalize(query):
+    """Statement text with literals and parameters replaced by ?"""
+    # Cache on the prefix only, so long batches neither pin memory nor miss
+    return _normalize_prefix(query[:FINGERPRINT_PREFIX])
+
+
+@lru_cache(maxsize=1024)
+def _normalize_prefix(query):
+    text = _COMMENTS.sub(' ', query)
+    text = _STRINGS.sub('?', text)
+    text = _PLACEHOLDERS.sub('?', text)
+    text = _NUMBERS.sub('?', text)
+    text = _LISTS.sub('(...)', text)
+    text = _REPEATED_LISTS.sub('(...)', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def _first_word(statement):
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+
+
+def explainable(statement):
+    """Whether EXPLAIN accepts a statement (not BEGIN, COMMIT, SET, ...)"""
+    return _first_word(statement) in ('SELECT', 'WITH', 'VALUES', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def analyzable(statement):
+    """Whether EXPLAIN ANALYZE can re-run a statement in a read-only transaction"""
+    return (_first_word(statement) in ('SELECT', 'WITH')
+            and not _WRITES.search(statement) and not _LOCKING.search(statement))
+
+
+def fingerprint(query):
+    """Short stable id of a normalized statement"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    text = normalize(query)
+    return hashlib.sha1(text.encode()).hexdigest()[:12], text
+
+
+class QueryMonitor:
+    """Per-fingerprint latency statistics and sampled EXPLAIN capture"""
+
+    def __init__(self, threshold_ms=500, sample_rate=0.1, explain_interval=300,
+                 output_dir='slow_queries', enabled=True):
+        self.enabled = enabled
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.explain_interval = explain_interval
+        self.output_dir = Path(output_dir)
+        self.started_at = datetime.now().astimezone().isoformat()
+        self._stats = {}  # fingerprint -> stats dict
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def record(self, cursor, query, params, seconds):
+        """Add one execution; explain it in the background when it is slow and sampled"""
+        if not self.enabled:
+            return
+        key, text = fingerprint(query)
+        slow = seconds >= self.threshold
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    'query': text,
+                    'calls': 0,
+                    'total_seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'slow_calls': 0,
+                    'latencies': deque(maxlen=500),
+                    'explained_at': 0.0,
+                    'latest_plan': None
+                }
+            stats['calls'] += 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['latencies'].append(seconds)
+            if not slow:
+                return
+            stats['slow_calls'] += 1
+            explain = (time.monotonic() - stats['explained_at'] >= self.explain_interval
+                       and random.random() < self.sample_rate
+                       and explainable(text))
+            if explain:
+                stats['explained_at'] = time.monotonic()
+
+        route = getattr(cursor, 'route', None)
+        logger.warning(f"🐢 Slow query ({seconds * 1000:.0f} ms on {route}): {text[:160]}")
+        if explain:
+            try:
+                statement = cursor.mogrify(query, params) if params is not None else query
+            except Exception as e:
+                logger.debug(f"Could not bind statement for EXPLAIN: {e}")
+                return
+            if isinstance(statement, bytes):
+                statement = statement.decode('utf-8', 'replace')
+            self._submit(key, statement, seconds, getattr(cursor, 'shard', None), route)
+
+    def _submit(self, key, statement, seconds, shard, route):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+        self._executor.submit(self._explain, key, statement, seconds, shard, route)
+
+    def _explain(self, key, statement, seconds, shard, route):
+        """Capture a plan on the node the statement ran on, always rolled back"""
+        from database.connection import db
+
+        analyze = analyzable(statement)
+        options = ' (ANALYZE, BUFFERS)' if analyze else ''
+        connection = None
+        try:
+            connection = db.get_route_connection(route, shard)
+            with connection.cursor() as cursor:
+                if analyze:
+                    cursor.execute("SET TRANSACTION READ ONLY")
+                # Bound the re-run to a few times the original duration
+                cursor.execute("SET LOCAL statement_timeout = %s", (int(max(5.0, seconds * 5) * 1000),))
+                cursor.execute(f"EXPLAIN{options} {statement}")
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            connection.rollback()
+
+            captured = {
+                'captured_at': datetime.now().astimezone().isoformat(),
+                'fingerprint': key,
+                'route': route,
+                'seconds': round(seconds, 4),
+                'analyzed': analyze,
+                'statement': statement[:FINGERPRINT_PREFIX],
+                'plan': plan
+            }
+            with self._lock:
+                if key in self._stats:
+                    self._stats[key]['latest_plan'] = captured
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.output_dir / 'plans.jsonl', 'a') as f:
+                f.write(json.dumps(captured) + '\n')
+            logger.info(f"Captured plan for slow query {key} ({seconds * 1000:.0f} ms)")
+            self.flush()
+        except Exception as e:
+            if connection is not None and not connection.closed:
+                connection.rollback()
+            logger.error(f"Failed to capture plan for slow query {key}: {e}")
+        finally:
+            if connection is not None:
+                db.release_route_connection(connection, route, shard)
+
+    def summary(self):
+        """Statistics per fingerprint, as saved to query_stats.json"""
+        with self._lock:
+            snapshot = {
+                key: dict(stats, latencies=sorted(stats['latencies']))
+                for key, stats in self._stats.items()
+            }
+        statements = {}
+        for key, stats in snapshot.items():
+            latencies = stats['latencies']
+            statements[key] = {
+                'query': stats['query'],
+                'calls': stats['calls'],
+                'slow_calls': stats['slow_calls'],
+                'total_ms': round(stats['total_seconds'] * 1000, 2),
+                'mean_ms': round(stats['total_seconds'] / stats['calls'] * 1000, 2),
+                'p95_ms': round(latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000, 2),
+                'max_ms': round(stats['max_seconds'] * 1000, 2),
+                'latest_plan': stats['latest_plan']
+            }
+        return {
+            'started_at': self.started_at,
+            'updated_at': datetime.now().astimezone().isoformat(),
+            'threshold_ms': round(self.threshold * 1000, 2),
+            'statements': statements
+        }
+
+    def flush(self):
+        """Save the statistics atomically for the report"""
+        if not self.enabled:
+            return
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            path = self.output_dir / 'query_stats.json'
+            tmp_path = path.with_suffix('.json.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(self.summary(), f, indent=2)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to save query statistics: {e}")
+
+    def close(self):
+        """Finish pending EXPLAINs and save the statistics"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.flush()
+
+
+def timed_cursor(base):
+    """Cursor class that reports every execute() to the query monitor"""
+
+    class TimedCursor(base):
+        route = None
+        shard = None
+
+        def execute(self, query, vars=None):
+            start = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                query_monitor.record(self, query, vars, time.perf_counter() - start)
+
+        def executemany(self, query, vars_list):
+            start = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                query_monitor.record(self, query, None, time.perf_counter() - start)
+
+    TimedCursor.__name__ = f'Timed{base.__name__}'
+    return TimedCursor
+
+
+def routed_cursor(base):
+    """Untimed cursor class that carries its route and shard, for when statistics are off"""
+
+    class RoutedCursor(base):
+        route = None
+        shard = None
+
+    RoutedCursor.__name__ = f'Routed{base.__name__}'
+    return RoutedCursor
+
+
+def format_report(summary, top=10, sort='total'):
+    """Top statements of a saved summary as text, with their latest plans"""
+    column = {'total': 'total_ms', 'mean': 'mean_ms', 'max': 'max_ms', 'calls': 'calls'}[sort]
+    statements = sorted(summary['statements'].items(), key=lambda item: item[1][column], reverse=True)[:top]
+
+    lines = [
+        f"Query statistics since {summary['started_at']} (updated {summary['updated_at']}, "
+        f"slow >= {summary['threshold_ms']} ms)",
+        "",
+        f"{'fingerprint':<13} {'calls':>8} {'total ms':>12} {'mean ms':>9} {'p95 ms':>9} {'max ms':>9} {'slow':>6}  query"
+    ]
+    for key, s in statements:
+        lines.append(f"{key:<13} {s['calls']:>8} {s['total_ms']:>12.1f} {s['mean_ms']:>9.2f} "
+                     f"{s['p95_ms']:>9.2f} {s['max_ms']:>9.2f} {s['slow_calls']:>6}  {s['query'][:90]}")
+
+    for key, s in statements:
+        plan = s['latest_plan']
+        if not plan:
+            continue
+        lines += [
+            "",
+            f"── {key}: {plan['seconds'] * 1000:.0f} ms on {plan['route']} at {plan['captured_at']}"
+            f"{'' if plan['analyzed'] else ' (estimated plan)'}",
+            s['query'],
+            plan['plan']
+        ]
+    return "\n".join(lines)
+
+
+def main():
+    """Slow query report entry point"""
+    parser = argparse.ArgumentParser(description='Report the top statements recorded by the analytics engine')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--sort', choices=['total', 'mean', 'max', 'calls'], default='total')
+    parser.add_argument('--dir', default=settings.SLOW_QUERY_DIR, help='Directory holding query_stats.json')
+    args = parser.parse_args()
+
+    path = Path(args.dir) / 'query_stats.json'
+    if not path.exists():
+        print(f"No query statistics at {path}; they are saved while the engine runs")
+        return 1
+    with open(path) as f:
+        print(format_report(json.load(f), top=args.top, sort=args.sort))
+    return 0
+
+
+# Global monitor instance
+query_monitor = QueryMonitor(
+    threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+    sample_rate=settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+    explain_interval=settings.SLOW_QUERY_EXPLAIN_INTERVAL,
+    output_dir=settings.SLOW_QUERY_DIR,
+    enabled=settings.ENABLE_QUERY_STATS
+)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,20 +8,20 @@ This Python service runs in the background and:
 1. Generates fake sales data at regular intervals
 2. Aggregates statistics for analytics
 3. Manages stock replenishment
+4. Applies data retention policies
+5. Tracks streaming top products per website
+6. Exports closed days to the columnar snapshot store
 """
 
 import time
 import signal
 import sys
+import argparse
 import logging
 import schedule
 from datetime import datetime
 
-from config.settings import settings
-from database.connection import db
-from simulation.sales_generator import sales_generator
-from analytics.aggregations import aggregations
-from analytics.realtime import realtime_analytics
+from services.container import container
 
 # Configure logging
 logging.basicConfig(
@@ -37,24 +37,43 @@ logger = logging.getLogger(__name__)
 # Global flag for graceful shutdown
 running = True
 
+# Workload trace being recorded (--record-workload)
+recorder = None
+
 
 def signal_handler(signum, frame):
     """Handle shutdown signals gracefully"""
     global running
     logger.info("Shutdown signal received. Stopping gracefully...")
     running = False
+    
+    # Stop queueing new sales; the main loop drains what is queued on exit
+    if container.is_initialized('write_pipeline'):
+        container.write_pipeline.stop_accepting()
+
+
+def record_job(name):
+    """Add a job invocation to the workload trace when recording"""
+    if recorder is not None:
+        recorder.record_job(name)
 
 
 def generate_sales_job():
     """Job to generate sales"""
+    record_job('generate_sales')
     try:
         logger.info("=" * 50)
         logger.info(f"Running sales generation - {datetime.now()}")
         
-        generated = sales_generator.generate_batch()
+        if container.settings.ENABLE_WRITE_PIPELINE:
+            pipeline = container.write_pipeline
+            generated = container.sales_generator.generate_batch(pipeline=pipeline)
+            logger.info(f"Write pipeline: {pipeline.metrics()}")
+        else:
+            generated = container.sales_generator.generate_batch()
         
         # Log current stats
-        stats = realtime_analytics.get_current_stats()
+        stats = container.realtime_analytics.get_current_stats()
         if stats:
             today = stats.get('today', {})
             logger.info(f"Today's Total: {today.get('total_sales', 0)} sales, Rs. {float(today.get('total_revenue', 0)):,.2f}")
@@ -67,20 +86,105 @@ def generate_sales_job():
 
 def aggregate_stats_job():
     """Job to aggregate statistics"""
+    record_job('aggregate_stats')
     try:
         logger.info("Running statistics aggregation...")
-        aggregations.aggregate_hourly_stats()
-        aggregations.aggregate_daily_stats()
+        container.aggregations.aggregate_hourly_stats()
+        container.aggregations.aggregate_daily_stats()
+        container.aggregations.aggregate_hourly_sketches()
         logger.info("Statistics aggregation completed")
+        
+        # Hours closed before this run are final; add them to the range index
+        if container.settings.ENABLE_RANGE_INDEX:
+            container.hourly_index.refresh()
+        
+        db = container.db
+        if db.has_replicas:
+            logger.info(f"Read replicas: {db.replica_status()}")
+            logger.info(f"Database routes: {db.route_metrics()}")
+        
+        # Save statement statistics for `python -m database.slow_queries`
+        container.query_monitor.flush()
     except Exception as e:
         logger.error(f"Error in aggregation job: {e}")
 
 
+def dashboard_snapshot_job():
+    """Job to refresh the precomputed dashboard snapshots"""
+    record_job('dashboard_snapshot')
+    try:
+        container.dashboard_snapshots.refresh()
+    except Exception as e:
+        logger.error(f"Error refreshing dashboard snapshots: {e}")
+
+
+def reconcile_customer_stats_job():
+    """Job to rebuild customer counters from sales if they drifted"""
+    record_job('reconcile_customer_stats')
+    try:
+        logger.info("Reconciling customer stats...")
+        container.aggregations.reconcile_customer_stats()
+    except Exception as e:
+        logger.error(f"Error reconciling customer stats: {e}")
+
+
+def retention_job():
+    """Job to apply the data retention policies"""
+    try:
+        logger.info("Running data retention...")
+        report = container.retention.run()
+        logger.info(f"Data retention completed: {report}")
+    except Exception as e:
+        logger.error(f"Error in retention job: {e}")
+
+
+def columnar_export_job():
+    """Job to export closed days to the columnar snapshot store"""
+    try:
+        logger.info("Exporting closed days to the columnar store...")
+        exported = container.columnar_store.export()
+        logger.info(f"Columnar export completed ({len(exported)} days)")
+    except Exception as e:
+        logger.error(f"Error in columnar export job: {e}")
+
+
+def top_products_checkpoint_job():
+    """Job to checkpoint the streaming top products"""
+    try:
+        container.top_products.checkpoint()
+        top = container.top_products.top(window='hour', k=3)
+        leaders = ', '.join(f"{p['name']} ({p['quantity']})" for p in top['products'])
+        logger.info(f"Top products last hour: {leaders or 'none'}")
+    except Exception as e:
+        logger.error(f"Error checkpointing top products: {e}")
+
+
+def forecast_job():
+    """Job to refresh the sales forecasts from the closed hours"""
+    try:
+        container.sales_forecaster.refresh()
+    except Exception as e:
+        logger.error(f"Error in forecast job: {e}")
+
+
+def rebuild_stats_job():
+    """Job to recompute hourly and daily stats and sketches from sales"""
+    try:
+        logger.info("Rebuilding hourly and daily stats and sketches from sales...")
+        rebuilt, failed = container.aggregations.rebuild_stats()
+        if failed:
+            logger.warning(f"⚠️  Stats rebuild failed for {failed} days; run it again")
+        logger.info(f"Stats rebuild completed ({rebuilt} days)")
+    except Exception as e:
+        logger.error(f"Error in stats rebuild job: {e}")
+
+
 def replenish_stock_job():
     """Job to replenish low stock"""
+    record_job('replenish_stock')
     try:
         logger.info("Checking and replenishing stock...")
-        sales_generator.replenish_stock()
+        container.sales_generator.replenish_stock()
     except Exception as e:
         logger.error(f"Error in stock replenishment: {e}")
 
@@ -89,7 +193,7 @@ def reload_data_job():
     """Job to reload data from database"""
     try:
         logger.info("Reloading product and website data...")
-        sales_generator.reload_data()
+        container.sales_generator.reload_data()
     except Exception as e:
         logger.error(f"Error reloading data: {e}")
 
@@ -110,9 +214,48 @@ def print_banner():
     logger.info("Sales Analytics Engine Starting...")
 
 
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Sales Analytics Engine')
+    parser.add_argument(
+        '--profile-startup',
+        action='store_true',
+        help='Report import and initialization time per component'
+    )
+    parser.add_argument(
+        '--run-retention',
+        action='store_true',
+        help='Apply the data retention policies once and exit'
+    )
+    parser.add_argument(
+        '--record-workload',
+        metavar='PATH',
+        help='Record generated sales and job runs to a workload trace for `python -m benchmarks replay`'
+    )
+    parser.add_argument(
+        '--export-columnar',
+        action='store_true',
+        help='Export closed days to the columnar snapshot store once and exit'
+    )
+    parser.add_argument(
+        '--run-forecast',
+        action='store_true',
+        help='Fit the sales forecasts, store them once and exit'
+    )
+    parser.add_argument(
+        '--rebuild-stats',
+        action='store_true',
+        help='Recompute hourly and daily stats and the hourly sketches from sales once and exit'
+    )
+    return parser.parse_args()
+
+
 def main():
     """Main entry point"""
-    global running
+    global running, recorder
+    
+    args = parse_args()
+    startup_begin = time.perf_counter()
     
     # Setup signal handlers
     signal.signal(signal.SIGINT, signal_handler)
@@ -120,6 +263,8 @@ def main():
     
     print_banner()
     
+    settings = container.settings
+    
     # Validate and display database configuration
     logger.info("Validating database configuration...")
     settings.print_db_config_summary()
@@ -128,6 +273,7 @@ def main():
     
     # Test database connection
     logger.info("Testing database connection...")
+    db = container.db
     if not db.test_connection():
         logger.error("❌ Failed to connect to database. Cannot proceed.")
         logger.error("\nPlease fix the following:")
@@ -139,6 +285,32 @@ def main():
     
     logger.info("✅ Database connection successful!")
     
+    if args.run_retention:
+        retention_job()
+        db.close_all()
+        return
+    
+    if args.export_columnar:
+        columnar_export_job()
+        db.close_all()
+        return
+    
+    if args.run_forecast:
+        forecast_job()
+        db.close_all()
+        return
+    
+    if args.rebuild_stats:
+        rebuild_stats_job()
+        db.close_all()
+        return
+    
+    if args.record_workload:
+        from simulation.workload import WorkloadRecorder
+        recorder = WorkloadRecorder(args.record_workload, seed=settings.SIMULATION_SEED)
+        container.sales_generator.recorder = recorder
+        logger.info(f"Recording workload to {args.record_workload}")
+    
     # Check if simulation is enabled
     if not settings.ENABLE_SIMULATION:
         logger.info("Simulation is disabled. Only running aggregation jobs.")
@@ -153,17 +325,59 @@ def main():
     # Aggregate stats every 5 minutes
     schedule.every(5).minutes.do(aggregate_stats_job)
     
+    # Refresh dashboard snapshots twice per staleness bound
+    snapshot_interval = max(1, settings.DASHBOARD_SNAPSHOT_MAX_STALENESS // 2)
+    schedule.every(snapshot_interval).seconds.do(dashboard_snapshot_job)
+    
+    # Batched customer stats are checked against sales periodically
+    if settings.CUSTOMER_STATS_MODE == 'batch':
+        schedule.every(settings.CUSTOMER_STATS_RECONCILE_MINUTES).minutes.do(reconcile_customer_stats_job)
+    
+    # Export closed days to the columnar store once a day
+    if settings.ENABLE_COLUMNAR_EXPORT:
+        schedule.every().day.at(settings.COLUMNAR_EXPORT_RUN_AT).do(columnar_export_job)
+    
+    # Apply retention policies once a day
+    if settings.ENABLE_RETENTION:
+        schedule.every().day.at(settings.RETENTION_RUN_AT).do(retention_job)
+    
+    # Feed written sales into the top products tracker, starting from the last checkpoint
+    if settings.ENABLE_TOP_PRODUCTS:
+        container.top_products.restore()
+        container.sales_generator.add_sale_listener(container.top_products.record_sales)
+        schedule.every(settings.TOP_PRODUCTS_CHECKPOINT_SECONDS).seconds.do(top_products_checkpoint_job)
+    
+    # Refresh sales forecasts every hour, once the last hour's stats are aggregated
+    if settings.ENABLE_FORECASTING:
+        schedule.every().hour.at(settings.FORECAST_RUN_AT).do(forecast_job)
+    
     # Replenish stock every 30 minutes
     schedule.every(30).minutes.do(replenish_stock_job)
     
     # Reload data every 10 minutes
     schedule.every(10).minutes.do(reload_data_job)
     
+    # Load the generator's catalog in the background while aggregation starts
+    catalog_thread = None
+    if settings.ENABLE_SIMULATION:
+        catalog_thread = container.start_catalog_load()
+    
     # Run initial jobs
     logger.info("Running initial jobs...")
+    aggregate_stats_job()
     if settings.ENABLE_SIMULATION:
         generate_sales_job()
-    aggregate_stats_job()
+    dashboard_snapshot_job()
+    if settings.ENABLE_FORECASTING:
+        forecast_job()
+    
+    if args.profile_startup:
+        # Resolve every component so the report covers all of them
+        container.realtime_analytics
+        if catalog_thread is not None:
+            catalog_thread.join()
+        logger.info(container.startup_report())
+        logger.info(f"  {'total startup':<22} {(time.perf_counter() - startup_begin) * 1000:>10.1f} ms")
     
     logger.info("Scheduler started. Press Ctrl+C to stop.")
     
@@ -178,6 +392,12 @@ def main():
     
     # Cleanup
     logger.info("Shutting down...")
+    if container.is_initialized('write_pipeline'):
+        container.write_pipeline.stop(drain=True)
+    if container.is_initialized('top_products'):
+        container.top_products.checkpoint()
+    if recorder is not None:
+        recorder.close()
     db.close_all()
     logger.info("Analytics Engine stopped.")
 
@@ -0,0 +1,362 @@
+"""
+============================================
+Data Retention Module
+Made by Hammad Naeem
+============================================
+
+Keeps the tables the engine writes to from growing forever. One policy per
+table, each measured in days and disabled with 0:
+
+- sales_hourly_stats: hours older than the policy are rolled up into
+  sales_daily_stats (days that already have a daily row keep it) and the
+  hourly rows are deleted
+- sales_hourly_sketches: follow the hourly stats policy, deleted once
+  their day's distinct customers are in sales_daily_stats
+- sales / sale_items: sales older than the policy are written to gzip
+  JSON-lines files under the archive directory and deleted; their daily
+  stats and per-customer totals are kept in the database
+- audit_logs: rows older than the policy are deleted
+
+All deletes run in chunks of RETENTION_CHUNK_SIZE rows, each in its own
+short transaction, so no run holds long locks. With sharding, every policy
+is applied to each shard in turn.
+"""
+
+import gzip
+import json
+import os
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from config.settings import settings
+from database.connection import db
+from analytics.sketches import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionManager:
+    """Applies the per-table retention policies"""
+
+    def __init__(self, hourly_stats_days=90, sales_days=365, audit_log_days=90,
+                 archive_dir='archive', chunk_size=5000, chunk_pause=0.05):
+        self.hourly_stats_days = hourly_stats_days
+        self.sales_days = sales_days
+        self.audit_log_days = audit_log_days
+        self.archive_dir = archive_dir
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause
+
+    def _pause(self):
+        if self.chunk_pause > 0:
+            time.sleep(self.chunk_pause)
+
+    def _delete_in_chunks(self, table, where, params, shard=None):
+        """Delete matching rows on a shard chunk by chunk, one transaction per chunk"""
+        deleted = 0
+        while True:
+            with db.get_cursor(shard=shard) as cursor:
+                cursor.execute(f"""
+                    DELETE FROM {table}
+                    WHERE id IN (
+                        SELECT id FROM {table}
+                        WHERE {where}
+                        ORDER BY id
+                        LIMIT %s
+                    )
+                """, params + (self.chunk_size,))
+                count = cursor.rowcount
+            deleted += count
+            if count < self.chunk_size:
+                return deleted
+            self._pause()
+
+    # ------------------------------------------------------------------
+    # sales_hourly_stats
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _daily_unique_customers(website_id, stat_date, shard=None):
+        """
+        Distinct customers for a day from its hourly sketches, or counted
+        from its sales for days from before the sketches (0 once archived)
+        """
+        rows = db.execute_query("""
+            SELECT customers_hll
+            FROM sales_hourly_sketches
+            WHERE stat_date = %s
+            AND website_id IS NOT DISTINCT FROM %s
+        """, (stat_date, website_id), shard=shard)
+        if not rows:
+            return db.execute_query("""
+                SELECT COUNT(DISTINCT customer_id)::INTEGER as unique_customers
+                FROM sales
+                WHERE sale_date >= %s::DATE AND sale_date < %s::DATE + 1
+                AND website_id IS NOT DISTINCT FROM %s
+            """, (stat_date, stat_date, website_id), shard=shard)[0]['unique_customers']
+        customers = HyperLogLog()
+        for row in rows:
+            customers.merge(HyperLogLog.from_bytes(row['customers_hll']))
+        return customers.count()
+
+    def downsample_hourly_stats(self):
+        """Roll hourly stats past the policy into daily stats on every shard, then delete them"""
+        cutoff = datetime.now().date() - timedelta(days=self.hourly_stats_days)
+        deleted = 0
+        created = 0
+        for shard in db.shard_names:
+            shard_deleted, shard_created = self._downsample_shard_hourly_stats(shard, cutoff)
+            deleted += shard_deleted
+            created += shard_created
+        return {'rows': deleted, 'daily_rows_created': created}
+
+    def _downsample_shard_hourly_stats(self, shard, cutoff):
+        """Downsample one shard, returning (hourly rows deleted, daily rows created)"""
+        with db.get_cursor(shard=shard) as cursor:
+            cursor.execute("""
+                INSERT INTO sales_daily_stats (
+                    website_id, stat_date,
+                    total_sales, total_revenue, total_items_sold,
+                    unique_customers, average_order_value
+                )
+                SELECT
+                    website_id,
+                    stat_date,
+                    SUM(total_sales)::INTEGER,
+                    SUM(total_revenue),
+                    SUM(total_items_sold)::INTEGER,
+                    0,
+                    CASE WHEN SUM(total_sales) > 0
+                         THEN SUM(total_revenue) / SUM(total_sales)
+                         ELSE 0 END
+                FROM sales_hourly_stats
+                WHERE stat_date < %s
+                GROUP BY website_id, stat_date
+                ON CONFLICT (website_id, stat_date) DO NOTHING
+                RETURNING website_id, stat_date
+            """, (cutoff,))
+            created = cursor.fetchall()
+
+        # New daily rows take their distinct customers from the hourly sketches
+        for row in created:
+            unique_customers = self._daily_unique_customers(row['website_id'], row['stat_date'], shard)
+            if unique_customers:
+                db.execute_query("""
+                    UPDATE sales_daily_stats
+                    SET unique_customers = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE website_id IS NOT DISTINCT FROM %s AND stat_date = %s
+                """, (unique_customers, row['website_id'], row['stat_date']), fetch=False, shard=shard)
+
+        deleted = self._delete_in_chunks('sales_hourly_stats', 'stat_date < %s', (cutoff,), shard)
+        return deleted, len(created)
+
+    def purge_hourly_sketches(self):
+        """Delete hourly sketches past the hourly stats policy whose day has daily stats, on every shard"""
+        cutoff = datetime.now().date() - timedelta(days=self.hourly_stats_days)
+        deleted = sum(
+            self._delete_in_chunks('sales_hourly_sketches', """
+                stat_date < %s
+                AND EXISTS (
+                    SELECT 1 FROM sales_daily_stats d
+                    WHERE d.website_id IS NOT DISTINCT FROM sales_hourly_sketches.website_id
+                    AND d.stat_date = sales_hourly_sketches.stat_date
+                )
+            """, (cutoff,), shard)
+            for shard in db.shard_names
+        )
+        return {'rows': deleted}
+
+    # ------------------------------------------------------------------
+    # sales / sale_items
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _ensure_daily_stats(cutoff, shard=None):
+        """Create daily stats for days about to be archived that never got them"""
+        db.execute_query("""
+            INSERT INTO sales_daily_stats (
+                website_id, stat_date,
+                total_sales, total_revenue, total_items_sold,
+                unique_customers, average_order_value
+            )
+            SELECT
+                s.website_id,
+                s.sale_date::DATE,
+                COUNT(*)::INTEGER,
+                SUM(s.total_amount),
+                COALESCE(SUM(si.items), 0)::INTEGER,
+                COUNT(DISTINCT s.customer_id)::INTEGER,
+                AVG(s.total_amount)
+            FROM sales s
+            LEFT JOIN (
+                SELECT sale_id, SUM(quantity) as items
+                FROM sale_items
+                GROUP BY sale_id
+            ) si ON si.sale_id = s.id
+            WHERE s.sale_date < %s
+            GROUP BY s.website_id, s.sale_date::DATE
+            ON CONFLICT (website_id, stat_date) DO NOTHING
+        """, (cutoff,), fetch=False, shard=shard)
+
+    def _archive_path(self, first_sale_date):
+        """Archive file for a chunk, grouped by the month of its first sale"""
+        directory = os.path.join(self.archive_dir, 'sales', first_sale_date.strftime('%Y-%m'))
+        os.makedirs(directory, exist_ok=True)
+        name = f"sales_{first_sale_date:%Y%m%d}_{datetime.now():%Y%m%dT%H%M%S%f}.jsonl.gz"
+        return os.path.join(directory, name)
+
+    @staticmethod
+    def _write_archive(path, sales, items):
+        """Write sales with their items as gzip JSON lines, atomically"""
+        items_by_sale = defaultdict(list)
+        for item in items:
+            items_by_sale[item['sale_id']].append(item)
+
+        temp_path = path + '.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            for sale in sales:
+                record = dict(sale)
+                record['items'] = items_by_sale.get(sale['id'], [])
+                f.write(json.dumps(record, default=str) + '\n')
+        with open(temp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def archive_sales(self):
+        """Archive sales (and their items) past the policy on every shard to disk, then delete them"""
+        cutoff = datetime.now().astimezone() - timedelta(days=self.sales_days)
+        report = {'rows': 0, 'sale_items': 0, 'files': []}
+        for shard in db.shard_names:
+            archived, archived_items, files = self._archive_shard_sales(shard, cutoff)
+            report['rows'] += archived
+            report['sale_items'] += archived_items
+            report['files'].extend(files)
+        return report
+
+    def _archive_shard_sales(self, shard, cutoff):
+        """Archive one shard's sales, returning (sales archived, items archived, files)"""
+        self._ensure_daily_stats(cutoff, shard)
+
+        archived = 0
+        archived_items = 0
+        files = []
+        while True:
+            with db.get_cursor(shard=shard) as cursor:
+                # The archive file is the record of these deletes
+                cursor.execute("SET LOCAL sales_analytics.audit_mode = 'off'")
+                cursor.execute("""
+                    SELECT *
+                    FROM sales
+                    WHERE sale_date < %s
+                    ORDER BY sale_date
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                """, (cutoff, self.chunk_size))
+                sales = cursor.fetchall()
+                if not sales:
+                    break
+
+                sale_ids = [sale['id'] for sale in sales]
+                cursor.execute("""
+                    SELECT * FROM sale_items
+                    WHERE sale_id = ANY(%s::UUID[])
+                    ORDER BY id
+                """, (sale_ids,))
+                items = cursor.fetchall()
+
+                # Keep customer lifetime totals rebuildable once the sales are gone
+                totals = defaultdict(lambda: [0, 0])
+                for sale in sales:
+                    if sale['customer_id'] is not None:
+                        totals[sale['customer_id']][0] += 1
+                        totals[sale['customer_id']][1] += sale['total_amount']
+                if totals:
+                    execute_values(cursor, """
+                        INSERT INTO customer_archived_totals (customer_id, total_orders, total_spent)
+                        VALUES %s
+                        ON CONFLICT (customer_id)
+                        DO UPDATE SET
+                            total_orders = customer_archived_totals.total_orders + EXCLUDED.total_orders,
+                            total_spent = customer_archived_totals.total_spent + EXCLUDED.total_spent,
+                            updated_at = CURRENT_TIMESTAMP
+                    """, [(customer_id, orders, spent) for customer_id, (orders, spent) in sorted(totals.items())])
+
+                cursor.execute("DELETE FROM sales WHERE id = ANY(%s::UUID[])", (sale_ids,))
+
+                # Written before the commit: a failed commit leaves rows in
+                # both places (archived again next run), never in neither
+                path = self._archive_path(sales[0]['sale_date'])
+                self._write_archive(path, sales, items)
+
+            archived += len(sales)
+            archived_items += len(items)
+            files.append(path)
+            if len(sales) < self.chunk_size:
+                break
+            self._pause()
+
+        return archived, archived_items, files
+
+    # ------------------------------------------------------------------
+    # audit_logs
+    # ------------------------------------------------------------------
+
+    def purge_audit_logs(self):
+        """Delete audit rows past the policy on every shard"""
+        cutoff = datetime.now().astimezone() - timedelta(days=self.audit_log_days)
+        deleted = sum(
+            self._delete_in_chunks('audit_logs', 'created_at < %s', (cutoff,), shard)
+            for shard in db.shard_names
+        )
+        return {'rows': deleted}
+
+    # ------------------------------------------------------------------
+
+    def run(self):
+        """Apply every enabled policy and report rows reclaimed and run time per table"""
+        policies = [
+            ('sales_hourly_stats', self.hourly_stats_days, self.downsample_hourly_stats),
+            # After downsampling, which reads the sketches for new daily rows
+            ('sales_hourly_sketches', self.hourly_stats_days, self.purge_hourly_sketches),
+            ('sales', self.sales_days, self.archive_sales),
+            ('audit_logs', self.audit_log_days, self.purge_audit_logs),
+        ]
+
+        report = {}
+        for table, days, apply_policy in policies:
+            if days <= 0:
+                continue
+            start = time.perf_counter()
+            try:
+                result = apply_policy()
+            except Exception as e:
+                logger.error(f"Retention failed for {table}: {e}")
+                result = {'rows': 0, 'error': str(e)}
+            result['seconds'] = round(time.perf_counter() - start, 3)
+            report[table] = result
+
+            files = result.get('files')
+            detail = f", {len(files)} archive file(s)" if files else ""
+            logger.info(f"Retention {table} (> {days} days): {result['rows']} rows reclaimed "
+                        f"in {result['seconds']:.2f}s{detail}")
+
+        return report
+
+
+def _create_retention_manager():
+    return RetentionManager(
+        hourly_stats_days=settings.RETENTION_HOURLY_STATS_DAYS,
+        sales_days=settings.RETENTION_SALES_DAYS,
+        audit_log_days=settings.RETENTION_AUDIT_LOG_DAYS,
+        archive_dir=settings.RETENTION_ARCHIVE_DIR,
+        chunk_size=settings.RETENTION_CHUNK_SIZE,
+        chunk_pause=settings.RETENTION_CHUNK_PAUSE
+    )
+
+
+# Global retention manager
+retention = _create_retention_manager()
@@ -0,0 +1,176 @@
+"""
+============================================
+Lazy Service Container
+Made by Hammad Naeem
+============================================
+
+Holds the engine's long-lived services (database pool, sales generator,
+aggregation and realtime analytics) and creates each one on first use.
+Importing this module is cheap: nothing touches the database until a
+service is actually asked for.
+
+The container also records how long each component took to import and
+initialize, which main.py reports with --profile-startup.
+"""
+
+import importlib
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """Creates engine services lazily and records startup timings"""
+    
+    # name -> (module, attribute)
+    COMPONENTS = {
+        'settings': ('config.settings', 'settings'),
+        'db': ('database.connection', 'db'),
+        'sales_generator': ('simulation.sales_generator', 'sales_generator'),
+        'aggregations': ('analytics.aggregations', 'aggregations'),
+        'realtime_analytics': ('analytics.realtime', 'realtime_analytics'),
+        'dashboard_snapshots': ('analytics.snapshots', 'dashboard_snapshots'),
+        'write_pipeline': ('simulation.pipeline', 'write_pipeline'),
+        'retention': ('maintenance.retention', 'retention'),
+        'top_products': ('analytics.top_products', 'top_products'),
+        'sales_forecaster': ('analytics.forecasting', 'sales_forecaster'),
+        'hourly_index': ('analytics.range_index', 'hourly_index'),
+        'columnar_store': ('analytics.columnar', 'columnar_store'),
+        'query_monitor': ('database.slow_queries', 'query_monitor'),
+    }
+    
+    def __init__(self):
+        self._services = {}
+        self._lock = threading.RLock()
+        self.timings = {}  # name -> {'import': seconds, 'init': seconds}
+    
+    def _record(self, name, phase, seconds):
+        self.timings.setdefault(name, {})[phase] = seconds
+    
+    def _resolve(self, name):
+        """Import and initialize a component on first use"""
+        service = self._services.get(name)
+        if service is not None:
+            return service
+        
+        with self._lock:
+            service = self._services.get(name)
+            if service is not None:
+                return service
+            
+            module_name, attribute = self.COMPONENTS[name]
+            start = time.perf_counter()
+            module = importlib.import_module(module_name)
+            self._record(name, 'import', time.perf_counter() - start)
+            
+            service = getattr(module, attribute)
+            
+            if name == 'db':
+                start = time.perf_counter()
+                if not service.ensure_pool():
+                    raise Exception("Failed to initialize connection pool")
+                self._record(name, 'init', time.perf_counter() - start)
+            
+            self._services[name] = service
+            logger.debug(f"Service '{name}' ready")
+            return service
+    
+    @property
+    def settings(self):
+        return self._resolve('settings')
+    
+    @property
+    def db(self):
+        return self._resolve('db')
+    
+    @property
+    def sales_generator(self):
+        return self._resolve('sales_generator')
+    
+    @property
+    def aggregations(self):
+        return self._resolve('aggregations')
+    
+    @property
+    def realtime_analytics(self):
+        return self._resolve('realtime_analytics')
+    
+    @property
+    def dashboard_snapshots(self):
+        return self._resolve('dashboard_snapshots')
+    
+    @property
+    def write_pipeline(self):
+        return self._resolve('write_pipeline')
+    
+    @property
+    def retention(self):
+        return self._resolve('retention')
+    
+    @property
+    def top_products(self):
+        return self._resolve('top_products')
+    
+    @property
+    def sales_forecaster(self):
+        return self._resolve('sales_forecaster')
+    
+    @property
+    def hourly_index(self):
+        return self._resolve('hourly_index')
+    
+    @property
+    def columnar_store(self):
+        return self._resolve('columnar_store')
+    
+    @property
+    def query_monitor(self):
+        return self._resolve('query_monitor')
+    
+    def start_catalog_load(self):
+        """Load the generator's catalog in the background"""
+        generator = self.sales_generator
+        start = time.perf_counter()
+        
+        def _timed_load():
+            generator.ensure_loaded()
+            self._record('sales_generator', 'init', time.perf_counter() - start)
+        
+        if generator.is_loaded:
+            return None
+        
+        thread = threading.Thread(target=self._run_quietly, args=(_timed_load,), name='catalog-loader', daemon=True)
+        thread.start()
+        return thread
+    
+    @staticmethod
+    def _run_quietly(func):
+        try:
+            func()
+        except Exception:
+            # Already logged by the component; the next use retries
+            pass
+    
+    def is_initialized(self, name):
+        """Whether a component has been created"""
+        return name in self._services
+    
+    def startup_report(self):
+        """Format the per-component import and init timings"""
+        lines = ["Startup profile:", f"  {'component':<22} {'import ms':>10} {'init ms':>10}"]
+        for name in self.COMPONENTS:
+            timing = self.timings.get(name)
+            if timing is None:
+                lines.append(f"  {name:<22} {'not used':>10}")
+                continue
+            import_ms = timing.get('import', 0) * 1000
+            init_ms = timing.get('init')
+            init_text = f"{init_ms * 1000:>10.1f}" if init_ms is not None else f"{'-':>10}"
+            lines.append(f"  {name:<22} {import_ms:>10.1f} {init_text}")
+        return "\n".join(lines)
+
+
+# Global service container
+container = ServiceContainer()
@@ -9,6 +9,17 @@ import random
 from datetime import datetime
 from config.settings import settings
 
+PAYMENT_METHODS = ['cash', 'card', 'bank_transfer', 'online']
+
+# Every random choice of the simulator comes from this generator, so a
+# SIMULATION_SEED makes the generated workload reproducible
+rng = random.Random(settings.SIMULATION_SEED)
+
+
+def seed(value):
+    """Reseed the simulator's random generator (None = fresh entropy)"""
+    rng.seed(value)
+
 
 class SalesPatterns:
     """Handles sales pattern logic for realistic simulation"""
@@ -63,7 +74,7 @@ class SalesPatterns:
         adjusted_min = max(1, int(base_min * multiplier))
         adjusted_max = max(adjusted_min, int(base_max * multiplier))
         
-        return random.randint(adjusted_min, adjusted_max)
+        return rng.randint(adjusted_min, adjusted_max)
     
     @staticmethod
     def get_items_per_sale():
@@ -72,25 +83,24 @@ class SalesPatterns:
         
         # More items during peak hours
         if time_of_day == 'evening':
-            return random.randint(1, 5)
+            return rng.randint(1, 5)
         elif time_of_day == 'afternoon':
-            return random.randint(1, 4)
+            return rng.randint(1, 4)
         else:
-            return random.randint(1, 3)
+            return rng.randint(1, 3)
     
     @staticmethod
     def get_payment_method():
         """Get random payment method with weighted probability"""
-        methods = ['cash', 'card', 'bank_transfer', 'online']
         weights = [0.3, 0.35, 0.15, 0.2]  # 30% cash, 35% card, etc.
         
-        return random.choices(methods, weights=weights)[0]
+        return rng.choices(PAYMENT_METHODS, weights=weights)[0]
     
     @staticmethod
     def should_have_customer():
         """Determine if sale should have a registered customer"""
         # 60% chance of having a registered customer
-        return random.random() < 0.6
+        return rng.random() < 0.6
     
     @staticmethod
     def get_quantity_for_product():
@@ -99,4 +109,4 @@ class SalesPatterns:
         weights = [0.5, 0.3, 0.12, 0.05, 0.03]  # 1, 2, 3, 4, 5 items
         quantities = [1, 2, 3, 4, 5]
         
-        return random.choices(quantities, weights=weights)[0]
\ No newline at end of file
+        return rng.choices(quantities, weights=weights)[0]
\ No newline at end of file
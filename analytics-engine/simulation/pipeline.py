@@ -0,0 +1,214 @@
+"""
+============================================
+Write-Behind Sales Pipeline
+Made by Hammad Naeem
+============================================
+
+Decouples sale generation from database writes:
+
+- generators submit finished sales into a bounded queue
+- writer threads drain the queue in flushes bounded by size and time
+- a full queue blocks producers (backpressure) for up to put_timeout
+  seconds, after which the sale is rejected and counted
+- stop(drain=True) writes everything still queued before returning
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+import logging
+
+from config.settings import settings
+from simulation.sales_generator import sales_generator
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class SaleWritePipeline:
+    """Bounded producer/consumer pipeline for sale writes"""
+
+    def __init__(self, writer, max_queue_size=1000, flush_size=50, flush_interval=1.0,
+                 writers=1, put_timeout=5.0):
+        self.writer = writer
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.writer_count = writers
+        self.put_timeout = put_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._threads = []
+        self._state = 'idle'  # idle -> running -> stopping
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+
+        # Metrics
+        self._flush_latencies = deque(maxlen=500)
+        self._max_depth = 0
+        self._submitted = 0
+        self._written = 0
+        self._failed = 0
+        self._rejected = 0
+        self._flushes = 0
+
+    def start(self):
+        """Start the writer threads (idempotent)"""
+        with self._lock:
+            if self._state != 'idle':
+                return
+            self._state = 'running'
+            for i in range(self.writer_count):
+                thread = threading.Thread(target=self._run_writer, name=f'sale-writer-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Write pipeline started ({self.writer_count} writer(s), "
+                        f"queue {self._queue.maxsize}, flush {self.flush_size}/{self.flush_interval}s)")
+
+    @property
+    def is_running(self):
+        return self._state == 'running'
+
+    def submit(self, sale):
+        """Queue a sale for writing, blocking while the queue is full"""
+        if self._state == 'idle':
+            self.start()
+        if self._state != 'running':
+            logger.warning("Write pipeline is stopping; sale rejected")
+            with self._metrics_lock:
+                self._rejected += 1
+            return False
+
+        try:
+            self._queue.put(sale, timeout=self.put_timeout)
+        except queue.Full:
+            with self._metrics_lock:
+                self._rejected += 1
+            logger.warning(f"Write pipeline queue full for {self.put_timeout}s; sale rejected")
+            return False
+
+        with self._metrics_lock:
+            self._submitted += 1
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+        return True
+
+    def _run_writer(self):
+        """Writer thread: collect size/time bounded batches and flush them"""
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """Write one batch and record its latency"""
+        start = time.perf_counter()
+        try:
+            written = self.writer(batch)
+            elapsed = time.perf_counter() - start
+            with self._metrics_lock:
+                self._flush_latencies.append(elapsed)
+                self._flushes += 1
+                self._written += written
+                self._failed += len(batch) - written
+            logger.info(f"Flushed {written}/{len(batch)} sales in {elapsed * 1000:.1f} ms "
+                        f"(queue depth {self._queue.qsize()})")
+        except Exception as e:
+            with self._metrics_lock:
+                self._failed += len(batch)
+            logger.error(f"Failed to flush {len(batch)} sales: {e}")
+
+    def stop_accepting(self):
+        """Stop taking new sales; safe to call from a signal handler"""
+        if self._state == 'running':
+            self._state = 'stopping'
+
+    def stop(self, drain=True, timeout=30):
+        """Stop the writers, writing everything still queued when drain is set"""
+        with self._lock:
+            self._state = 'stopping'
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+
+        if not drain:
+            dropped = 0
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    dropped += 1
+                except queue.Empty:
+                    break
+            with self._metrics_lock:
+                self._failed += dropped
+            logger.warning(f"Write pipeline stopped without draining; {dropped} sales dropped")
+        else:
+            logger.info(f"Draining write pipeline ({self._queue.qsize()} sales queued)...")
+
+        # Sentinels go behind the queued sales, so each writer drains first
+        for _ in threads:
+            self._queue.put(_STOP)
+
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+        if any(thread.is_alive() for thread in threads):
+            logger.warning(f"Write pipeline did not drain within {timeout}s")
+        else:
+            logger.info("Write pipeline drained")
+        logger.info(f"Write pipeline metrics: {self.metrics()}")
+
+    def metrics(self):
+        """Queue depth, throughput and flush latency metrics"""
+        with self._metrics_lock:
+            latencies = sorted(self._flush_latencies)
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self._max_depth,
+            'submitted': self._submitted,
+            'written': self._written,
+            'failed': self._failed,
+            'rejected': self._rejected,
+            'flushes': self._flushes,
+            'flush_latency_avg_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            'flush_latency_p95_ms': round(latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000, 2) if latencies else 0.0,
+            'flush_latency_max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0
+        }
+
+
+def _create_pipeline():
+    return SaleWritePipeline(
+        writer=sales_generator.write_sales,
+        max_queue_size=settings.WRITE_PIPELINE_QUEUE_SIZE,
+        flush_size=settings.WRITE_PIPELINE_FLUSH_SIZE,
+        flush_interval=settings.WRITE_PIPELINE_FLUSH_INTERVAL,
+        writers=settings.WRITE_PIPELINE_WRITERS,
+        put_timeout=settings.WRITE_PIPELINE_PUT_TIMEOUT
+    )
+
+
+# Global pipeline instance (writer threads start on first submit)
+write_pipeline = _create_pipeline()
@@ -11,13 +11,18 @@ Generates realistic sales data based on:
 - Random but realistic product combinations
 """
 
-import random
+import threading
 import uuid
+from collections import defaultdict
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 import logging
 
+from psycopg2.extras import execute_values
+
+from config.settings import settings
 from database.connection import db
-from simulation.patterns import SalesPatterns
+from simulation.patterns import SalesPatterns, rng
 
 logger = logging.getLogger(__name__)
 
@@ -30,60 +35,99 @@ class SalesGenerator:
         self.shops = []
         self.products = {}  # website_id -> list of products
         self.customers = []
-        self._load_data()
+        self._loaded = threading.Event()
+        self._load_lock = threading.Lock()
+        self._sale_listeners = []
+        self.recorder = None  # WorkloadRecorder capturing built sales, if recording
+    
+    def add_sale_listener(self, listener):
+        """Call listener(sales) with every list of sales once they are committed"""
+        self._sale_listeners.append(listener)
+    
+    def _notify_written(self, sales):
+        if not sales:
+            return
+        for listener in self._sale_listeners:
+            try:
+                listener(sales)
+            except Exception as e:
+                logger.error(f"Sale listener failed: {e}")
     
     def _load_data(self):
         """Load necessary data from database"""
         try:
-            # Load active websites
-            self.websites = db.execute_query(
-                "SELECT id, name FROM websites WHERE is_active = true"
+            # Load active websites (ordered, so a seeded simulator picks the same ones)
+            websites = db.execute_query(
+                "SELECT id, name FROM websites WHERE is_active = true ORDER BY id"
             )
-            logger.info(f"Loaded {len(self.websites)} websites")
+            logger.info(f"Loaded {len(websites)} websites")
             
             # Load shops
-            self.shops = db.execute_query(
-                "SELECT id, website_id, name FROM shops WHERE is_active = true"
+            shops = db.execute_query(
+                "SELECT id, website_id, name FROM shops WHERE is_active = true ORDER BY id"
             )
-            logger.info(f"Loaded {len(self.shops)} shops")
+            logger.info(f"Loaded {len(shops)} shops")
             
             # Load products for each website
-            for website in self.websites:
-                products = db.execute_query("""
+            products = {}
+            for website in websites:
+                website_products = db.execute_query("""
                     SELECT p.id, p.name, p.unit_price, p.stock_quantity
                     FROM products p
                     JOIN website_products wp ON p.id = wp.product_id
                     WHERE wp.website_id = %s AND p.is_active = true AND p.stock_quantity > 0
+                    ORDER BY p.id
                 """, (website['id'],))
-                self.products[website['id']] = products
-                logger.info(f"Loaded {len(products)} products for website {website['name']}")
+                products[website['id']] = website_products
+                logger.info(f"Loaded {len(website_products)} products for website {website['name']}")
             
             # Load customers
-            self.customers = db.execute_query(
-                "SELECT id FROM customers"
+            customers = db.execute_query(
+                "SELECT id FROM customers ORDER BY id"
             )
-            logger.info(f"Loaded {len(self.customers)} customers")
+            logger.info(f"Loaded {len(customers)} customers")
+            
+            # Swap in the new catalog only once it is complete
+            self.websites = websites
+            self.shops = shops
+            self.products = products
+            self.customers = customers
+            self._loaded.set()
             
         except Exception as e:
             logger.error(f"Failed to load data: {e}")
             raise
     
+    def ensure_loaded(self):
+        """Load data on first use, waiting for a background load in progress"""
+        if self._loaded.is_set():
+            return
+        with self._load_lock:
+            if not self._loaded.is_set():
+                self._load_data()
+    
+    @property
+    def is_loaded(self):
+        """Whether the catalog has been loaded"""
+        return self._loaded.is_set()
+    
     def reload_data(self):
         """Reload data from database"""
-        self._load_data()
+        with self._load_lock:
+            self._load_data()
     
     def _get_random_website(self):
         """Get a random active website"""
         if not self.websites:
             return None
-        return random.choice(self.websites)
+        return rng.choice(self.websites)
     
     def _get_shop_for_website(self, website_id):
         """Get a random shop for a website"""
         website_shops = [s for s in self.shops if s['website_id'] == website_id]
         if not website_shops:
             return None
-        return random.choice(website_shops)
+        return rng.choice(website_shops)
     
     def _get_products_for_website(self, website_id, count):
         """Get random products for a website"""
@@ -93,79 +137,103 @@ class SalesGenerator:
         
         # Don't select more products than available
         count = min(count, len(available_products))
-        return random.sample(available_products, count)
+        return rng.sample(available_products, count)
     
     def _get_random_customer(self):
         """Get a random customer or None"""
         if not self.customers or not SalesPatterns.should_have_customer():
             return None
-        return random.choice(self.customers)
+        return rng.choice(self.customers)
     
-    def generate_sale(self):
-        """Generate a single sale with items"""
-        try:
-            # Select random website
-            website = self._get_random_website()
-            if not website:
-                logger.warning("No active websites available")
-                return None
-            
-            # Get shop for website
-            shop = self._get_shop_for_website(website['id'])
-            
-            # Get random products
-            item_count = SalesPatterns.get_items_per_sale()
-            products = self._get_products_for_website(website['id'], item_count)
-            
-            if not products:
-                logger.warning(f"No products available for website {website['name']}")
-                return None
+    def _build_sale(self):
+        """Build a single sale with items, without writing it"""
+        self.ensure_loaded()
+        
+        # Select random website
+        website = self._get_random_website()
+        if not website:
+            logger.warning("No active websites available")
+            return None
+        
+        # Get shop for website
+        shop = self._get_shop_for_website(website['id'])
+        
+        # Get random products
+        item_count = SalesPatterns.get_items_per_sale()
+        products = self._get_products_for_website(website['id'], item_count)
+        
+        if not products:
+            logger.warning(f"No products available for website {website['name']}")
+            return None
+        
+        # Get customer
+        customer = self._get_random_customer()
+        
+        # Prepare sale items
+        items = []
+        subtotal = 0
+        
+        for product in products:
+            quantity = SalesPatterns.get_quantity_for_product()
             
-            # Get customer
-            customer = self._get_random_customer()
+            # Check stock
+            if product['stock_quantity'] < quantity:
+                quantity = max(1, product['stock_quantity'])
             
-            # Prepare sale items
-            items = []
-            subtotal = 0
+            unit_price = float(product['unit_price'])
+            line_total = unit_price * quantity
             
-            for product in products:
-                quantity = SalesPatterns.get_quantity_for_product()
-                
-                # Check stock
-                if product['stock_quantity'] < quantity:
-                    quantity = max(1, product['stock_quantity'])
-                
-                unit_price = float(product['unit_price'])
-                line_total = unit_price * quantity
-                
-                items.append({
-                    'product_id': product['id'],
-                    'product_name': product['name'],
-                    'quantity': quantity,
-                    'unit_price': unit_price,
-                    'line_total': line_total
-                })
-                
-                subtotal += line_total
+            items.append({
+                'product_id': product['id'],
+                'product_name': product['name'],
+                'quantity': quantity,
+                'unit_price': unit_price,
+                'line_total': line_total
+            })
             
-            # Calculate totals
-            tax_amount = subtotal * 0.17  # 17% GST
-            total_amount = subtotal + tax_amount
+            subtotal += line_total
+        
+        # Calculate totals
+        tax_amount = subtotal * 0.17  # 17% GST
+        total_amount = subtotal + tax_amount
+        
+        sale = {
+            'website_id': website['id'],
+            'website_name': website['name'],
+            'shop_id': shop['id'] if shop else None,
+            'customer_id': customer['id'] if customer else None,
+            'subtotal': subtotal,
+            'tax_amount': tax_amount,
+            'total_amount': total_amount,
+            'payment_method': SalesPatterns.get_payment_method(),
+            'items': items
+        }
+        if self.recorder is not None:
+            self.recorder.record_sale(sale)
+        return sale
+    
+    def generate_sale(self):
+        """Generate a single sale with items"""
+        try:
+            sale = self._build_sale()
+            if not sale:
+                return None
             
             # Create sale in database
             sale_id = self._insert_sale(
-                website_id=website['id'],
-                shop_id=shop['id'] if shop else None,
-                customer_id=customer['id'] if customer else None,
-                subtotal=subtotal,
-                tax_amount=tax_amount,
-                total_amount=total_amount,
-                payment_method=SalesPatterns.get_payment_method(),
-                items=items
+                website_id=sale['website_id'],
+                shop_id=sale['shop_id'],
+                customer_id=sale['customer_id'],
+                subtotal=sale['subtotal'],
+                tax_amount=sale['tax_amount'],
+                total_amount=sale['total_amount'],
+                payment_method=sale['payment_method'],
+                items=sale['items']
             )
             
             if sale_id:
-                logger.info(f"Generated sale {sale_id} - Amount: Rs. {total_amount:.2f} - Website: {website['name']}")
+                self._notify_written([sale])
+                logger.info(f"Generated sale {sale_id} - Amount: Rs. {sale['total_amount']:.2f} - Website: {sale['website_name']}")
                 return sale_id
             
             return None
@@ -176,8 +244,13 @@ class SalesGenerator:
     
     def _insert_sale(self, website_id, shop_id, customer_id, subtotal, tax_amount, total_amount, payment_method, items):
         """Insert sale and items into database with transaction"""
-        connection = db.get_connection()
-        cursor = connection.cursor()
+        shard = db.shard_for(website_id)
+        connection = db.get_connection(shard)
+        try:
+            cursor = db.open_cursor(connection, shard)
+        except Exception:
+            db.release_connection(connection, shard)
+            raise
         
         try:
             # Start transaction
@@ -237,25 +310,332 @@ class SalesGenerator:
             raise
         finally:
             cursor.close()
-            db.release_connection(connection)
+            db.release_connection(connection, shard)
+    
+    @staticmethod
+    def _stock_steps(stock, sales):
+        """
+        Replay the stock changes row mode makes, sale by sale.
+        
+        Every sale item first goes through update_stock_on_sale (stock -
+        quantity, which the stock CHECK rejects below zero) and then through
+        _insert_sale's explicit GREATEST(0, stock - quantity). A sale that
+        would be rejected changes nothing, as its own transaction would roll
+        back. `stock` ({product_id: level}) is updated in place.
+        Returns (accepted sales, [(product_id, old stock, new stock)] in order).
+        """
+        accepted = []
+        steps = []
+        for sale in sales:
+            levels = {}
+            sale_steps = []
+            for item in sale['items']:
+                product_id, quantity = item['product_id'], item['quantity']
+                level = levels.get(product_id, stock.get(product_id))
+                if level is None or level - quantity < 0:
+                    logger.error(f"Failed to insert sale: not enough stock of product {product_id}")
+                    break
+                after_trigger = level - quantity
+                after_update = max(0, after_trigger - quantity)
+                sale_steps += [(product_id, level, after_trigger), (product_id, after_trigger, after_update)]
+                levels[product_id] = after_update
+            else:
+                accepted.append(sale)
+                steps.extend(sale_steps)
+                stock.update(levels)
+        return accepted, steps
     
-    def generate_batch(self):
-        """Generate a batch of sales based on current patterns"""
+    def _insert_sales_bulk(self, sales, shard=None):
+        """
+        Insert a batch of sales with set-based statements in one transaction.
+        
+        The transaction runs with audit_mode 'statement', so the per-row
+        audit and stock triggers stand aside and the batch writes what they
+        would have: the stock changes of _stock_steps, two per sale item,
+        and the same audit_logs rows as row mode, each table's in one
+        INSERT ... SELECT. Sales row mode would reject for stock are
+        skipped. All sales must belong to websites on `shard` (see
+        _group_by_shard). Returns (sale_id, sale) pairs of the sales written.
+        """
+        connection = db.get_connection(shard)
+        try:
+            cursor = db.open_cursor(connection, shard)
+        except Exception:
+            db.release_connection(connection, shard)
+            raise
+        
+        try:
+            cursor.execute("BEGIN")
+            cursor.execute("SET LOCAL sales_analytics.audit_mode = 'statement'")
+            if settings.CUSTOMER_STATS_MODE == 'batch':
+                cursor.execute("SET LOCAL sales_analytics.customer_stats_mode = 'batch'")
+            
+            # Lock the batch's products in id order, so concurrent batches
+            # sharing products cannot deadlock, and read the stock to replay.
+            # NO KEY UPDATE is the lock the stock UPDATE takes; FOR UPDATE
+            # would also wait on the key-share locks other batches' sale_items hold
+            product_ids = sorted({item['product_id'] for sale in sales for item in sale['items']})
+            cursor.execute("""
+                SELECT id, stock_quantity FROM products
+                WHERE id = ANY(%s)
+                ORDER BY id
+                FOR NO KEY UPDATE
+            """, (product_ids,))
+            stock = dict(cursor.fetchall())
+            sales, steps = self._stock_steps(stock, sales)
+            if not sales:
+                cursor.execute("COMMIT")
+                return []
+            
+            # Insert all sales in one statement with their audit rows
+            # (RETURNING keeps VALUES order)
+            sale_rows = execute_values(cursor, """
+                WITH inserted AS (
+                    INSERT INTO sales (
+                        website_id, shop_id, customer_id,
+                        subtotal, tax_amount, total_amount,
+                        payment_method, payment_status, order_status,
+                        notes
+                    )
+                    VALUES %s
+                    RETURNING *
+                ), audited AS (
+                    INSERT INTO audit_logs (table_name, record_id, action, old_values, new_values)
+                    SELECT 'sales', inserted.id::VARCHAR, 'INSERT', NULL, to_jsonb(inserted)
+                    FROM inserted
+                )
+                SELECT id FROM inserted
+            """, [
+                (
+                    sale['website_id'], sale['shop_id'], sale['customer_id'],
+                    sale['subtotal'], sale['tax_amount'], sale['total_amount'],
+                    sale['payment_method'], 'completed', 'completed',
+                    'Auto-generated sale'
+                )
+                for sale in sales
+            ], page_size=len(sales), fetch=True)
+            sale_ids = [row[0] for row in sale_rows]
+            
+            # Insert all sale items in one statement
+            execute_values(cursor, """
+                INSERT INTO sale_items (
+                    sale_id, product_id, product_name,
+                    quantity, unit_price, line_total
+                )
+                VALUES %s
+            """, [
+                (
+                    sale_id,
+                    item['product_id'],
+                    item['product_name'],
+                    item['quantity'],
+                    item['unit_price'],
+                    item['line_total']
+                )
+                for sale_id, sale in zip(sale_ids, sales)
+                for item in sale['items']
+            ], page_size=1000)
+            
+            # One products audit row per stock change, as the per-row trigger
+            # writes them: each UPDATE also sets updated_at, so only a
+            # product's first change starts from its stored updated_at
+            changed = set()
+            audit_steps = []
+            for position, (product_id, old_level, new_level) in enumerate(steps):
+                audit_steps.append((position, product_id, old_level, new_level, product_id not in changed))
+                changed.add(product_id)
+            execute_values(cursor, """
+                INSERT INTO audit_logs (table_name, record_id, action, old_values, new_values)
+                SELECT
+                    'products', p.id::VARCHAR, 'UPDATE',
+                    to_jsonb(p) || jsonb_build_object(
+                        'stock_quantity', s.old_level,
+                        'updated_at', CASE WHEN s.first THEN p.updated_at ELSE CURRENT_TIMESTAMP END
+                    ),
+                    to_jsonb(p) || jsonb_build_object('stock_quantity', s.new_level, 'updated_at', CURRENT_TIMESTAMP)
+                FROM (VALUES %s) AS s(position, product_id, old_level, new_level, first)
+                JOIN products p ON p.id = s.product_id
+                ORDER BY s.position
+            """, audit_steps, page_size=len(audit_steps))
+            
+            # Then one stock update per product to its final level
+            execute_values(cursor, """
+                UPDATE products p
+                SET stock_quantity = d.stock_quantity
+                FROM (VALUES %s) AS d(product_id, stock_quantity)
+                WHERE p.id = d.product_id
+            """, [
+                (product_id, stock[product_id])
+                for product_id in sorted(changed)
+            ], page_size=len(changed))
+            
+            if settings.CUSTOMER_STATS_MODE == 'batch':
+                self._apply_customer_deltas(cursor, sales)
+            
+            cursor.execute("COMMIT")
+            
+            return list(zip(sale_ids, sales))
+            
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            logger.error(f"Failed to insert sales batch: {e}")
+            raise
+        finally:
+            cursor.close()
+            db.release_connection(connection, shard)
+    
+    @staticmethod
+    def _group_by_shard(sales):
+        """Split sales by the database shard of their website"""
+        groups = defaultdict(list)
+        for sale in sales:
+            groups[db.shard_for(sale['website_id'])].append(sale)
+        return groups
+    
+    def _write_bulk_by_shard(self, sales):
+        """Bulk-write sales with one transaction per shard, returning (sale_id, sale) pairs"""
+        written = []
+        for shard, shard_sales in self._group_by_shard(sales).items():
+            try:
+                written.extend(self._insert_sales_bulk(shard_sales, shard=shard))
+            except Exception:
+                # Already logged by _insert_sales_bulk; other shards still commit
+                pass
+        self._notify_written([sale for _, sale in written])
+        return written
+    
+    def write_sales(self, sales):
+        """Write already-built sales using the configured audit mode, returning the count written"""
+        if settings.AUDIT_MODE == 'statement':
+            return len(self._write_bulk_by_shard(sales))
+        
+        written = []
+        for sale in sales:
+            try:
+                self._insert_sale(
+                    website_id=sale['website_id'],
+                    shop_id=sale['shop_id'],
+                    customer_id=sale['customer_id'],
+                    subtotal=sale['subtotal'],
+                    tax_amount=sale['tax_amount'],
+                    total_amount=sale['total_amount'],
+                    payment_method=sale['payment_method'],
+                    items=sale['items']
+                )
+                written.append(sale)
+            except Exception:
+                # Already logged by _insert_sale; keep writing the rest
+                pass
+        self._notify_written(written)
+        return len(written)
+    
+    @staticmethod
+    def _customer_deltas(sales):
+        """Per-customer order count and spend for a batch, ordered by customer id"""
+        deltas = defaultdict(lambda: [0, Decimal('0')])
+        for sale in sales:
+            if sale['customer_id'] is None:
+                continue
+            delta = deltas[sale['customer_id']]
+            delta[0] += 1
+            # Round like the DECIMAL(15, 2) column the trigger reads back
+            delta[1] += Decimal(repr(sale['total_amount'])).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return [(customer_id, orders, spent) for customer_id, (orders, spent) in sorted(deltas.items())]
+    
+    def _apply_customer_deltas(self, cursor, sales):
+        """
+        Apply a batch's customer stats in one set-based UPDATE.
+        
+        The UPDATE locks rows in join order, not VALUES order, so the rows
+        are locked in customer id order first: concurrent writers then take
+        popular customers in the same order (see _insert_sales_bulk for why
+        the lock is NO KEY UPDATE).
+        """
+        deltas = self._customer_deltas(sales)
+        if not deltas:
+            return
+        
+        cursor.execute("""
+            SELECT id FROM customers
+            WHERE id = ANY(%s)
+            ORDER BY id
+            FOR NO KEY UPDATE
+        """, ([customer_id for customer_id, _, _ in deltas],))
+        
+        execute_values(cursor, """
+            UPDATE customers c
+            SET 
+                total_orders = c.total_orders + d.orders,
+                total_spent = c.total_spent + d.spent,
+                updated_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS d(customer_id, orders, spent)
+            WHERE c.id = d.customer_id
+        """, deltas, template='(%s, %s, %s::NUMERIC)', page_size=len(deltas))
+    
+    def generate_batch(self, pipeline=None):
+        """
+        Generate a batch of sales based on current patterns.
+        
+        With a write pipeline, finished sales are queued for the pipeline's
+        writer threads instead of being written before the next one is built.
+        """
+        if self.recorder is not None:
+            self.recorder.begin_batch()
         sales_count = SalesPatterns.get_sales_count()
         logger.info(f"Generating {sales_count} sales (Time: {SalesPatterns.get_time_of_day()}, Multiplier: {SalesPatterns.get_sales_multiplier():.2f})")
         
-        generated = 0
-        for _ in range(sales_count):
-            if self.generate_sale():
-                generated += 1
+        if pipeline is not None:
+            queued = 0
+            for _ in range(sales_count):
+                try:
+                    sale = self._build_sale()
+                except Exception as e:
+                    logger.error(f"Failed to generate sale: {e}")
+                    continue
+                if sale and pipeline.submit(sale):
+                    queued += 1
+            logger.info(f"Queued {queued}/{sales_count} sales for writing")
+            return queued
+        
+        if settings.AUDIT_MODE == 'statement':
+            generated = self._generate_batch_bulk(sales_count)
+        else:
+            generated = 0
+            for _ in range(sales_count):
+                if self.generate_sale():
+                    generated += 1
         
         logger.info(f"Successfully generated {generated}/{sales_count} sales")
         return generated
     
+    def build_batch(self):
+        """Build one batch of sales, sized by the current patterns, without writing it"""
+        if self.recorder is not None:
+            self.recorder.begin_batch()
+        return [sale for sale in (self._build_sale() for _ in range(SalesPatterns.get_sales_count())) if sale]
+    
+    def _generate_batch_bulk(self, sales_count):
+        """Generate sales_count sales and write them with one bulk transaction"""
+        try:
+            sales = [sale for sale in (self._build_sale() for _ in range(sales_count)) if sale]
+            if not sales:
+                return 0
+            
+            written = self._write_bulk_by_shard(sales)
+            for sale_id, sale in written:
+                logger.info(f"Generated sale {sale_id} - Amount: Rs. {sale['total_amount']:.2f} - Website: {sale['website_name']}")
+            
+            return len(written)
+            
+        except Exception as e:
+            logger.error(f"Failed to generate sales batch: {e}")
+            return 0
+    
     def replenish_stock(self):
         """Replenish stock for products running low"""
         try:
-            db.execute_query("""
+            # Each shard tracks stock for the sales written to it
+            db.scatter_query("""
                 UPDATE products
                 SET stock_quantity = stock_quantity + 100
                 WHERE stock_quantity < reorder_level
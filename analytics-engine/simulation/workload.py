@@ -0,0 +1,174 @@
+"""
+============================================
+Workload Traces
+Made by Hammad Naeem
+============================================
+
+Records the simulator's workload (every generated sale with its items,
+grouped by batch, and every job invocation) into a compact binary trace,
+so the exact same load can be replayed against another build with
+`python -m benchmarks replay`.
+
+Trace layout (little-endian):
+
+    header:  magic b'SATRACE1', version u16, recorded_at f64 (epoch), seed i64 (-1 = unseeded)
+    record:  kind (b'S' sale, b'J' job), offset f64 (seconds since recording started)
+    sale:    batch u32, website i32, shop i32, customer i32 (-1 = none),
+             payment method u8, subtotal f64, tax f64, total f64, item count u16,
+             then per item: product i32, quantity u16, unit price f64, line total f64
+    job:     job code u8 (index into JOBS)
+
+Names are not stored; replay looks them up in the target database's catalog.
+"""
+
+import struct
+import threading
+import time
+import logging
+
+from simulation.patterns import PAYMENT_METHODS
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SATRACE1'
+VERSION = 1
+
+# Jobs a trace can record, by code
+JOBS = ('generate_sales', 'aggregate_stats', 'dashboard_snapshot', 'replenish_stock', 'reconcile_customer_stats')
+
+_HEADER = struct.Struct('<8sHdq')
+_RECORD = struct.Struct('<cd')
+_SALE = struct.Struct('<IiiiBdddH')
+_ITEM = struct.Struct('<iHdd')
+_JOB = struct.Struct('<B')
+
+
+def _id(value):
+    return -1 if value is None else value
+
+
+class WorkloadRecorder:
+    """
+    Appends generated sales and job invocations to a trace file.
+
+    clock: callable returning the offset of events recorded without an
+    explicit one (default: seconds since the recorder was created).
+    """
+
+    def __init__(self, path, seed=None, clock=None):
+        self.path = path
+        self.clock = clock
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, time.time(), -1 if seed is None else seed))
+        self._started = time.monotonic()
+        self._batch = 0
+        self._lock = threading.Lock()
+        self.sales = 0
+        self.jobs = 0
+
+    def _offset(self, at):
+        if at is not None:
+            return at
+        return self.clock() if self.clock else time.monotonic() - self._started
+
+    def begin_batch(self):
+        """Start a new batch; sales recorded after this belong to it"""
+        with self._lock:
+            self._batch += 1
+            # Keep the trace usable up to the last full batch if the engine dies
+            self._file.flush()
+
+    def record_sale(self, sale, at=None):
+        """Record a built sale (at: offset in seconds, default now)"""
+        items = sale['items']
+        data = [
+            _RECORD.pack(b'S', self._offset(at)),
+            _SALE.pack(
+                self._batch, sale['website_id'], _id(sale['shop_id']), _id(sale['customer_id']),
+                PAYMENT_METHODS.index(sale['payment_method']),
+                sale['subtotal'], sale['tax_amount'], sale['total_amount'], len(items)
+            )
+        ]
+        data += [
+            _ITEM.pack(_id(item['product_id']), item['quantity'], item['unit_price'], item['line_total'])
+            for item in items
+        ]
+        with self._lock:
+            self._file.write(b''.join(data))
+            self.sales += 1
+
+    def record_job(self, name, at=None):
+        """Record a job invocation"""
+        with self._lock:
+            self._file.write(_RECORD.pack(b'J', self._offset(at)) + _JOB.pack(JOBS.index(name)))
+            self.jobs += 1
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                logger.info(f"Workload trace saved to {self.path} ({self.sales} sales, {self.jobs} jobs)")
+
+
+def _read(f, layout):
+    data = f.read(layout.size)
+    if len(data) < layout.size:
+        raise EOFError
+    return layout.unpack(data)
+
+
+def read_trace(path):
+    """
+    Read a trace: returns (header, events).
+
+    events is a list of ('batch', offset, [sales]) and ('job', offset, name)
+    in recorded order; a batch's offset is that of its first sale. A record
+    cut off at the end (the engine stopped mid-write) is dropped.
+    """
+    with open(path, 'rb') as f:
+        magic, version, recorded_at, seed = _read(f, _HEADER)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} workload trace")
+        header = {'recorded_at': recorded_at, 'seed': None if seed < 0 else seed}
+
+        events = []
+        current = None  # (batch number, event)
+        try:
+            while True:
+                kind, offset = _read(f, _RECORD)
+                if kind == b'J':
+                    (code,) = _read(f, _JOB)
+                    events.append(('job', offset, JOBS[code]))
+                    current = None
+                    continue
+                if kind != b'S':
+                    raise ValueError(f"Corrupt workload trace {path}: record kind {kind!r}")
+
+                batch, website_id, shop_id, customer_id, method, subtotal, tax, total, count = _read(f, _SALE)
+                items = []
+                for _ in range(count):
+                    product_id, quantity, unit_price, line_total = _read(f, _ITEM)
+                    items.append({
+                        'product_id': None if product_id < 0 else product_id,
+                        'quantity': quantity,
+                        'unit_price': unit_price,
+                        'line_total': line_total
+                    })
+                sale = {
+                    'website_id': website_id,
+                    'shop_id': None if shop_id < 0 else shop_id,
+                    'customer_id': None if customer_id < 0 else customer_id,
+                    'payment_method': PAYMENT_METHODS[method],
+                    'subtotal': subtotal,
+                    'tax_amount': tax,
+                    'total_amount': total,
+                    'items': items
+                }
+                if current is None or current[0] != batch:
+                    current = (batch, ('batch', offset, []))
+                    events.append(current[1])
+                current[1][2].append(sale)
+        except EOFError:
+            pass
+
+    return header, events
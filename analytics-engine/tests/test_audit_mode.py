@@ -0,0 +1,174 @@
+"""
+============================================
+Audit Mode Parity Tests
+Made by Hammad Naeem
+============================================
+
+Writes the same batch in 'row' and 'statement' audit mode on a throwaway
+PostgreSQL (benchmarks/postgres.py) and compares the audit trails and the
+stock left behind. Skipped when no cluster can be started, e.g. without
+the PostgreSQL binaries (PG_BIN) or when running as root.
+"""
+
+import json
+import shutil
+import subprocess
+from collections import Counter, defaultdict
+
+import psycopg2
+import pytest
+
+from benchmarks.postgres import TemporaryPostgres
+from benchmarks.schema import apply_schema, seed_catalog
+from config.settings import settings
+from database.connection import db
+from simulation.sales_generator import sales_generator
+
+# Keys that differ between two writes of the same sale
+VOLATILE_KEYS = ('id', 'sale_number', 'sale_date', 'created_at', 'updated_at')
+
+# product_id -> stock before each write: sales below run product 2 down to
+# zero (clamped by the explicit update), then one is rejected for stock
+STOCK = {1: 100, 2: 5, 3: 3}
+
+
+def _sale(*items):
+    return {
+        'website_id': 1, 'shop_id': 1, 'customer_id': 1,
+        'subtotal': 10.0, 'tax_amount': 1.7, 'total_amount': 11.7,
+        'payment_method': 'card',
+        'items': [
+            {'product_id': product_id, 'product_name': f"Product {product_id}",
+             'quantity': quantity, 'unit_price': 5.0, 'line_total': 5.0 * quantity}
+            for product_id, quantity in items
+        ]
+    }
+
+
+BATCH = [
+    _sale((1, 2), (2, 2)),
+    _sale((2, 1), (1, 1)),
+    _sale((2, 1)),
+    _sale((3, 2), (1, 3)),
+    _sale((1, 1), (1, 1)),
+]
+
+
+@pytest.fixture(scope='module')
+def database():
+    """The engine's db pointed at a fresh cluster with the benchmark catalog"""
+    pg = TemporaryPostgres()
+    try:
+        pg.start()
+    except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+        if pg.directory:
+            shutil.rmtree(pg.directory, ignore_errors=True)
+        pytest.skip(f"no throwaway PostgreSQL: {e}")
+    try:
+        connection = psycopg2.connect(host='127.0.0.1', port=pg.port, dbname=pg.database, user=pg.user)
+        try:
+            apply_schema(connection)
+            seed_catalog(connection, websites=1, products=3, customers=1)
+        finally:
+            connection.close()
+        with pytest.MonkeyPatch.context() as patch:
+            for name, value in pg.environment().items():
+                patch.setattr(type(settings), name, int(value) if name == 'DB_PORT' else value)
+            patch.setattr(type(settings), 'DB_SHARDS', [])
+            patch.setattr(db, '_pools', {})
+            patch.setattr(db, '_shard_map', {})
+            patch.setattr(db, '_replicas', {})
+            yield db
+            db.close_all()
+    finally:
+        pg.stop()
+
+
+def _reset_stock(database):
+    database.execute_query("""
+        UPDATE products p SET stock_quantity = s.stock::INTEGER
+        FROM json_each_text(%s) AS s(id, stock)
+        WHERE p.id = s.id::INTEGER
+    """, (json.dumps(STOCK),), fetch=False)
+
+
+def _products(database):
+    return {
+        row['id']: row['product']
+        for row in database.execute_query("SELECT id, to_jsonb(p) AS product FROM products p")
+    }
+
+
+def _write(database, writer):
+    """Write BATCH and return (audit rows, stock after)"""
+    last_id = database.execute_query("SELECT COALESCE(MAX(id), 0) AS id FROM audit_logs")[0]['id']
+    writer()
+    rows = database.execute_query("""
+        SELECT table_name, record_id, action, old_values, new_values
+        FROM audit_logs
+        WHERE id > %s
+        ORDER BY id
+    """, (last_id,))
+    stock = {row['id']: row['stock_quantity'] for row in database.execute_query("SELECT id, stock_quantity FROM products")}
+    return rows, stock
+
+
+def _content(rows):
+    """Audit rows without the keys that differ between writes, as a multiset"""
+    def strip(values):
+        return None if values is None else {k: v for k, v in values.items() if k not in VOLATILE_KEYS}
+
+    return Counter(
+        json.dumps([row['table_name'], row['record_id'] if row['table_name'] == 'products' else None,
+                    row['action'], strip(row['old_values']), strip(row['new_values'])], sort_keys=True)
+        for row in rows
+    )
+
+
+def _write_row_mode():
+    for sale in BATCH:
+        try:
+            sales_generator._insert_sale(
+                website_id=sale['website_id'], shop_id=sale['shop_id'], customer_id=sale['customer_id'],
+                subtotal=sale['subtotal'], tax_amount=sale['tax_amount'], total_amount=sale['total_amount'],
+                payment_method=sale['payment_method'], items=sale['items']
+            )
+        except Exception:
+            pass
+
+
+def test_statement_mode_writes_the_row_mode_audit_trail(database):
+    _reset_stock(database)
+    row_audit, row_stock = _write(database, _write_row_mode)
+    _reset_stock(database)
+    written = []
+    statement_audit, statement_stock = _write(
+        database, lambda: written.extend(sales_generator._insert_sales_bulk(BATCH))
+    )
+
+    assert len(written) == 4
+    assert statement_stock == row_stock
+    assert row_stock[2] == 0
+    assert _content(statement_audit) == _content(row_audit)
+
+
+def test_statement_mode_products_trail_chains(database):
+    _reset_stock(database)
+    before = _products(database)
+    audit, _ = _write(database, lambda: sales_generator._insert_sales_bulk(BATCH))
+    after = _products(database)
+
+    # Every change starts where the previous one of its product ended, and
+    # the last one matches the stored row
+    latest = defaultdict(lambda: None)
+    for row in audit:
+        if row['table_name'] != 'products':
+            continue
+        product_id = int(row['record_id'])
+        previous = latest[product_id]
+        if previous is None:
+            assert row['old_values'] == before[product_id]
+        else:
+            assert row['old_values'] == previous
+        latest[product_id] = row['new_values']
+    assert dict(latest) == {product_id: after[product_id] for product_id in latest}
@@ -0,0 +1,34 @@
+"""
+============================================
+Database Connection Tests
+Made by Hammad Naeem
+============================================
+
+Cursors are created on a stand-in connection, so no database is needed.
+"""
+
+import pytest
+from psycopg2.extensions import cursor as TupleCursor
+from psycopg2.extras import RealDictCursor
+
+from database.connection import db
+from database.slow_queries import query_monitor
+
+
+class _Connection:
+    """Stands in for a pooled connection: builds the cursor without connecting"""
+
+    def cursor(self, cursor_factory):
+        return cursor_factory.__new__(cursor_factory)
+
+
+@pytest.mark.parametrize('enabled', [True, False])
+@pytest.mark.parametrize('cursor_factory', [TupleCursor, RealDictCursor])
+def test_open_cursor_carries_route_and_shard(monkeypatch, enabled, cursor_factory):
+    monkeypatch.setattr(query_monitor, 'enabled', enabled)
+    monkeypatch.setattr(db, '_cursor_classes', {})
+    cursor = db.open_cursor(_Connection(), 'shard_1', cursor_factory)
+    assert isinstance(cursor, cursor_factory)
+    assert (cursor.route, cursor.shard) == ('shard_1/primary', 'shard_1')
+    # Only a timed cursor overrides execute()
+    assert (type(cursor).execute is not cursor_factory.execute) == enabled
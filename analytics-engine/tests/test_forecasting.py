@@ -0,0 +1,83 @@
+"""
+============================================
+Holt-Winters Tests
+Made by Hammad Naeem
+============================================
+"""
+
+import numpy as np
+
+from analytics.forecasting import PARAMETER_GRID, SEASON, holt_winters
+
+DAYS = 8 * SEASON
+PATTERN = np.array([10.0, 12.0, 8.0, 5.0, -3.0, -15.0, -17.0])  # sums to zero
+
+
+def _series(noise=0.0, seed=0):
+    """Two daily series with a trend and weekly pattern, starting on a Wednesday"""
+    weekdays = (np.arange(DAYS) + 2) % SEASON
+    t = np.arange(DAYS)
+    noise = np.random.default_rng(seed).normal(0, noise, size=(2, DAYS)) if noise else 0
+    y = np.stack([100 + 0.5 * t + PATTERN[weekdays], 40 - 0.2 * t + 2 * PATTERN[weekdays]]) + noise
+    return y, weekdays
+
+
+def _scalar_holt_winters(y, weekdays, alpha, beta, gamma):
+    """Reference ETS(A,A,A) for one series, one day at a time"""
+    level = y[:SEASON].mean()
+    trend = (y[SEASON:2 * SEASON].mean() - level) / SEASON
+    season = [0.0] * SEASON
+    for t in range(SEASON):
+        season[weekdays[t]] = y[t] - level
+    sse = 0.0
+    for t in range(len(y)):
+        error = y[t] - (level + trend + season[weekdays[t]])
+        if t >= SEASON:
+            sse += error * error
+        level, trend = level + trend + alpha * error, trend + beta * error
+        season[weekdays[t]] += gamma * error
+    return level, trend, season, sse
+
+
+def test_vectorized_fit_matches_scalar():
+    y, weekdays = _series(noise=3.0, seed=1)
+    alpha, beta, gamma = (PARAMETER_GRID[:, column][:, None] for column in range(3))
+    level, trend, season, sse, count = holt_winters(y, weekdays, alpha, beta, gamma)
+
+    assert level.shape == (len(PARAMETER_GRID), 2)
+    assert season.shape == (len(PARAMETER_GRID), 2, SEASON)
+    assert count == DAYS - SEASON
+    for p in range(0, len(PARAMETER_GRID), 7):
+        for s in range(2):
+            expected = _scalar_holt_winters(y[s], weekdays, *PARAMETER_GRID[p])
+            assert np.isclose(level[p, s], expected[0])
+            assert np.isclose(trend[p, s], expected[1])
+            assert np.allclose(season[p, s], expected[2])
+            assert np.isclose(sse[p, s], expected[3])
+
+
+def test_fit_tracks_trend_and_season():
+    y, weekdays = _series()
+    params = (np.array([0.2, 0.2]), np.array([0.01, 0.01]), np.array([0.15, 0.15]))
+    level, trend, season, _, _ = holt_winters(y, weekdays, *params)
+
+    # The first week's seasonal estimate absorbs some of its trend, so allow a little slack
+    assert np.allclose(trend, [0.5, -0.2], atol=0.02)
+    tomorrow = (weekdays[-1] + 1) % SEASON
+    forecast = level + trend + season[:, tomorrow]
+    expected = [100 + 0.5 * DAYS + PATTERN[tomorrow], 40 - 0.2 * DAYS + 2 * PATTERN[tomorrow]]
+    assert np.allclose(forecast, expected, rtol=0.01)
+
+
+def test_continuing_from_state_equals_one_pass():
+    y, weekdays = _series(noise=2.0, seed=4)
+    params = (np.array([0.35, 0.1]), np.array([0.05, 0.0]), np.array([0.05, 0.3]))
+    whole = holt_winters(y, weekdays, *params)
+
+    split = DAYS - 5
+    first = holt_winters(y[:, :split], weekdays[:split], *params)
+    rest = holt_winters(y[:, split:], weekdays[split:], *params, state=first[:3])
+    for part in range(3):
+        assert np.allclose(rest[part], whole[part])
+    assert np.allclose(first[3] + rest[3], whole[3])
+    assert first[4] + rest[4] == whole[4]
@@ -0,0 +1,143 @@
+"""
+============================================
+Write Pipeline Tests
+Made by Hammad Naeem
+============================================
+"""
+
+import threading
+import time
+
+from simulation.pipeline import SaleWritePipeline
+
+
+class _Writer:
+    """Records the batches it is given; blocks while `gate` is cleared"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.gate = threading.Event()
+        self.gate.set()
+        self.entered = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        self.entered.set()
+        self.gate.wait()
+        if self.fail:
+            raise RuntimeError("write failed")
+        with self._lock:
+            self.batches.append(list(batch))
+        return len(batch)
+
+    @property
+    def written(self):
+        return [sale for batch in self.batches for sale in batch]
+
+
+def test_flushes_are_bounded_by_size_and_keep_order():
+    writer = _Writer()
+    pipeline = SaleWritePipeline(writer, flush_size=4, flush_interval=0.05)
+    for sale in range(10):
+        assert pipeline.submit(sale)
+    pipeline.stop()
+
+    assert writer.written == list(range(10))
+    assert all(len(batch) <= 4 for batch in writer.batches)
+    metrics = pipeline.metrics()
+    assert metrics['submitted'] == metrics['written'] == 10
+    assert metrics['queue_depth'] == 0
+
+
+def test_stop_sentinel_ends_a_partial_batch():
+    # The flush interval is far longer than the test: only the sentinel can
+    # close the batch, and it goes in behind the queued sales
+    writer = _Writer()
+    pipeline = SaleWritePipeline(writer, flush_size=100, flush_interval=30)
+    for sale in range(3):
+        pipeline.submit(sale)
+
+    start = time.monotonic()
+    pipeline.stop(timeout=10)
+
+    assert time.monotonic() - start < 10
+    assert writer.batches == [[0, 1, 2]]
+
+
+def test_every_writer_drains_before_stopping():
+    writer = _Writer()
+    pipeline = SaleWritePipeline(writer, flush_size=5, flush_interval=0.05, writers=3)
+    for sale in range(50):
+        pipeline.submit(sale)
+    pipeline.stop()
+
+    assert sorted(writer.written) == list(range(50))
+    assert not pipeline._threads
+
+
+def test_stop_accepting_rejects_new_sales_but_drains_queued_ones():
+    writer = _Writer()
+    writer.gate.clear()
+    pipeline = SaleWritePipeline(writer, flush_size=1, flush_interval=0.05)
+    for sale in range(3):
+        assert pipeline.submit(sale)
+    writer.entered.wait(5)
+
+    pipeline.stop_accepting()
+    assert not pipeline.is_running
+    assert not pipeline.submit(3)
+
+    writer.gate.set()
+    pipeline.stop()
+    assert writer.written == [0, 1, 2]
+    assert pipeline.metrics()['rejected'] == 1
+
+
+def test_full_queue_rejects_after_put_timeout():
+    writer = _Writer()
+    writer.gate.clear()
+    pipeline = SaleWritePipeline(writer, max_queue_size=1, flush_size=1, flush_interval=0.05,
+                                 put_timeout=0.05)
+    pipeline.submit(0)
+    writer.entered.wait(5)  # the writer holds sale 0
+    assert pipeline.submit(1)  # fills the queue
+    assert not pipeline.submit(2)
+
+    writer.gate.set()
+    pipeline.stop()
+    metrics = pipeline.metrics()
+    assert writer.written == [0, 1]
+    assert metrics['rejected'] == 1
+    assert metrics['max_queue_depth'] == 1
+
+
+def test_stop_without_draining_drops_queued_sales():
+    writer = _Writer()
+    writer.gate.clear()
+    pipeline = SaleWritePipeline(writer, flush_size=1, flush_interval=0.05)
+    for sale in range(4):
+        pipeline.submit(sale)
+    writer.entered.wait(5)
+
+    stopper = threading.Thread(target=pipeline.stop, kwargs={'drain': False})
+    stopper.start()
+    while pipeline.metrics()['failed'] < 3:  # the queued sales are dropped first
+        time.sleep(0.01)
+    writer.gate.set()
+    stopper.join(5)
+
+    assert writer.written == [0]
+    assert pipeline.metrics()['failed'] == 3
+
+
+def test_failed_flush_counts_the_batch():
+    writer = _Writer(fail=True)
+    pipeline = SaleWritePipeline(writer, flush_size=10, flush_interval=0.05)
+    for sale in range(3):
+        pipeline.submit(sale)
+    pipeline.stop()
+
+    metrics = pipeline.metrics()
+    assert metrics['written'] == 0
+    assert metrics['failed'] == 3
@@ -0,0 +1,128 @@
+"""
+============================================
+Hourly Range Index Tests
+Made by Hammad Naeem
+============================================
+
+The index is filled directly with _append, so no database is needed.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from analytics.range_index import HOUR, METRICS, HourlyRangeIndex
+
+ORIGIN = datetime(2024, 1, 1)  # a Monday
+WEBSITES = (3, 7, 11)
+
+
+def _empty_index():
+    index = HourlyRangeIndex(history_days=60)
+    for website_id in WEBSITES:
+        index._add_website(website_id)
+    index.origin = ORIGIN
+    index._prefix = np.zeros((len(WEBSITES), len(METRICS), 1))
+    index._weekly = np.zeros((len(WEBSITES), len(METRICS), 0))
+    return index
+
+
+@pytest.fixture(scope='module')
+def hours():
+    """Hourly values per website (websites, metrics, hours) over 60 days"""
+    generator = np.random.default_rng(11)
+    values = np.zeros((len(WEBSITES), len(METRICS), 60 * 24))
+    values[:, 0] = generator.integers(0, 20, size=values[:, 0].shape)
+    values[:, 1] = np.round(values[:, 0] * generator.uniform(5, 80, size=values[:, 0].shape), 2)
+    values[:, 2] = values[:, 0] * generator.integers(1, 4, size=values[:, 0].shape)
+    return values
+
+
+@pytest.fixture(scope='module')
+def index(hours):
+    index = _empty_index()
+    # Uneven chunks exercise growth and the week-at-a-time weekly sums
+    for start, end in ((0, 5), (5, 400), (400, 401), (401, hours.shape[2])):
+        index._append(hours[..., start:end])
+    return index
+
+
+def _brute(hours, start, end, website_id):
+    """Per-hour values for [start, end) inside the index, as (metrics, hours) with their timestamps"""
+    a = max(0, int((start - ORIGIN) // HOUR))
+    b = min(hours.shape[2], int((end - ORIGIN) // HOUR))
+    b = max(a, b)
+    values = hours[..., a:b]
+    values = values.sum(axis=0) if website_id is None else values[WEBSITES.index(website_id)]
+    return values, [ORIGIN + i * HOUR for i in range(a, b)]
+
+
+def _ranges():
+    generator = np.random.default_rng(5)
+    for _ in range(60):
+        start = ORIGIN + timedelta(hours=int(generator.integers(-48, 60 * 24)), minutes=int(generator.integers(0, 60)))
+        end = start + timedelta(hours=int(generator.integers(0, 30 * 24)))
+        website_id = generator.choice([None, *WEBSITES])
+        yield start, end, None if website_id is None else int(website_id)
+
+
+def test_total_matches_brute_force(index, hours):
+    for start, end, website_id in _ranges():
+        values, _ = _brute(hours, start, end, website_id)
+        total = index.total(start, end, website_id)
+        assert total['total_sales'] == values[0].sum()
+        assert total['total_revenue'] == pytest.approx(values[1].sum(), abs=0.01)
+        assert total['total_items_sold'] == values[2].sum()
+
+
+def test_histograms_match_brute_force(index, hours):
+    for start, end, website_id in _ranges():
+        values, stamps = _brute(hours, start, end, website_id)
+        expected = np.zeros((len(METRICS), 7, 24))
+        for column, stamp in enumerate(stamps):
+            expected[:, stamp.weekday(), stamp.hour] += values[:, column]
+
+        histogram = index.hour_of_week(start, end, website_id)
+        assert np.array_equal(histogram['total_sales'], expected[0])
+        assert np.allclose(histogram['total_revenue'], expected[1], atol=0.01)
+        assert np.array_equal(index.hour_of_day(start, end, website_id)['total_sales'], expected[0].sum(axis=0))
+        assert np.array_equal(index.weekday(start, end, website_id)['total_items_sold'], expected[2].sum(axis=1))
+
+
+def test_totals_by_day(index, hours):
+    days = [ORIGIN + timedelta(days=d) for d in range(10, 20)]
+    sales = index.totals(days, website_id=7)['total_sales']
+    expected = [hours[1, 0, d * 24:(d + 1) * 24].sum() for d in range(10, 19)]
+    assert list(sales) == expected
+
+
+def test_unknown_website_and_outside_ranges(index):
+    assert index.total(ORIGIN, ORIGIN + timedelta(days=3), website_id=99)['total_sales'] == 0
+    assert index.total(ORIGIN - timedelta(days=9), ORIGIN)['total_sales'] == 0
+    assert index.total(index.end, index.end + timedelta(days=9))['total_sales'] == 0
+
+
+def test_incremental_build_equals_one_shot(index, hours):
+    one_shot = _empty_index()
+    one_shot._append(hours)
+    size = index.size
+    assert one_shot.size == size
+    assert np.allclose(one_shot._prefix[..., :size + 1], index._prefix[..., :size + 1])
+    assert np.allclose(one_shot._weekly[..., :size], index._weekly[..., :size])
+
+
+def test_unloaded_index_reports_zeros():
+    index = HourlyRangeIndex()
+    assert index.total(ORIGIN, ORIGIN + HOUR)['total_sales'] == 0
+    assert index.hour_of_week(ORIGIN, ORIGIN + HOUR)['total_sales'].shape == (7, 24)
+
+
+def test_history_capped_at_hourly_retention(monkeypatch):
+    from analytics import range_index
+    monkeypatch.setattr(range_index.settings, 'RANGE_INDEX_HISTORY_DAYS', 365)
+    monkeypatch.setattr(range_index.settings, 'RETENTION_HOURLY_STATS_DAYS', 90)
+    monkeypatch.setattr(range_index.settings, 'ENABLE_RETENTION', True)
+    assert range_index._history_days() == 90
+    monkeypatch.setattr(range_index.settings, 'ENABLE_RETENTION', False)
+    assert range_index._history_days() == 365
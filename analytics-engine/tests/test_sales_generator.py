@@ -0,0 +1,37 @@
+"""
+============================================
+Sales Generator Tests
+Made by Hammad Naeem
+============================================
+"""
+
+from decimal import Decimal
+
+from simulation.sales_generator import SalesGenerator
+
+
+def _sale(customer_id, total_amount):
+    return {'customer_id': customer_id, 'total_amount': total_amount}
+
+
+def test_customer_deltas_fold_a_batch_per_customer():
+    deltas = SalesGenerator._customer_deltas([
+        _sale(7, 10.5), _sale(3, 1.25), _sale(7, 4.5), _sale(None, 99.0), _sale(3, 2.0)
+    ])
+
+    # One row per customer, in id order, skipping walk-in sales
+    assert deltas == [(3, 2, Decimal('3.25')), (7, 2, Decimal('15.00'))]
+
+
+def test_customer_deltas_round_each_sale_like_the_column():
+    # Each total is rounded half up to cents before summing, as the
+    # DECIMAL(15, 2) total_amount the row trigger reads back would be
+    deltas = SalesGenerator._customer_deltas([_sale(1, 0.125), _sale(1, 0.125), _sale(1, 2.675)])
+
+    assert deltas == [(1, 3, Decimal('2.94'))]
+    assert all(isinstance(spent, Decimal) for _, _, spent in deltas)
+
+
+def test_customer_deltas_of_an_empty_batch():
+    assert SalesGenerator._customer_deltas([]) == []
+    assert SalesGenerator._customer_deltas([_sale(None, 5.0)]) == []
@@ -0,0 +1,123 @@
+"""
+============================================
+Sketch Tests
+Made by Hammad Naeem
+============================================
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from analytics.sketches import HyperLogLog, QuantileSketch, SpaceSaving
+
+
+@pytest.mark.parametrize('distinct', [10, 1000, 50000])
+def test_hyperloglog_count_within_error(distinct):
+    sketch = HyperLogLog().add_many(list(range(distinct)) * 2)
+    # ~0.8% standard error at p=14; allow four standard errors
+    assert abs(sketch.count() - distinct) <= max(1, 0.033 * distinct)
+
+
+def test_hyperloglog_merge_equals_union():
+    left = HyperLogLog().add_many(range(0, 6000))
+    right = HyperLogLog().add_many(range(4000, 10000))
+    union = HyperLogLog().add_many(range(0, 10000))
+    assert np.array_equal(left.merge(right).registers, union.registers)
+
+
+@pytest.mark.parametrize('distinct', [50, 20000])
+def test_hyperloglog_round_trip(distinct):
+    # Few ids serialize sparse, many dense
+    sketch = HyperLogLog().add_many(range(distinct))
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+    assert restored.precision == sketch.precision
+    assert np.array_equal(restored.registers, sketch.registers)
+
+
+def test_hyperloglog_rejects_other_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=12).merge(HyperLogLog(precision=14))
+
+
+def test_quantile_sketch_relative_error():
+    values = np.random.default_rng(7).lognormal(mean=4, sigma=1, size=20000)
+    sketch = QuantileSketch(relative_accuracy=0.01).add_many(values)
+    ordered = np.sort(values)
+    for q in (0.01, 0.25, 0.5, 0.9, 0.99):
+        true = ordered[int(q * (len(ordered) - 1))]
+        assert abs(sketch.quantile(q) - true) <= 0.01 * true + 1e-9
+
+
+def test_quantile_sketch_merge_and_round_trip():
+    values = np.random.default_rng(3).uniform(1, 500, size=5000)
+    whole = QuantileSketch().add_many(values)
+    merged = QuantileSketch().add_many(values[:2000]).merge(QuantileSketch().add_many(values[2000:]))
+    assert merged.buckets == whole.buckets
+
+    whole.add_many([0, -5])
+    restored = QuantileSketch.from_bytes(whole.to_bytes())
+    assert restored.buckets == whole.buckets
+    assert restored.zero_count == 2
+    assert restored.quantile(0.5) == whole.quantile(0.5)
+
+
+def test_quantile_sketch_empty():
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def _zipf_stream(seed, size):
+    generator = random.Random(seed)
+    weights = [1 / rank for rank in range(1, 501)]
+    return generator.choices(range(500), weights=weights, k=size)
+
+
+def _check_bounds(summary, truth):
+    for item, count, error in summary.top(summary.capacity):
+        assert count - error <= truth.get(item, 0) <= count
+        assert error <= summary.error_bound()
+
+
+def test_space_saving_bounds():
+    stream = _zipf_stream(1, 20000)
+    summary = SpaceSaving(capacity=50)
+    truth = {}
+    for item in stream:
+        summary.add(item)
+        truth[item] = truth.get(item, 0) + 1
+
+    _check_bounds(summary, truth)
+    # Anything heavier than total / capacity is always tracked
+    heavy = {item for item, weight in truth.items() if weight > summary.error_bound()}
+    assert heavy <= set(summary.counts)
+
+
+def test_space_saving_merge_bounds():
+    # Merging is approximate: counts stay upper bounds and count - error lower bounds
+    left, right = SpaceSaving(capacity=50), SpaceSaving(capacity=50)
+    truth = {}
+    for item in _zipf_stream(2, 10000):
+        left.add(item)
+        truth[item] = truth.get(item, 0) + 1
+    for item in _zipf_stream(5, 10000):
+        right.add(item, weight=2)
+        truth[item] = truth.get(item, 0) + 2
+
+    merged = left.merge(right)
+    assert merged.total == sum(truth.values())
+    assert len(merged.counts) <= merged.capacity
+    _check_bounds(merged, truth)
+    top = max(truth, key=truth.get)
+    assert merged.top(1)[0][0] == top
+
+
+def test_space_saving_round_trip():
+    summary = SpaceSaving(capacity=10)
+    for item in _zipf_stream(4, 1000):
+        summary.add(item, weight=3)
+    restored = SpaceSaving.from_bytes(summary.to_bytes())
+    assert restored.capacity == summary.capacity
+    assert restored.total == summary.total
+    assert restored.counts == summary.counts
+    assert restored.errors == summary.errors
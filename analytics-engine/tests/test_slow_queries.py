@@ -0,0 +1,73 @@
+"""
+============================================
+Query Fingerprint Tests
+Made by Hammad Naeem
+============================================
+"""
+
+import pytest
+
+from database.slow_queries import FINGERPRINT_PREFIX, _normalize_prefix, analyzable, explainable, fingerprint
+
+
+@pytest.mark.parametrize('first, second', [
+    # Literals, comments and whitespace
+    ("SELECT * FROM sales WHERE id = 5 AND name = 'x''y' -- latest\n LIMIT 10",
+     "SELECT *   FROM sales\nWHERE id = %s AND name = %(name)s /* api */ LIMIT %s"),
+    # Rendered execute_values batches of any length
+    ("INSERT INTO sale_items (a, b) VALUES (1, 'a'), (2, 'b'), (3, 'c')",
+     "INSERT INTO sale_items (a, b) VALUES (%s, %s::NUMERIC)"),
+    # Negative and decimal numbers, and statements passed as bytes
+    ("SELECT id FROM products WHERE stock_quantity > -3.5",
+     b"SELECT id FROM products WHERE stock_quantity > 12"),
+])
+def test_equivalent_statements_share_a_fingerprint(first, second):
+    assert fingerprint(first) == fingerprint(second)
+
+
+def test_normalized_text():
+    key, text = fingerprint("SELECT name, t2.total FROM t2 WHERE id = ANY(%s) AND note = 'a 1'")
+    assert text == "SELECT name, t2.total FROM t2 WHERE id = ANY(...) AND note = ?"
+    assert len(key) == 12
+
+
+def test_identifiers_with_digits_are_kept():
+    assert fingerprint("SELECT col1 FROM t2")[1] == "SELECT col1 FROM t2"
+    assert fingerprint("SELECT col1 FROM t2") != fingerprint("SELECT col2 FROM t2")
+
+
+def test_different_statements_differ():
+    assert fingerprint("SELECT * FROM sales WHERE id = 1") != fingerprint("SELECT * FROM shops WHERE id = 1")
+
+
+def test_only_the_prefix_is_fingerprinted():
+    head = "SELECT 1 " + " " * FINGERPRINT_PREFIX
+    assert fingerprint(head + "FROM a") == fingerprint(head + "FROM b")
+
+
+def test_long_statements_are_cached_by_prefix():
+    _normalize_prefix.cache_clear()
+    head = "SELECT 1 " + " " * FINGERPRINT_PREFIX
+    for tail in ("FROM a", "FROM b", "FROM c"):
+        fingerprint(head + tail)
+    info = _normalize_prefix.cache_info()
+    assert (info.hits, info.misses) == (2, 1)
+
+
+@pytest.mark.parametrize('statement, expected', [
+    ("SELECT * FROM sales WHERE id = 1", True),
+    ("WITH t AS (SELECT 1) SELECT * FROM t", True),
+    ("SELECT id FROM products WHERE id = ANY('{1}') ORDER BY id FOR NO KEY UPDATE", False),
+    ("SELECT id FROM customers FOR UPDATE SKIP LOCKED", False),
+    ("SELECT id FROM customers FOR KEY SHARE", False),
+    ("WITH d AS (DELETE FROM audit_logs RETURNING id) SELECT COUNT(*) FROM d", False),
+    ("UPDATE products SET stock_quantity = 0", False),
+])
+def test_only_plain_reads_are_analyzed(statement, expected):
+    assert analyzable(statement) == expected
+
+
+@pytest.mark.parametrize('statement', ["BEGIN", "COMMIT", "ROLLBACK", "SET LOCAL sales_analytics.audit_mode = ?"])
+def test_transaction_control_is_not_explained(statement):
+    assert not explainable(statement)
+    assert explainable("INSERT INTO sales (id) VALUES (?)")
@@ -0,0 +1,91 @@
+"""
+============================================
+Workload Trace Tests
+Made by Hammad Naeem
+============================================
+"""
+
+import pytest
+
+from simulation.workload import WorkloadRecorder, read_trace
+
+
+def _sale(website_id, customer_id, items):
+    subtotal = sum(quantity * price for _, quantity, price in items)
+    return {
+        'website_id': website_id,
+        'shop_id': None if customer_id is None else website_id * 10,
+        'customer_id': customer_id,
+        'payment_method': 'card',
+        'subtotal': subtotal,
+        'tax_amount': subtotal * 0.17,
+        'total_amount': subtotal * 1.17,
+        'items': [
+            {'product_id': product_id, 'quantity': quantity, 'unit_price': price, 'line_total': quantity * price}
+            for product_id, quantity, price in items
+        ]
+    }
+
+
+SALES = [
+    _sale(1, 42, [(7, 2, 9.99), (8, 1, 120.5)]),
+    _sale(2, None, [(9, 3, 0.5)]),
+    _sale(1, 43, [(7, 1, 9.99)]),
+]
+
+
+def _record(path):
+    now = [0.0]
+    recorder = WorkloadRecorder(path, seed=123, clock=lambda: now[0])
+    recorder.record_job('generate_sales')
+    recorder.begin_batch()
+    recorder.record_sale(SALES[0])
+    now[0] = 0.5
+    recorder.record_sale(SALES[1])
+    recorder.record_job('aggregate_stats', at=300.0)
+    recorder.begin_batch()
+    recorder.record_sale(SALES[2], at=301.0)
+    recorder.close()
+    return recorder
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'workload.trace'
+    recorder = _record(path)
+    assert (recorder.sales, recorder.jobs) == (3, 2)
+
+    header, events = read_trace(path)
+    assert header['seed'] == 123
+    assert events == [
+        ('job', 0.0, 'generate_sales'),
+        ('batch', 0.0, SALES[:2]),
+        ('job', 300.0, 'aggregate_stats'),
+        ('batch', 301.0, SALES[2:]),
+    ]
+
+
+def test_unseeded_trace(tmp_path):
+    path = tmp_path / 'workload.trace'
+    WorkloadRecorder(path).close()
+    header, events = read_trace(path)
+    assert header['seed'] is None
+    assert events == []
+
+
+def test_truncated_tail_is_dropped(tmp_path):
+    path = tmp_path / 'workload.trace'
+    _record(path)
+    data = path.read_bytes()
+    _, events = read_trace(path)
+
+    # Cut inside the last sale's item: everything before it survives
+    path.write_bytes(data[:-5])
+    _, truncated = read_trace(path)
+    assert truncated == events[:-1]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'not-a-trace'
+    path.write_bytes(b'GARBAGE!' + bytes(32))
+    with pytest.raises(ValueError):
+        read_trace(path)
@@ -32,6 +32,11 @@ const config = {
         saltRounds: 12
     },
 
+    // Dashboard snapshots written by the analytics engine
+    dashboardSnapshot: {
+        maxStalenessSeconds: parseInt(process.env.DASHBOARD_SNAPSHOT_MAX_STALENESS_SECONDS) || 120
+    },
+
     // Pagination defaults
     pagination: {
         defaultLimit: 20,
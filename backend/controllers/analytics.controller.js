@@ -6,14 +6,54 @@
  */
 
 const db = require('../config/database');
+const config = require('../config/config');
 const logger = require('../utils/logger');
 const { getDateRange } = require('../utils/helpers');
 
+/**
+ * Get a precomputed snapshot written by the analytics engine,
+ * or null when it is missing or older than the staleness bound
+ */
+async function getFreshSnapshot(snapshotKey) {
+    try {
+        const result = await db.query(`
+            SELECT version, payload, computed_at
+            FROM dashboard_snapshots
+            WHERE snapshot_key = $1
+            AND computed_at >= CURRENT_TIMESTAMP - make_interval(secs => $2)
+        `, [snapshotKey, config.dashboardSnapshot.maxStalenessSeconds]);
+
+        return result.rows[0] || null;
+    } catch (error) {
+        logger.warn(`Dashboard snapshot '${snapshotKey}' unavailable:`, error.message);
+        return null;
+    }
+}
+
+/**
+ * Send a snapshot in the same shape as the live response
+ */
+function sendSnapshot(res, snapshot) {
+    res.json({
+        success: true,
+        data: snapshot.payload,
+        snapshot: {
+            version: parseInt(snapshot.version),
+            computedAt: snapshot.computed_at
+        }
+    });
+}
+
 /**
  * Get dashboard overview statistics
  */
 async function getDashboardStats(req, res, next) {
     try {
+        const snapshot = await getFreshSnapshot('dashboard');
+        if (snapshot) {
+            return sendSnapshot(res, snapshot);
+        }
+
         // Today's stats
         const todayStats = await db.query(`
             SELECT 
@@ -425,11 +465,71 @@ async function getPeakHours(req, res, next) {
     }
 }
 
+/**
+ * Get the sales forecasts precomputed by the analytics engine
+ * (horizon 'next_day' by hour or 'next_week' by day)
+ */
+async function getSalesForecast(req, res, next) {
+    try {
+        const { websiteId, horizon = 'next_day' } = req.query;
+
+        if (!['next_day', 'next_week'].includes(horizon)) {
+            return res.status(400).json({
+                success: false,
+                message: "horizon must be 'next_day' or 'next_week'"
+            });
+        }
+
+        if (websiteId) {
+            const result = await db.query(`
+                SELECT forecast, fitted_at, computed_at
+                FROM sales_forecasts
+                WHERE website_id = $1 AND horizon = $2
+            `, [websiteId, horizon]);
+
+            if (result.rows.length === 0) {
+                return res.status(404).json({
+                    success: false,
+                    message: 'Forecast not available yet'
+                });
+            }
+
+            const row = result.rows[0];
+            return res.json({
+                success: true,
+                data: row.forecast,
+                fittedAt: row.fitted_at,
+                computedAt: row.computed_at
+            });
+        }
+
+        const result = await db.query(`
+            SELECT forecast, computed_at
+            FROM sales_forecasts
+            WHERE horizon = $1
+            ORDER BY website_id
+        `, [horizon]);
+
+        res.json({
+            success: true,
+            data: result.rows.map(row => ({ ...row.forecast, computedAt: row.computed_at }))
+        });
+
+    } catch (error) {
+        next(error);
+    }
+}
+
 /**
  * Get sales trends
  */
 async function getSalesTrends(req, res, next) {
     try {
+        const snapshot = await getFreshSnapshot('trends');
+        if (snapshot) {
+            return sendSnapshot(res, snapshot);
+        }
+
         // Current week vs last week
         const currentWeek = await db.query(`
             SELECT 
@@ -575,5 +675,6 @@ module.exports = {
     getCategoryBreakdown,
     getPeakHours,
     getSalesTrends,
+    getSalesForecast,
     getRealTimeCounter
 };
\ No newline at end of file
@@ -299,6 +299,76 @@ async function createTables(db) {
         UNIQUE(website_id, stat_date)
     );
 
+    -- ============================================
+    -- SALES HOURLY SKETCHES TABLE
+    -- Mergeable sketches per hourly bucket, maintained by the analytics engine:
+    -- HyperLogLog of customer ids and a quantile sketch of order values
+    -- ============================================
+    CREATE TABLE IF NOT EXISTS sales_hourly_sketches (
+        id SERIAL PRIMARY KEY,
+        website_id INTEGER REFERENCES websites(id) ON DELETE CASCADE,
+        shop_id INTEGER REFERENCES shops(id) ON DELETE CASCADE,
+        stat_date DATE NOT NULL,
+        stat_hour INTEGER NOT NULL CHECK (stat_hour >= 0 AND stat_hour < 24),
+        customers_hll BYTEA NOT NULL,
+        order_values_sketch BYTEA NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(website_id, shop_id, stat_date, stat_hour)
+    );
+
+    -- ============================================
+    -- DASHBOARD SNAPSHOTS TABLE
+    -- Precomputed dashboard payloads maintained by the analytics engine
+    -- ============================================
+    CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+        snapshot_key VARCHAR(50) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 1,
+        payload JSONB NOT NULL,
+        computed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- ============================================
+    -- CUSTOMER ARCHIVED TOTALS TABLE
+    -- Orders and spend of sales moved out of the sales table by the
+    -- analytics engine's retention job, kept so customer stats can still be
+    -- rebuilt from sales plus what was archived
+    -- ============================================
+    CREATE TABLE IF NOT EXISTS customer_archived_totals (
+        customer_id INTEGER PRIMARY KEY REFERENCES customers(id) ON DELETE CASCADE,
+        total_orders INTEGER NOT NULL DEFAULT 0,
+        total_spent DECIMAL(15, 2) NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- ============================================
+    -- TOP PRODUCTS CHECKPOINTS TABLE
+    -- Serialized top-K product summaries per website and time bucket,
+    -- saved by the analytics engine so restarts keep the rolling windows
+    -- ============================================
+    CREATE TABLE IF NOT EXISTS top_products_checkpoints (
+        website_id INTEGER REFERENCES websites(id) ON DELETE CASCADE,
+        granularity VARCHAR(10) NOT NULL CHECK (granularity IN ('5min', 'day')),
+        bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+        summary BYTEA NOT NULL,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (website_id, granularity, bucket_start)
+    );
+
+    -- ============================================
+    -- SALES FORECASTS TABLE
+    -- Projections with 95% bands per website, refreshed hourly by the
+    -- analytics engine: 'next_day' by hour, 'next_week' by day
+    -- ============================================
+    CREATE TABLE IF NOT EXISTS sales_forecasts (
+        website_id INTEGER REFERENCES websites(id) ON DELETE CASCADE,
+        horizon VARCHAR(10) NOT NULL CHECK (horizon IN ('next_day', 'next_week')),
+        forecast JSONB NOT NULL,
+        fitted_at TIMESTAMP WITH TIME ZONE NOT NULL,
+        computed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (website_id, horizon)
+    );
+
     -- ============================================
     -- SYSTEM SETTINGS TABLE
     -- ============================================
@@ -320,6 +390,7 @@ async function createTables(db) {
     CREATE INDEX IF NOT EXISTS idx_sales_sale_date ON sales(sale_date);
     CREATE INDEX IF NOT EXISTS idx_sales_date_website ON sales(sale_date, website_id);
     CREATE INDEX IF NOT EXISTS idx_sales_created_at ON sales(created_at);
+    CREATE INDEX IF NOT EXISTS idx_sales_customer_id ON sales(customer_id);
 
     -- Sale items indexes
     CREATE INDEX IF NOT EXISTS idx_sale_items_sale_id ON sale_items(sale_id);
@@ -341,6 +412,7 @@ async function createTables(db) {
     -- Stats indexes
     CREATE INDEX IF NOT EXISTS idx_hourly_stats_date ON sales_hourly_stats(stat_date);
     CREATE INDEX IF NOT EXISTS idx_daily_stats_date ON sales_daily_stats(stat_date);
+    CREATE INDEX IF NOT EXISTS idx_hourly_sketches_date ON sales_hourly_sketches(stat_date);
     `;
 
     await db.query(schemaSQL);
@@ -406,6 +478,15 @@ async function createTriggers(db) {
         old_data JSONB;
         new_data JSONB;
     BEGIN
+        -- Bulk engine writes ('statement') insert their own audit rows;
+        -- retention archiving ('off') is recorded in its archive files
+        IF current_setting('sales_analytics.audit_mode', true) IN ('statement', 'off') THEN
+            IF TG_OP = 'DELETE' THEN
+                RETURN OLD;
+            END IF;
+            RETURN NEW;
+        END IF;
+
         -- Get record ID
         IF TG_OP = 'DELETE' THEN
             record_id_value := OLD.id::VARCHAR;
@@ -448,12 +529,30 @@ async function createTriggers(db) {
         AFTER INSERT OR UPDATE OR DELETE ON products
         FOR EACH ROW EXECUTE FUNCTION audit_log_trigger_function();
 
+    -- Bulk engine writes (sales_analytics.audit_mode = 'statement') insert
+    -- their audit rows themselves, set-based, with the same content. The
+    -- statement-level triggers that did this captured transition tables on
+    -- every write, whatever the mode, so they are dropped.
+    DROP TRIGGER IF EXISTS audit_sales_insert_stmt ON sales;
+    DROP TRIGGER IF EXISTS audit_sales_update_stmt ON sales;
+    DROP TRIGGER IF EXISTS audit_sales_delete_stmt ON sales;
+    DROP TRIGGER IF EXISTS audit_products_insert_stmt ON products;
+    DROP TRIGGER IF EXISTS audit_products_update_stmt ON products;
+    DROP TRIGGER IF EXISTS audit_products_delete_stmt ON products;
+    DROP FUNCTION IF EXISTS audit_log_statement_function();
+
     -- ============================================
     -- STOCK UPDATE TRIGGER (On Sale Item Insert)
     -- ============================================
     CREATE OR REPLACE FUNCTION update_stock_on_sale()
     RETURNS TRIGGER AS $$
     BEGIN
+        -- Bulk engine writes ('statement' audit mode) apply this decrement
+        -- per item themselves, with the audit rows it would have written
+        IF current_setting('sales_analytics.audit_mode', true) = 'statement' THEN
+            RETURN NEW;
+        END IF;
+
         -- Decrease stock when sale item is created
         UPDATE products
         SET stock_quantity = stock_quantity - NEW.quantity
@@ -474,6 +573,11 @@ async function createTriggers(db) {
     CREATE OR REPLACE FUNCTION update_customer_stats()
     RETURNS TRIGGER AS $$
     BEGIN
+        -- Bulk engine writes apply per-customer deltas once per batch instead
+        IF current_setting('sales_analytics.customer_stats_mode', true) = 'batch' THEN
+            RETURN NEW;
+        END IF;
+
         IF NEW.customer_id IS NOT NULL THEN
             UPDATE customers
             SET 
@@ -767,10 +871,14 @@ async function createStoredProcedures(db) {
             EXTRACT(HOUR FROM s.sale_date)::INTEGER as stat_hour,
             COUNT(*)::INTEGER as total_sales,
             SUM(s.total_amount) as total_revenue,
-            COALESCE(SUM(si.quantity), 0)::INTEGER as total_items_sold,
+            COALESCE(SUM(si.items), 0)::INTEGER as total_items_sold,
             AVG(s.total_amount) as average_order_value
         FROM sales s
-        LEFT JOIN sale_items si ON s.id = si.sale_id
+        LEFT JOIN LATERAL (
+            SELECT SUM(quantity) as items
+            FROM sale_items
+            WHERE sale_id = s.id
+        ) si ON true
         WHERE s.sale_date::DATE = CURRENT_DATE
         GROUP BY s.website_id, s.shop_id, s.sale_date::DATE, EXTRACT(HOUR FROM s.sale_date)
         ON CONFLICT (website_id, shop_id, stat_date, stat_hour)
@@ -33,6 +33,9 @@ router.get('/products/category-breakdown', analyticsController.getCategoryBreakd
 router.get('/peak-hours', analyticsController.getPeakHours);
 router.get('/trends', analyticsController.getSalesTrends);
 
+// Forecasts (precomputed by the analytics engine)
+router.get('/forecast', analyticsController.getSalesForecast);
+
 // Real-time
 router.get('/realtime/counter', analyticsController.getRealTimeCounter);
 